@@ -17,6 +17,10 @@ app.conf.beat_schedule = {
         'task': 'tagger.tasks.generate_daily_report',
         'schedule': crontab(hour='*/24')
     },
+    'release-expired-sentence-leases': {
+        'task': 'tagger.tasks.release_expired_leases',
+        'schedule': crontab(minute='*/5')
+    },
 }
 
 # Load task modules from all registered Django apps.
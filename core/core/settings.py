@@ -45,10 +45,12 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'tagger.middleware.QueryInstrumentationMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'tagger.middleware.PrimaryPinMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -84,9 +86,60 @@ DATABASES = {
         "PASSWORD": os.environ.get("SQL_PASSWORD", "password"),
         "HOST": os.environ.get("SQL_HOST", "localhost"),
         "PORT": os.environ.get("SQL_PORT", "5432"),
+        # connections are kept for SQL_CONN_MAX_AGE seconds and checked before being reused
+        "CONN_MAX_AGE": int(os.environ.get("SQL_CONN_MAX_AGE", 60)),
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {},
     }
 }
 
+# SQL_POOL=1 (postgres) pools connections per process instead, needed under the ASGI server where sync code
+# runs on per request threads that can't keep a persistent connection. idle connections are checked on checkout
+if os.environ.get("SQL_POOL", "0") == "1":
+    from psycopg_pool import ConnectionPool
+
+    DATABASES["default"]["CONN_MAX_AGE"] = 0
+    DATABASES["default"]["OPTIONS"]["pool"] = {
+        "min_size": int(os.environ.get("SQL_POOL_MIN_SIZE", 2)),
+        "max_size": int(os.environ.get("SQL_POOL_MAX_SIZE", 20)),
+        "timeout": int(os.environ.get("SQL_POOL_TIMEOUT", 10)),
+        "check": ConnectionPool.check_connection,
+    }
+
+# read replica for the listing, search, stats and export views, enabled by SQL_REPLICA_HOST (postgres) or
+# SQL_REPLICA_DATABASE (database name or sqlite file). it shares the primary's credentials and pool settings,
+# tests run it as a mirror of the test database
+if os.environ.get("SQL_REPLICA_HOST") or os.environ.get("SQL_REPLICA_DATABASE"):
+    DATABASES["replica"] = {
+        **DATABASES["default"],
+        "NAME": os.environ.get("SQL_REPLICA_DATABASE", DATABASES["default"]["NAME"]),
+        "HOST": os.environ.get("SQL_REPLICA_HOST", DATABASES["default"]["HOST"]),
+        "PORT": os.environ.get("SQL_REPLICA_PORT", DATABASES["default"]["PORT"]),
+        "OPTIONS": dict(DATABASES["default"]["OPTIONS"]),
+        "TEST": {"MIRROR": "default"},
+    }
+
+DATABASE_ROUTERS = ['tagger.routers.PrimaryReplicaRouter']
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# local memory is per process, set REDIS_CACHE_URL when running more than one web process
+# so invalidations reach every worker.
+
+if os.environ.get('REDIS_CACHE_URL'):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ.get('REDIS_CACHE_URL'),
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -121,6 +174,11 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Uploaded files, csv imports are stored here until a worker processes them
+
+MEDIA_URL = 'media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -128,6 +186,8 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
+        # api keys first, basic auth runs a password hash on every request
+        'tagger.authentication.ApiKeyAuthentication',
         'rest_framework.authentication.BasicAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
@@ -135,6 +195,53 @@ REST_FRAMEWORK = {
 }
 
 CELERY_BROKER_URL = "redis://redis:6379/1"
+# run tasks inline, handy for local development without a worker
+CELERY_TASK_ALWAYS_EAGER = bool(os.environ.get('CELERY_TASK_ALWAYS_EAGER', 0))
+
+# seconds an operator keeps claimed sentences before they return to the pool
+TAGGER_LEASE_TTL = int(os.environ.get('TAGGER_LEASE_TTL', 600))
+# seconds an operator's permitted datasets stay cached, changes to permissions invalidate it right away
+TAGGER_PERMISSION_CACHE_TIMEOUT = int(os.environ.get('TAGGER_PERMISSION_CACHE_TIMEOUT', 3600))
+# seconds tag and category listings stay cached, writes to the dataset invalidate them right away
+TAGGER_RESPONSE_CACHE_TIMEOUT = int(os.environ.get('TAGGER_RESPONSE_CACHE_TIMEOUT', 600))
+# list endpoints encode rows without ModelSerializer (and with orjson when installed), output is identical.
+# opt-in, a view can also turn it on or off for itself through FastSerializationMixin.fast_serialization
+TAGGER_FAST_SERIALIZATION = os.environ.get('TAGGER_FAST_SERIALIZATION', '0') == '1'
+# most (sentence, tag) pairs accepted by one bulk labeling request
+TAGGER_BULK_LABEL_MAX = int(os.environ.get('TAGGER_BULK_LABEL_MAX', 5000))
+# rows per INSERT statement for bulk writes
+TAGGER_BULK_BATCH_SIZE = int(os.environ.get('TAGGER_BULK_BATCH_SIZE', 1000))
+# per view latency and query metrics served at /api/metrics/, off removes the middleware entirely
+TAGGER_METRICS_ENABLED = os.environ.get('TAGGER_METRICS_ENABLED', '1') == '1'
+# requests running more queries than this are logged as warnings and counted
+TAGGER_QUERY_BUDGET = int(os.environ.get('TAGGER_QUERY_BUDGET', 30))
+# redis pub/sub for the event stream, needed when events come from more than one process (celery imports included)
+TAGGER_EVENTS_REDIS_URL = os.environ.get('TAGGER_EVENTS_REDIS_URL')
+# seconds between keep-alive comments on idle event streams, permissions are re-checked at the same pace
+TAGGER_EVENTS_HEARTBEAT = int(os.environ.get('TAGGER_EVENTS_HEARTBEAT', 15))
+# api keys resolved to their user per process, revocations and user changes invalidate them right away
+TAGGER_API_KEY_CACHE_SIZE = int(os.environ.get('TAGGER_API_KEY_CACHE_SIZE', 10000))
+TAGGER_API_KEY_CACHE_TTL = int(os.environ.get('TAGGER_API_KEY_CACHE_TTL', 300))
+# alias of the read replica, None without one
+TAGGER_REPLICA_DATABASE = 'replica' if 'replica' in DATABASES else None
+# how long reads of a user stay on the primary after they wrote something, cover the replication lag.
+# pins live in the cache, set REDIS_CACHE_URL with more than one web process
+TAGGER_REPLICA_PIN_SECONDS = int(os.environ.get('TAGGER_REPLICA_PIN_SECONDS', 5))
+# tag suggestions: hashed term dimensions, tags suggested per sentence and the number of new labels on a dataset
+# after which its centroids are updated and its unlabeled sentences rescored in the background.
+# run update_suggestions --rebuild after changing the number of features
+TAGGER_SUGGESTION_FEATURES = int(os.environ.get('TAGGER_SUGGESTION_FEATURES', 2 ** 16))
+TAGGER_SUGGESTION_TOP_K = int(os.environ.get('TAGGER_SUGGESTION_TOP_K', 3))
+TAGGER_SUGGESTION_RETRAIN_EVERY = int(os.environ.get('TAGGER_SUGGESTION_RETRAIN_EVERY', 200))
+# label history ids are allocated before commit, rows can become visible out of id order. training only moves past
+# rows older than this many seconds, longer transactions writing labels would have their labels skipped
+TAGGER_SUGGESTION_SETTLE_SECONDS = int(os.environ.get('TAGGER_SUGGESTION_SETTLE_SECONDS', 60))
+# near-duplicate clusters: minhash bands of the lsh index and values per band, and the jaccard similarity of
+# character shingles from which two sentences share a cluster. 16 bands of 4 find pairs at 0.7 99% of the time.
+# run cluster_sentences --rebuild after changing the bands or rows
+TAGGER_CLUSTER_BANDS = int(os.environ.get('TAGGER_CLUSTER_BANDS', 16))
+TAGGER_CLUSTER_ROWS = int(os.environ.get('TAGGER_CLUSTER_ROWS', 4))
+TAGGER_CLUSTER_THRESHOLD = float(os.environ.get('TAGGER_CLUSTER_THRESHOLD', 0.7))
 
 SPECTACULAR_SETTINGS = {
     'TITLE': 'tagging system',
@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Dataset, Tag, Operator, Sentence, HasPermission, LabeledSentence
+from .models import Dataset, Tag, Operator, Sentence, HasPermission, LabeledSentence, ImportJob, OperatorDailyStats, \
+    ApiKey, CurrentLabel, PurgeJob, TagSuggestion
 
 # Register your models here.
 admin.site.register(Dataset)
@@ -8,3 +9,9 @@ admin.site.register(HasPermission)
 admin.site.register(Operator)
 admin.site.register(Sentence)
 admin.site.register(LabeledSentence)
+admin.site.register(ImportJob)
+admin.site.register(OperatorDailyStats)
+admin.site.register(ApiKey)
+admin.site.register(CurrentLabel)
+admin.site.register(PurgeJob)
+admin.site.register(TagSuggestion)
@@ -0,0 +1,139 @@
+"""
+inter-annotator agreement of a dataset, computed with numpy from the label history.
+
+an operator's answer for a sentence is the set of tags they added and didn't remove again, every operator with a
+history row on a sentence is one of its raters. each (sentence, tag) is a yes/no decision, over sentences with at
+least two raters and the tags used in the dataset's history:
+- fleiss' kappa per tag and over all (sentence, tag) decisions, allowing a different number of raters per sentence
+- cohen's kappa per operator pair over the decisions on the sentences both rated
+- a confusion matrix per tag counting ordered rater pairs, [[no/no, no/yes], [yes/no, yes/yes]]
+"""
+import itertools
+
+import numpy as np
+from django.conf import settings
+from django.db.models import BooleanField, ExpressionWrapper, Q
+
+from .models import LabeledSentence, Tag
+
+
+def label_rows(dataset_id: int, chunk_size: int | None = None) -> np.ndarray:
+    """
+    (sentence, operator, tag, added) of every history row of the dataset in id order, streamed from one query
+    into an int64 array of shape (rows, 4).
+    """
+    rows = (LabeledSentence.objects.filter(sentence__dataset_id=dataset_id).order_by('pk')
+            .annotate(added=ExpressionWrapper(Q(action=LabeledSentence.Action.ADD), output_field=BooleanField()))
+            .values_list('sentence_id', 'operator_id', 'tag_id', 'added'))
+    values = itertools.chain.from_iterable(rows.iterator(chunk_size=chunk_size or settings.TAGGER_BULK_BATCH_SIZE))
+    return np.fromiter(values, dtype=np.int64).reshape(-1, 4)
+
+
+def _join(left: np.ndarray, right: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    index pairs (i, j) with left[i] == right[j], both arrays sorted.
+    """
+    start = np.searchsorted(right, left, 'left')
+    counts = np.searchsorted(right, left, 'right') - start
+    ends = np.cumsum(counts)
+    i = np.repeat(np.arange(len(left)), counts)
+    j = np.repeat(start, counts) + np.arange(ends[-1] if len(ends) else 0) - np.repeat(ends - counts, counts)
+    return i, j
+
+
+def _kappa(observed, expected):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (observed - expected) / (1 - expected)
+
+
+def _float(value) -> float | None:
+    # undefined when every rater always gives the same answer
+    return None if np.isnan(value) else round(float(value), 6)
+
+
+def compute_agreement(rows: np.ndarray) -> dict:
+    """
+    agreement metrics of label_rows(), operators and tags by id.
+    """
+    if not len(rows):
+        return {'sentences': 0, 'operators': 0, 'fleiss_kappa': None, 'tags': [], 'pairs': []}
+    sentence_ids, s = np.unique(rows[:, 0], return_inverse=True)
+    operator_ids, o = np.unique(rows[:, 1], return_inverse=True)
+    tag_ids, t = np.unique(rows[:, 2], return_inverse=True)
+    n_sentences, n_operators, n_tags = len(sentence_ids), len(operator_ids), len(tag_ids)
+
+    # the last row of every (sentence, operator, tag) is the operator's answer, the first one reading backwards
+    _, last = np.unique(((s * n_operators + o) * n_tags + t)[::-1], return_index=True)
+    last = len(rows) - 1 - last
+    yes = last[rows[last, 3] == 1]
+
+    # raters as sorted (sentence, operator) codes, and raters per sentence
+    rater = np.unique(s * n_operators + o)
+    rater_sentence, rater_operator = rater // n_operators, rater % n_operators
+    raters = np.bincount(rater_sentence, minlength=n_sentences)
+    rated = raters >= 2
+
+    # yes answers on sentences with two or more raters, sorted by (sentence, tag) cell
+    yes = yes[rated[s[yes]]]
+    cell = s[yes] * n_tags + t[yes]
+    order = np.argsort(cell, kind='stable')
+    cell, yes_operator = cell[order], o[yes][order]
+
+    # per tag, from the yes count n and rater count m of every cell with a yes, cells without one agree fully
+    cells, n = np.unique(cell, return_counts=True)
+    cell_tag, m = cells % n_tags, raters[cells // n_tags]
+    items = int(rated.sum())
+    ratings = raters[rated].sum()
+    pairs = (raters[rated] * (raters[rated] - 1)).sum()
+    yes_yes = np.bincount(cell_tag, n * (n - 1), n_tags)
+    yes_no = np.bincount(cell_tag, n * (m - n), n_tags)
+    no_no = pairs - yes_yes - 2 * yes_no
+    disagreement = np.bincount(cell_tag, 2 * n * (m - n) / (m * (m - 1)), n_tags)
+    yes_share = np.bincount(cell_tag, n, n_tags) / ratings if ratings else np.full(n_tags, np.nan)
+    tag_kappa = _kappa(1 - disagreement / items if items else np.nan, yes_share ** 2 + (1 - yes_share) ** 2)
+    share = yes_share.mean()
+    overall = _kappa(1 - disagreement.sum() / (items * n_tags) if items else np.nan, share ** 2 + (1 - share) ** 2)
+
+    # per operator pair: sentences both rated, yes answers of one on sentences the other rated, yes answers of both
+    def pair_counts(a, b):
+        mask = a != b
+        return np.bincount(a[mask] * n_operators + b[mask], minlength=n_operators ** 2).reshape(n_operators, -1)
+
+    i, j = _join(rater_sentence, rater_sentence)
+    shared = pair_counts(rater_operator[i], rater_operator[j])
+    i, j = _join(cell // n_tags, rater_sentence)
+    yes_of = pair_counts(yes_operator[i], rater_operator[j])
+    i, j = _join(cell, cell)
+    both = pair_counts(yes_operator[i], yes_operator[j])
+
+    a, b = np.nonzero(np.triu(shared, 1))
+    decisions = shared[a, b] * n_tags
+    first, second, agree = yes_of[a, b] / decisions, yes_of[b, a] / decisions, both[a, b] / decisions
+    pair_kappa = _kappa(1 - first - second + 2 * agree, first * second + (1 - first) * (1 - second))
+
+    return {
+        'sentences': items,
+        'operators': n_operators,
+        'fleiss_kappa': _float(overall),
+        'tags': [
+            {'id': int(tag_ids[k]), 'fleiss_kappa': _float(tag_kappa[k]),
+             'confusion': [[int(no_no[k]), int(yes_no[k])], [int(yes_no[k]), int(yes_yes[k])]]}
+            for k in range(n_tags)
+        ],
+        'pairs': [
+            {'operators': [int(operator_ids[x]), int(operator_ids[y])], 'sentences': int(shared[x, y]),
+             'cohen_kappa': _float(kappa)}
+            for x, y, kappa in zip(a, b, pair_kappa)
+        ],
+    }
+
+
+def dataset_agreement(dataset_id: int) -> dict:
+    """
+    compute_agreement of the dataset with tag names.
+    """
+    data = compute_agreement(label_rows(dataset_id))
+    names = dict(Tag.objects.filter(pk__in=[tag['id'] for tag in data['tags']]).values_list('pk', 'name'))
+    for tag in data['tags']:
+        tag['name'] = names.get(tag['id'])
+    return data
@@ -1,6 +1,15 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.db.backends.signals import connection_created
 
 
 class TaggerConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'tagger'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+
+        if settings.TAGGER_METRICS_ENABLED:
+            from .middleware import install_query_recorder
+            connection_created.connect(install_query_recorder, dispatch_uid='tagger_install_query_recorder')
@@ -0,0 +1,208 @@
+"""
+async versions of the read heavy endpoints, served under /api/async/.
+
+under an ASGI server a request waiting on the database doesn't hold a thread, the ORM calls run in the
+server's bounded thread pool (ASGI_THREADS) so one process can keep thousands of operators connected.
+responses are the same as the sync views except for pagination, which uses `after` and `page_size`
+like the dataset export instead of an opaque cursor.
+"""
+import time
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from rest_framework import exceptions
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+from . import events
+from .cache import acached_response
+from .models import Tag, LabeledSentence, Sentence
+from .permissions import aget_operator_permissions
+from .routers import areplica_for, reading_from
+from .renderers import ORJSONRenderer
+from .search import search_sentences
+from .suggestions import aattach_suggestions
+from .utils import available_to
+from .serializers import TagSerializer, LabeledSentenceSerializer, SentenceSerializer, RowEncoder
+
+
+async def authenticate(request: Request):
+    """
+    runs the rest framework authentication classes, so basic and session auth work as in the sync views.
+    """
+    return await sync_to_async(lambda: request.user)()
+
+
+def error(request, exc: exceptions.APIException) -> JsonResponse:
+    response = JsonResponse({'detail': exc.detail}, status=exc.status_code)
+    if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+        header = request.authenticators[0].authenticate_header(request) if request.authenticators else None
+        if header:
+            response['WWW-Authenticate'] = header
+        else:
+            response.status_code = exceptions.PermissionDenied.status_code
+    return response
+
+
+def async_api_view(admin=False, dataset_permission=False, replica=False):
+    """
+    turns a coroutine into a GET endpoint for authenticated operators, `admin` requires a staff user and
+    `dataset_permission` a permission on the `dataset_id` of the url. `replica` reads from the read replica.
+    the view gets the rest framework request and the permitted dataset ids.
+    """
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, **kwargs):
+            if request.method != 'GET':
+                return JsonResponse({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+            request = Request(request,
+                              authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+            try:
+                user = await authenticate(request)
+            except exceptions.APIException as exc:
+                return error(request, exc)
+            if not user or not user.is_authenticated:
+                return error(request, exceptions.NotAuthenticated())
+            if admin and not user.is_staff:
+                return error(request, exceptions.PermissionDenied())
+            _, dataset_ids = await aget_operator_permissions(user)
+            if dataset_permission and kwargs['dataset_id'] not in dataset_ids:
+                return error(request, exceptions.PermissionDenied("you don't have permission"))
+            with reading_from(await areplica_for(user) if replica else None):
+                return await view(request, dataset_ids, **kwargs)
+        return wrapper
+    return decorator
+
+
+def get_int_param(request, name, default, maximum=None):
+    value = request.query_params.get(name, '')
+    value = int(value) if value.isdigit() else default
+    return min(value, maximum) if maximum is not None else value
+
+
+async def keyset_page(request, queryset, serializer_class, page_size, max_page_size) -> dict:
+    """
+    rows with an id above `after`, in id order, with a `next` link while more rows are left.
+    """
+    after = get_int_param(request, 'after', 0)
+    page_size = get_int_param(request, 'page_size', page_size, max_page_size) or page_size
+    encoder = RowEncoder.for_serializer(serializer_class)
+    queryset = encoder.values_list(queryset.filter(pk__gt=after).order_by('pk')[:page_size + 1])
+    rows = [row async for row in queryset]
+    data = encoder.encode(rows[:page_size])
+    next_url = None
+    if len(rows) > page_size:
+        next_url = replace_query_param(request.build_absolute_uri(), 'after', data[-1]['id'])
+    return {'next': next_url, 'results': data}
+
+
+def render(data) -> HttpResponse:
+    return HttpResponse(ORJSONRenderer().render(data), content_type='application/json')
+
+
+@async_api_view(admin=True, dataset_permission=True, replica=True)
+async def tag_list(request, dataset_ids, dataset_id):
+    """
+    active tags of a dataset.
+    """
+    async def build():
+        encoder = RowEncoder.for_serializer(TagSerializer)
+        tags = encoder.values_list(Tag.objects.filter(dataset__pk=dataset_id, is_active=True))
+        return encoder.encode([row async for row in tags])
+
+    return await acached_response(request, dataset_id, f'async-tags:{dataset_id}', build)
+
+
+@async_api_view(dataset_permission=True, replica=True)
+async def category(request, dataset_ids, dataset_id, tag_id):
+    """
+    labels of sentences currently tagged with the given tag in a dataset, page by page.
+    """
+    async def build():
+        labels = LabeledSentence.objects.filter(current__dataset=dataset_id, current__tag=tag_id)
+        return await keyset_page(request, labels, LabeledSentenceSerializer, 100, 1000)
+
+    return await acached_response(request, dataset_id, f'async-category:{dataset_id}:{tag_id}', build)
+
+
+@async_api_view(dataset_permission=True, replica=True)
+async def search(request, dataset_ids, dataset_id, word):
+    """
+    labeled sentences of the dataset whose body matches the word, best matches first.
+    """
+    page_size = get_int_param(request, 'page_size', 50, 500)
+    offset = get_int_param(request, 'offset', 0)
+    sentence_ids = await sync_to_async(search_sentences)(dataset_id, word, page_size + 1, offset)
+    has_next = len(sentence_ids) > page_size
+    sentence_ids = sentence_ids[:page_size]
+
+    encoder = RowEncoder.for_serializer(LabeledSentenceSerializer)
+    rank = {sentence_id: position for position, sentence_id in enumerate(sentence_ids)}
+    labels = encoder.encode([row async for row in encoder.values_list(
+        LabeledSentence.objects.filter(sentence_id__in=sentence_ids))])
+    labels.sort(key=lambda item: (rank[item['sentence']], item['id']))
+    next_url = None
+    if has_next:
+        next_url = replace_query_param(request.build_absolute_uri(), 'offset', offset + page_size)
+    return render({'next': next_url, 'results': labels})
+
+
+@async_api_view()
+async def unlabeled_queue(request, dataset_ids):
+    """
+    next page of not labeled sentences the operator has permission on and no other operator has leased, with
+    their tag suggestions. `dataset` narrows it to one dataset.
+    """
+    operator_id, _ = await aget_operator_permissions(request.user)
+    sentences = Sentence.objects.filter(available_to(operator_id), dataset__id__in=dataset_ids, is_labeled=False)
+    dataset_id = request.query_params.get('dataset')
+    if dataset_id is not None:
+        if not dataset_id.isdigit():
+            return JsonResponse({'detail': 'dataset must be an id'}, status=400)
+        sentences = sentences.filter(dataset__id=dataset_id)
+    page = await keyset_page(request, sentences, SentenceSerializer, 50, 500)
+    await aattach_suggestions(page['results'])
+    return render(page)
+
+
+async def stream_events(user, dataset_ids, only, heartbeat):
+    """
+    encoded events of the permitted datasets, or of the `only` dataset, with a keep-alive comment when idle.
+    the first message is sent once subscribed. permissions are checked again every `heartbeat` seconds.
+    """
+    async with events.get_broker().subscribe() as subscription:
+        refreshed = time.monotonic()
+        yield f'retry: {heartbeat * 1000}\n\n'.encode()
+        while True:
+            event = await subscription.get(heartbeat)
+            if time.monotonic() - refreshed >= heartbeat:
+                # on elapsed time rather than when idle, a busy stream would keep a revoked dataset otherwise
+                _, dataset_ids = await aget_operator_permissions(user)
+                refreshed = time.monotonic()
+            if event is None:
+                # idle, keep proxies from closing the connection
+                yield b': keep-alive\n\n'
+            elif event['dataset'] in dataset_ids and only in (None, event['dataset']):
+                yield events.encode(event)
+
+
+@async_api_view()
+async def event_stream(request, dataset_ids):
+    """
+    server-sent events about the datasets the operator has permission on: sentences added, sentences labeled
+    and tags changed. `dataset` narrows it to one dataset. refresh the work queue when (re)connecting,
+    events sent while disconnected are not replayed.
+    """
+    dataset_id = request.query_params.get('dataset')
+    if dataset_id is not None and not dataset_id.isdigit():
+        return JsonResponse({'detail': 'dataset must be an id'}, status=400)
+    only = int(dataset_id) if dataset_id is not None else None
+    stream = stream_events(request.user, dataset_ids, only, settings.TAGGER_EVENTS_HEARTBEAT)
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # nginx would otherwise buffer the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
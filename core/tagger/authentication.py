@@ -0,0 +1,96 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework import exceptions
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+
+from .cache import get_version
+from .models import ApiKey
+
+API_KEYS_VERSION = 'api-keys'
+
+
+class PrincipalCache:
+    """
+    least recently used map of key digest -> (user, operator id), entries expire after `ttl` seconds
+    and all of them are dropped when the API_KEYS_VERSION stamp changes (revocations, user changes).
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._version = None
+
+    def get(self, key_hash: str, version: int):
+        with self._lock:
+            if version != self._version:
+                self._entries.clear()
+                self._version = version
+                return None
+            entry = self._entries.get(key_hash)
+            if entry is None:
+                return None
+            principal, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key_hash]
+                return None
+            self._entries.move_to_end(key_hash)
+            return principal
+
+    def set(self, key_hash: str, version: int, principal) -> None:
+        with self._lock:
+            if version != self._version:
+                self._entries.clear()
+                self._version = version
+            self._entries[key_hash] = (principal, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key_hash)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+principals = PrincipalCache(settings.TAGGER_API_KEY_CACHE_SIZE, settings.TAGGER_API_KEY_CACHE_TTL)
+
+
+class ApiKeyAuthentication(BaseAuthentication):
+    """
+    `Authorization: Bearer <key>` with a key from the api-key endpoint, request.auth is the operator id of the key.
+    a cached key costs a digest and a version lookup, a new one a single query.
+    """
+    keyword = 'Bearer'
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) != 2:
+            raise exceptions.AuthenticationFailed('Invalid api key header.')
+        try:
+            key = auth[1].decode()
+        except UnicodeError:
+            raise exceptions.AuthenticationFailed('Invalid api key header.')
+
+        key_hash = ApiKey.hash_key(key)
+        version = get_version(API_KEYS_VERSION)
+        principal = principals.get(key_hash, version)
+        if principal is None:
+            api_key = (ApiKey.objects.select_related('operator__user')
+                       .filter(key_hash=key_hash, revoked_at__isnull=True).first())
+            if api_key is None or not api_key.operator.user.is_active:
+                raise exceptions.AuthenticationFailed('Invalid api key.')
+            principal = (api_key.operator.user, api_key.operator_id)
+            principals.set(key_hash, version, principal)
+        user, operator_id = principal
+        # a copy per request, so nothing a view sets on request.user leaks into other requests
+        return copy.copy(user), operator_id
+
+    def authenticate_header(self, request):
+        return self.keyword
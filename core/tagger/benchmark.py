@@ -0,0 +1,354 @@
+"""
+load testing harness for the tagger api, used by the `loadtest` management command and the test suite.
+
+seed() fills the database with synthetic data, run() drives every endpoint and method of tagger/urls.py through
+the django test client with simulated operators and returns latency, query and throughput figures per endpoint.
+sync endpoints get one thread per operator like a threaded WSGI server, the `async-` endpoints are served by
+the ASGI handler with one coroutine per operator on a single event loop. rows that updates and deletes act on
+are created before each request, outside of the measurement.
+"""
+import asyncio
+import itertools
+import math
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing
+from dataclasses import dataclass, field
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, connections
+from django.test import Client, AsyncClient
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .middleware import install_query_recorder, recording
+from .models import Dataset, Tag, Operator, HasPermission, Sentence, LabeledSentence, ApiKey, ImportJob, PurgeJob
+from .utils import bulk_create_sentences, create_labels
+
+User = get_user_model()
+
+WORDS = ('alpha', 'bravo', 'charlie', 'delta', 'echo', 'foxtrot', 'golf', 'hotel', 'india', 'juliet', 'kilo',
+         'lima', 'mike', 'november', 'oscar', 'papa', 'quebec', 'romeo', 'sierra', 'tango')
+
+
+@dataclass
+class Seed:
+    users: list
+    datasets: list
+    tags: dict  # dataset id -> tag ids
+
+
+@dataclass
+class EndpointResult:
+    latencies: list = field(default_factory=list)
+    queries: list = field(default_factory=list)
+    errors: int = 0
+    elapsed: float = 0.0
+
+    def summary(self) -> dict:
+        latencies = sorted(self.latencies)
+        return {
+            'requests': len(latencies),
+            'errors': self.errors,
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p95_ms': percentile(latencies, 95) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+            'queries': sum(self.queries) / len(self.queries) if self.queries else 0,
+            'throughput': len(latencies) / self.elapsed if self.elapsed else 0,
+        }
+
+
+def percentile(values: list[float], percent: float) -> float:
+    """
+    nearest rank percentile of sorted values.
+    """
+    if not values:
+        return 0.0
+    return values[max(0, math.ceil(percent / 100 * len(values)) - 1)]
+
+
+def seed(datasets=2, tags=5, sentences=1000, operators=4, labels=500, random_seed=0) -> Seed:
+    """
+    creates datasets with tags and sentences, staff operators with permission on every dataset,
+    and labels spread over the first sentences of each dataset.
+    """
+    rng = random.Random(random_seed)
+    users = []
+    operator_ids = []
+    for i in range(operators):
+        user = User.objects.create_user(f'loadtest-operator-{i}', password='password', is_staff=True)
+        users.append(user)
+        operator_ids.append(Operator.objects.create(user=user).pk)
+
+    created_datasets = []
+    tag_ids = {}
+    for i in range(datasets):
+        dataset = Dataset.objects.create(name=f'loadtest dataset {i}', description='synthetic data')
+        created_datasets.append(dataset)
+        tag_ids[dataset.pk] = [Tag.objects.create(dataset=dataset, name=f'tag {j}', is_active=True).pk
+                               for j in range(tags)]
+        HasPermission.objects.bulk_create(HasPermission(dataset=dataset, operator_id=operator_id)
+                                          for operator_id in operator_ids)
+        bodies = (' '.join(rng.choices(WORDS, k=8)) + f' {n}' for n in range(sentences))
+        bulk_create_sentences(Sentence(dataset=dataset, body=body, body_hash=Sentence.hash_body(body))
+                              for body in bodies)
+        sentence_ids = Sentence.objects.filter(dataset=dataset).order_by('pk').values_list('pk', flat=True)[:labels]
+        create_labels([LabeledSentence(sentence_id=sentence_id, tag_id=rng.choice(tag_ids[dataset.pk]),
+                                       operator_id=rng.choice(operator_ids)) for sentence_id in sentence_ids])
+
+    return Seed(users=users, datasets=created_datasets, tags=tag_ids)
+
+
+def scenarios(data: Seed) -> dict:
+    """
+    one request factory per endpoint, each takes a random generator and the operator id of the client
+    and returns (method, url, kwargs) for the test client.
+    """
+    dataset_ids = [dataset.pk for dataset in data.datasets]
+    permissions = list(HasPermission.objects.values_list('pk', 'operator_id', 'dataset_id'))
+    csv_file = '\n'.join(f'uploaded sentence {n}' for n in range(50)).encode()
+    # jobs to poll, the csv file is never read
+    import_job = ImportJob.objects.create(dataset=data.datasets[0], file='imports/loadtest.csv')
+    purge_job = PurgeJob.objects.create(dataset_name='loadtest purged dataset', status=PurgeJob.Status.DONE)
+    # unique names for created rows
+    numbers = itertools.count()
+
+    def label(rng, operator_id):
+        dataset_id = rng.choice(dataset_ids)
+        sentence_id = Sentence.objects.filter(dataset_id=dataset_id).order_by('?').values_list('pk', flat=True)[0]
+        return {'sentence': sentence_id, 'tag': rng.choice(data.tags[dataset_id]), 'operator': operator_id}
+
+    def bulk_label(rng, operator_id):
+        dataset_id = rng.choice(dataset_ids)
+        sentence_ids = Sentence.objects.filter(dataset_id=dataset_id).order_by('?').values_list('pk', flat=True)[:50]
+        return {'labels': [{'sentence': sentence_id, 'tag': rng.choice(data.tags[dataset_id])}
+                           for sentence_id in sentence_ids]}
+
+    def dataset_url(name):
+        return lambda rng: reverse(name, args=[rng.choice(dataset_ids)])
+
+    def category_url(rng):
+        dataset_id = rng.choice(dataset_ids)
+        return reverse('category', args=[dataset_id, rng.choice(data.tags[dataset_id])])
+
+    def get(url):
+        return lambda rng, operator_id: ('get', url(rng) if callable(url) else url, {})
+
+    def post_json(url, payload):
+        return lambda rng, operator_id: ('post', url, {'data': payload(rng, operator_id),
+                                                       'content_type': 'application/json'})
+
+    def upload(rng, operator_id):
+        url = reverse('sentence-csv', args=[rng.choice(dataset_ids)])
+        return 'post', url, {'data': {'file': SimpleUploadedFile('sentences.csv', csv_file)}}
+
+    def json_body(payload):
+        return {'data': payload, 'content_type': 'application/json'}
+
+    def create_dataset(rng, operator_id):
+        return 'post', reverse('dataset-list'), json_body({'name': f'created dataset {next(numbers)}',
+                                                           'description': 'synthetic data'})
+
+    def delete_dataset(rng, operator_id):
+        dataset = Dataset.objects.create(name=f'deleted dataset {next(numbers)}', description='synthetic data')
+        bulk_create_sentences(Sentence(dataset=dataset, body=body, body_hash=Sentence.hash_body(body))
+                              for body in (f'deleted sentence {n}' for n in range(20)))
+        return 'delete', reverse('dataset-detail', args=[dataset.pk]), {}
+
+    def create_tag(rng, operator_id):
+        dataset_id = rng.choice(dataset_ids)
+        return 'post', reverse('tag-list', args=[dataset_id]), json_body({'dataset': dataset_id, 'is_active': True,
+                                                                          'name': f'created tag {next(numbers)}'})
+
+    def new_operator():
+        return Operator.objects.create(user=User.objects.create_user(f'loadtest-user-{next(numbers)}'))
+
+    def create_permission(rng, operator_id):
+        return 'post', reverse('permission'), json_body({'operator': new_operator().pk,
+                                                         'dataset': rng.choice(dataset_ids)})
+
+    def update_permission(rng, operator_id):
+        pk, permission_operator_id, dataset_id = rng.choice(permissions)
+        return 'put', reverse('permission-detail', args=[pk]), json_body({'operator': permission_operator_id,
+                                                                          'dataset': dataset_id})
+
+    def delete_permission(rng, operator_id):
+        permission = HasPermission.objects.create(operator=new_operator(), dataset_id=rng.choice(dataset_ids))
+        return 'delete', reverse('permission-detail', args=[permission.pk]), {}
+
+    def create_sentence(rng, operator_id):
+        dataset_id = rng.choice(dataset_ids)
+        return 'post', reverse('list-create-sentence', args=[dataset_id]), json_body(
+            {'dataset': dataset_id, 'body': f'created sentence {next(numbers)}'})
+
+    def cluster_url(rng):
+        dataset_id = rng.choice(dataset_ids)
+        sentence_id = Sentence.objects.filter(dataset_id=dataset_id).order_by('?').values_list('pk', flat=True)[0]
+        return reverse('sentence-cluster', args=[dataset_id, sentence_id])
+
+    def revoke_api_key(rng, operator_id):
+        api_key, _ = ApiKey.generate(Operator.objects.get(pk=operator_id), 'revoked key')
+        return 'delete', reverse('api-key-detail', args=[api_key.pk]), {}
+
+    return {
+        'dataset-list': get(reverse('dataset-list')),
+        'dataset-detail': get(lambda rng: reverse('dataset-detail', args=[rng.choice(dataset_ids)])),
+        'tag-list': get(dataset_url('tag-list')),
+        'category': get(category_url),
+        'permission': get(reverse('permission')),
+        'permission-detail': get(lambda rng: reverse('permission-detail', args=[rng.choice(permissions)[0]])),
+        'search': get(lambda rng: reverse('search', args=[rng.choice(dataset_ids), rng.choice(WORDS)])),
+        'labeling-queue': get(reverse('labeling')),
+        'labeling': post_json(reverse('labeling'), label),
+        'labeling-bulk': post_json(reverse('labeling-bulk'), bulk_label),
+        'labeling-claim': post_json(reverse('labeling-claim'), lambda rng, operator_id: {'size': 20}),
+        'list-create-sentence': get(dataset_url('list-create-sentence')),
+        'sentence-csv': upload,
+        'sentence-csv-job': get(reverse('sentence-csv-job', args=[import_job.pk])),
+        'dataset-stats': get(dataset_url('dataset-stats')),
+        'dataset-agreement': get(dataset_url('dataset-agreement')),
+        'sentence-clusters': get(dataset_url('sentence-clusters')),
+        'sentence-cluster': get(cluster_url),
+        'dataset-export': get(dataset_url('dataset-export')),
+        'api-key': get(reverse('api-key')),
+        'api-key-create': post_json(reverse('api-key'), lambda rng, operator_id: {'name': 'created key'}),
+        'api-key-revoke': revoke_api_key,
+        'metrics': get(reverse('metrics')),
+        'async-tag-list': get(dataset_url('async-tag-list')),
+        'async-category': get(lambda rng: category_url(rng).replace('/api/', '/api/async/', 1)),
+        'async-search': get(lambda rng: reverse('async-search', args=[rng.choice(dataset_ids), rng.choice(WORDS)])),
+        'async-labeling-queue': get(reverse('async-labeling')),
+        'async-events': get(reverse('events')),
+        # writes last, the rows they add don't show up in the figures of the reads
+        'tag-create': create_tag,
+        'sentence-create': create_sentence,
+        'permission-create': create_permission,
+        'permission-update': update_permission,
+        'permission-delete': delete_permission,
+        'dataset-create': create_dataset,
+        'dataset-delete': delete_dataset,
+        'dataset-purge': get(reverse('dataset-purge', args=[purge_job.pk])),
+    }
+
+
+def run(data: Seed, requests=100, concurrency=4, endpoints=None, random_seed=0, warmup=1) -> dict:
+    """
+    sends `requests` requests to every endpoint from `concurrency` operators at once, returns a summary per endpoint.
+    every operator first sends `warmup` requests that are not measured, so lazy caches and introspection queries
+    don't show up in the figures.
+    """
+    factories = scenarios(data)
+    operator_ids = dict(Operator.objects.filter(user__in=data.users).values_list('user_id', 'pk'))
+    results = {}
+    for name, factory in factories.items():
+        if endpoints and name not in endpoints:
+            continue
+        per_worker = [requests // concurrency + (1 if i < requests % concurrency else 0) for i in range(concurrency)]
+
+        if name.startswith('async-'):
+            start = time.perf_counter()
+            worker_results = async_to_sync(_run_async)(data, factory, operator_ids, per_worker, random_seed, warmup)
+            results[name] = _merge(worker_results, time.perf_counter() - start).summary()
+            continue
+
+        def worker(index, count):
+            result = EndpointResult()
+            rng = random.Random(random_seed + index)
+            user = data.users[index % len(data.users)]
+            client = Client()
+            client.force_login(user)
+            try:
+                for _ in range(warmup):
+                    method, url, kwargs = factory(rng, operator_ids[user.pk])
+                    response = getattr(client, method)(url, **kwargs)
+                    if response.streaming:
+                        b''.join(response.streaming_content)
+                for _ in range(count):
+                    method, url, kwargs = factory(rng, operator_ids[user.pk])
+                    with CaptureQueriesContext(connection) as queries:
+                        start = time.perf_counter()
+                        response = getattr(client, method)(url, **kwargs)
+                        if response.streaming:
+                            b''.join(response.streaming_content)
+                        latency = time.perf_counter() - start
+                    result.latencies.append(latency)
+                    result.queries.append(len(queries))
+                    if response.status_code >= 400:
+                        result.errors += 1
+            finally:
+                if concurrency > 1:
+                    connections.close_all()
+            return result
+
+        start = time.perf_counter()
+        if concurrency > 1:
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                worker_results = list(executor.map(worker, range(concurrency), per_worker))
+        else:
+            worker_results = [worker(0, requests)]
+        results[name] = _merge(worker_results, time.perf_counter() - start).summary()
+    return results
+
+
+def _merge(worker_results, elapsed) -> EndpointResult:
+    result = EndpointResult(elapsed=elapsed)
+    for worker_result in worker_results:
+        result.latencies += worker_result.latencies
+        result.queries += worker_result.queries
+        result.errors += worker_result.errors
+    return result
+
+
+async def _run_async(data, factory, operator_ids, per_worker, random_seed, warmup):
+    # async_to_sync runs the ORM calls of the views on the calling thread, count them there
+    install_query_recorder()
+
+    async def worker(index, count):
+        result = EndpointResult()
+        rng = random.Random(random_seed + index)
+        user = data.users[index % len(data.users)]
+        client = AsyncClient()
+        await client.aforce_login(user)
+        for _ in range(warmup):
+            method, url, kwargs = factory(rng, operator_ids[user.pk])
+            response = await getattr(client, method)(url, **kwargs)
+            if response.streaming:
+                async with aclosing(response.streaming_content) as content:
+                    await anext(content)
+        for _ in range(count):
+            method, url, kwargs = factory(rng, operator_ids[user.pk])
+            with recording() as recorder:
+                start = time.perf_counter()
+                response = await getattr(client, method)(url, **kwargs)
+                if response.streaming:
+                    # event streams don't end, the first message is sent once the stream is subscribed.
+                    # streaming_content wraps the iterator on every access, read and close the same one
+                    async with aclosing(response.streaming_content) as content:
+                        await anext(content)
+                latency = time.perf_counter() - start
+            result.latencies.append(latency)
+            result.queries.append(recorder.queries)
+            if response.status_code >= 400:
+                result.errors += 1
+        return result
+
+    return await asyncio.gather(*(worker(i, count) for i, count in enumerate(per_worker)))
+
+
+def compare(results: dict, baseline: dict, tolerance=0.2) -> list[str]:
+    """
+    regressions of results against a saved baseline: p95 latency above the tolerance or more queries.
+    """
+    regressions = []
+    for name, summary in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if summary['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {summary['p95_ms']:.1f}ms, baseline {base['p95_ms']:.1f}ms")
+        if summary['queries'] > base['queries']:
+            regressions.append(f"{name}: {summary['queries']:.1f} queries, baseline {base['queries']:.1f}")
+    return regressions
@@ -0,0 +1,109 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from .renderers import ORJSONRenderer
+from .routers import fresh_reads
+
+
+def _version_key(name: str) -> str:
+    return f'tagger:version:{name}'
+
+
+def get_version(name: str) -> int:
+    """
+    current version stamp of a cached namespace, embed it in cache keys so bumping it drops every entry at once.
+    """
+    version = cache.get(_version_key(name))
+    if version is None:
+        cache.add(_version_key(name), time.time_ns(), timeout=None)
+        version = cache.get(_version_key(name))
+    return version
+
+
+async def aget_version(name: str) -> int:
+    """
+    async get_version.
+    """
+    version = await cache.aget(_version_key(name))
+    if version is None:
+        await cache.aadd(_version_key(name), time.time_ns(), timeout=None)
+        version = await cache.aget(_version_key(name))
+    return version
+
+
+def bump_version(name: str) -> None:
+    """
+    invalidates every entry cached under the namespace once the current transaction commits.
+    a bump before the commit would let a concurrent request cache the old rows under the new stamp.
+    """
+    # a timestamp instead of incr() so an evicted stamp can never come back with an old value
+    transaction.on_commit(lambda: cache.set(_version_key(name), time.time_ns(), timeout=None))
+
+
+def dataset_version_name(dataset_id: int) -> str:
+    return f'dataset:{dataset_id}'
+
+
+def bump_dataset_versions(dataset_ids) -> None:
+    """
+    invalidates cached responses of the datasets, call it whenever their tags or labels change.
+    """
+    for dataset_id in set(dataset_ids):
+        if dataset_id is not None:
+            bump_version(dataset_version_name(dataset_id))
+
+
+def _etag(request, key: str, version: int) -> tuple[str, str, bool]:
+    """
+    cache key including the query string, ETag of the response and whether the client already has it.
+    """
+    key = f'{key}:{request.GET.urlencode()}'
+    etag = '"%s"' % hashlib.md5(f'{key}:{version}'.encode()).hexdigest()
+    if_none_match = parse_etags(request.headers.get('If-None-Match', ''))
+    return key, etag, etag in if_none_match or '*' in if_none_match
+
+
+def cached_response(request, dataset_id: int, key: str, build) -> Response:
+    """
+    read-through cache for GET responses of a dataset, `build` returns the response data on a miss.
+    clients sending back the ETag get a 304 while the dataset is unchanged.
+    """
+    version = get_version(dataset_version_name(dataset_id))
+    key, etag, not_modified = _etag(request, key, version)
+    if not_modified:
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+    cache_key = f'tagger:response:{key}:{version}'
+    data = cache.get(cache_key)
+    if data is None:
+        # the version stamp is the time of the last change, a replica lagging behind it would cache stale data
+        with fresh_reads(version):
+            data = build()
+        cache.set(cache_key, data, settings.TAGGER_RESPONSE_CACHE_TIMEOUT)
+    return Response(data, status=status.HTTP_200_OK, headers={'ETag': etag})
+
+
+async def acached_response(request, dataset_id: int, key: str, build) -> HttpResponse:
+    """
+    cached_response for async views, `build` is a coroutine function and the data is rendered to json here.
+    """
+    version = await aget_version(dataset_version_name(dataset_id))
+    key, etag, not_modified = _etag(request, key, version)
+    if not_modified:
+        return HttpResponseNotModified(headers={'ETag': etag})
+
+    cache_key = f'tagger:response:{key}:{version}'
+    data = await cache.aget(cache_key)
+    if data is None:
+        with fresh_reads(version):
+            data = await build()
+        await cache.aset(cache_key, data, settings.TAGGER_RESPONSE_CACHE_TIMEOUT)
+    return HttpResponse(ORJSONRenderer().render(data), content_type='application/json', headers={'ETag': etag})
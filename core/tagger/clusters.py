@@ -0,0 +1,193 @@
+"""
+near-duplicate clusters of sentences per dataset, from a minhash / locality-sensitive hashing index.
+
+every indexed sentence has one SentenceBucket row per band of its sketch (see tagger.minhash). a new sentence is
+compared with the sentences sharing a bucket with it, and joins the cluster of those whose character shingles have
+a jaccard similarity of at least TAGGER_CLUSTER_THRESHOLD. clusters are single linkage: a sentence close to two
+clusters merges them. Sentence.cluster is the id of the first sentence of the cluster, sentences without near
+duplicates have none. sentences are indexed as they are created and imported, cluster_sentences catches up on the
+rest and rebuilds the index of a dataset with a process pool.
+"""
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef
+
+from .minhash import jaccard, shingles, sketch
+from .models import CurrentLabel, LabeledSentence, Sentence, SentenceBucket
+from .utils import available_to, batched
+
+# one row per band of every sentence, inserted without building model instances
+_INSERT_BUCKETS = 'INSERT INTO tagger_sentencebucket (dataset_id, sentence_id, key) VALUES (%s, %s, %s)'
+
+
+def sketch_bodies(bodies: list[str]) -> np.ndarray:
+    return sketch(bodies, settings.TAGGER_CLUSTER_BANDS, settings.TAGGER_CLUSTER_ROWS)
+
+
+def _index(dataset_id: int, rows: list[tuple[int, str, int | None]], keys: np.ndarray) -> int:
+    """
+    adds sentences (id, body, cluster) with their lsh keys to the index of the dataset and merges them into the
+    clusters of their near duplicates. returns the number of sentences that joined a cluster, older ones included.
+    """
+    batch_size = settings.TAGGER_BULK_BATCH_SIZE
+    buckets = defaultdict(list)
+    for chunk in batched(sorted(set(keys.ravel().tolist())), batch_size):
+        for key, sentence_id in SentenceBucket.objects.filter(dataset_id=dataset_id, key__in=chunk) \
+                .values_list('key', 'sentence_id'):
+            buckets[key].append(sentence_id)
+    # a node is the cluster of a clustered sentence or the id of a sentence without one, cluster ids are
+    # sentence ids that never appear as a sentence node again since sentences don't leave their cluster
+    bodies, nodes, clusters = {}, {}, set()
+    for chunk in batched(sorted({pk for ids in buckets.values() for pk in ids}), batch_size):
+        for pk, body, cluster in Sentence.objects.filter(pk__in=chunk).values_list('pk', 'body', 'cluster'):
+            bodies[pk], nodes[pk] = body, cluster or pk
+            if cluster is not None:
+                clusters.add(cluster)
+
+    parent = {}
+
+    def find(node):
+        while parent.get(node, node) != node:
+            parent[node] = parent.get(parent[node], parent[node])
+            node = parent[node]
+        return node
+
+    cached = {}
+
+    def shingles_of(pk):
+        if pk not in cached:
+            cached[pk] = shingles(bodies[pk])
+        return cached[pk]
+
+    threshold = settings.TAGGER_CLUSTER_THRESHOLD
+    for (pk, body, cluster), row_keys in zip(rows, keys.tolist()):
+        bodies[pk], nodes[pk] = body, cluster or pk
+        if cluster is not None:
+            clusters.add(cluster)
+        tried = set()
+        for candidate in sorted({candidate for key in row_keys for candidate in buckets[key]}):
+            # one comparison per cluster, near duplicates share many buckets with its members
+            root, own = find(nodes[candidate]), find(nodes[pk])
+            if root == own or root in tried:
+                continue
+            tried.add(root)
+            if jaccard(shingles_of(pk), shingles_of(candidate)) >= threshold:
+                # the oldest sentence names the cluster
+                parent[own], parent[root] = min(own, root), min(own, root)
+        for key in row_keys:
+            buckets[key].append(pk)
+
+    components = defaultdict(list)
+    for node in parent:
+        components[find(node)].append(node)
+    updated = []
+    joined = 0
+    with transaction.atomic():
+        for root, members in components.items():
+            merged = [node for node in members if node in clusters and node != root]
+            if merged:
+                joined += Sentence.objects.filter(dataset_id=dataset_id, cluster__in=merged).update(cluster=root)
+            updated += [Sentence(pk=node, cluster=root) for node in members if node not in clusters]
+        Sentence.objects.bulk_update(updated, ['cluster'], batch_size=batch_size)
+        with connection.cursor() as cursor:
+            cursor.executemany(_INSERT_BUCKETS, [(dataset_id, pk, key) for (pk, _, _), row_keys
+                                                 in zip(rows, keys.tolist()) for key in row_keys])
+    return joined + len(updated)
+
+
+def _unindexed(dataset_id: int):
+    return Sentence.objects.filter(dataset_id=dataset_id).exclude(
+        Exists(SentenceBucket.objects.filter(sentence_id=OuterRef('pk'))))
+
+
+def index_sentences(dataset_id: int, sentence_ids) -> int:
+    """
+    indexes the given sentences of the dataset that aren't yet, returns the number of sentences that joined a cluster.
+    """
+    rows = list(_unindexed(dataset_id).filter(pk__in=sentence_ids).order_by('pk')
+                .values_list('pk', 'body', 'cluster'))
+    if not rows:
+        return 0
+    return _index(dataset_id, rows, sketch_bodies([body for _, body, _ in rows]))
+
+
+def reindex_sentence(sentence: Sentence) -> None:
+    """
+    indexes an edited sentence again if its sketch changed, it may join more near duplicates but keeps its cluster.
+    """
+    keys = sketch_bodies([sentence.body])
+    if set(keys[0].tolist()) == set(SentenceBucket.objects.filter(sentence=sentence).values_list('key', flat=True)):
+        return
+    with transaction.atomic():
+        SentenceBucket.objects.filter(sentence=sentence).delete()
+        cluster = Sentence.objects.filter(pk=sentence.pk).values_list('cluster', flat=True).first()
+        _index(sentence.dataset_id, [(sentence.pk, sentence.body, cluster)], keys)
+
+
+def update_clusters(dataset_id: int, workers: int = 1, batch_size: int | None = None) -> tuple[int, int]:
+    """
+    indexes every sentence of the dataset that isn't yet, in id order. with more than one worker the sketches are
+    computed in a process pool while the index is updated. returns the number of sentences indexed and of sentences
+    that joined a cluster.
+    """
+    batch_size = batch_size or settings.TAGGER_BULK_BATCH_SIZE
+    sentences = _unindexed(dataset_id).order_by('pk').values_list('pk', 'body', 'cluster')
+
+    def batches():
+        last_id = 0
+        while batch := list(sentences.filter(pk__gt=last_id)[:batch_size]):
+            last_id = batch[-1][0]
+            yield batch
+
+    indexed = clustered = 0
+    if workers <= 1:
+        for batch in batches():
+            clustered += _index(dataset_id, batch, sketch_bodies([body for _, body, _ in batch]))
+            indexed += len(batch)
+        return indexed, clustered
+
+    # a few batches are sketched ahead, the index is updated in id order as they complete
+    with ProcessPoolExecutor(workers) as pool:
+        pending = deque()
+        for batch in batches():
+            pending.append((batch, pool.submit(sketch, [body for _, body, _ in batch],
+                                               settings.TAGGER_CLUSTER_BANDS, settings.TAGGER_CLUSTER_ROWS)))
+            while len(pending) > workers or (pending and pending[0][1].done()):
+                batch, future = pending.popleft()
+                clustered += _index(dataset_id, batch, future.result())
+                indexed += len(batch)
+        for batch, future in pending:
+            clustered += _index(dataset_id, batch, future.result())
+            indexed += len(batch)
+    return indexed, clustered
+
+
+def reset(dataset_ids) -> None:
+    """
+    drops the index and the clusters of the datasets, the next update indexes them from scratch.
+    """
+    SentenceBucket.objects.filter(dataset_id__in=dataset_ids).delete()
+    Sentence.objects.filter(dataset_id__in=dataset_ids, cluster__isnull=False).update(cluster=None)
+
+
+def cluster_labels(label: LabeledSentence, limit: int | None = None) -> list[LabeledSentence]:
+    """
+    the label followed by the same label for the other sentences of its sentence's cluster it would change and no
+    other operator has leased, at most `limit` labels (TAGGER_BULK_LABEL_MAX).
+    """
+    limit = limit or settings.TAGGER_BULK_LABEL_MAX
+    sentence = label.sentence
+    if sentence.cluster is None:
+        return [label]
+    current = Exists(CurrentLabel.objects.filter(sentence_id=OuterRef('pk'), tag_id=label.tag_id))
+    others = Sentence.objects.filter(available_to(label.operator_id), dataset_id=sentence.dataset_id,
+                                     cluster=sentence.cluster).exclude(pk=sentence.pk)
+    others = others.exclude(current) if label.action == LabeledSentence.Action.ADD else others.filter(current)
+    return [label] + [
+        LabeledSentence(sentence_id=pk, tag_id=label.tag_id, operator_id=label.operator_id, action=label.action)
+        for pk in others.order_by('pk').values_list('pk', flat=True)[:limit - 1]
+    ]
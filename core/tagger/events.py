@@ -0,0 +1,158 @@
+"""
+dataset events pushed to operators over server-sent events, so clients don't poll the work queue.
+
+writes call publish(), events go out once the transaction commits. without TAGGER_EVENTS_REDIS_URL the broker
+only reaches event streams of the same process, with it every web process gets the events of every other
+process and of the celery workers through one redis pub/sub subscription per process.
+"""
+import asyncio
+import json
+import logging
+import threading
+from contextlib import asynccontextmanager
+from functools import cache, partial
+
+from django.conf import settings
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+SENTENCES_ADDED = 'sentences_added'
+SENTENCES_LABELED = 'sentences_labeled'
+TAG_CHANGED = 'tag_changed'
+
+
+class Subscription:
+    def __init__(self, queue: asyncio.Queue):
+        self.queue = queue
+
+    async def get(self, timeout: float) -> dict | None:
+        """
+        next event, None when nothing arrived within the timeout.
+        """
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+def _put(queue: asyncio.Queue, event: dict) -> None:
+    if queue.full():
+        # a stalled client loses its oldest events instead of growing without bound
+        queue.get_nowait()
+    queue.put_nowait(event)
+
+
+class LocalBroker:
+    """
+    fans events out to the subscriptions of this process, publish() can be called from any thread.
+    """
+    max_pending = 1000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = set()
+
+    def publish(self, event: dict) -> None:
+        self.deliver(event)
+
+    def deliver(self, event: dict) -> None:
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(_put, queue, event)
+            except RuntimeError:
+                # the event loop of the subscription is closed
+                with self._lock:
+                    self._subscribers.discard((loop, queue))
+
+    @asynccontextmanager
+    async def subscribe(self):
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue(self.max_pending))
+        with self._lock:
+            self._subscribers.add(subscriber)
+        try:
+            yield Subscription(subscriber[1])
+        finally:
+            with self._lock:
+                self._subscribers.discard(subscriber)
+
+
+class RedisBroker(LocalBroker):
+    """
+    publishes to a redis channel, one listener task per event loop delivers the channel to local subscriptions.
+    """
+    channel = 'tagger:events'
+
+    def __init__(self, url: str):
+        super().__init__()
+        import redis
+        self.url = url
+        self.client = redis.Redis.from_url(url)
+        self._listeners = {}
+
+    def publish(self, event: dict) -> None:
+        self.client.publish(self.channel, json.dumps(event))
+
+    async def listen(self, subscribed: asyncio.Event):
+        from redis import asyncio as aioredis
+        client = aioredis.Redis.from_url(self.url)
+        try:
+            async with client.pubsub() as pubsub:
+                await pubsub.subscribe(self.channel)
+                async for message in pubsub.listen():
+                    if message['type'] == 'message':
+                        self.deliver(json.loads(message['data']))
+                    elif message['type'] == 'subscribe':
+                        subscribed.set()
+        except Exception:
+            # the next subscription starts a new listener
+            logger.exception('redis event listener stopped')
+        finally:
+            await client.aclose()
+
+    @asynccontextmanager
+    async def subscribe(self):
+        """
+        returns once redis confirmed the channel subscription of the listener, or the listener failed.
+        """
+        loop = asyncio.get_running_loop()
+        listener = self._listeners.get(loop)
+        if listener is None or listener[0].done():
+            subscribed = asyncio.Event()
+            listener = self._listeners[loop] = (loop.create_task(self.listen(subscribed)), subscribed)
+        task, subscribed = listener
+        async with super().subscribe() as subscription:
+            waiter = loop.create_task(subscribed.wait())
+            try:
+                await asyncio.wait((task, waiter), return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                waiter.cancel()
+            yield subscription
+
+
+@cache
+def get_broker() -> LocalBroker:
+    if settings.TAGGER_EVENTS_REDIS_URL:
+        return RedisBroker(settings.TAGGER_EVENTS_REDIS_URL)
+    return LocalBroker()
+
+
+def _send(event: dict) -> None:
+    try:
+        get_broker().publish(event)
+    except Exception:
+        # events are a hint to refresh, a broker outage must not fail the write that caused them
+        logger.exception('could not publish %s event', event['type'])
+
+
+def publish(event_type: str, dataset_id: int, **data) -> None:
+    """
+    sends the event to operators with permission on the dataset once the current transaction commits.
+    """
+    transaction.on_commit(partial(_send, {'type': event_type, 'dataset': dataset_id, **data}))
+
+
+def encode(event: dict) -> bytes:
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n".encode()
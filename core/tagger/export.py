@@ -0,0 +1,94 @@
+import csv
+import io
+import json
+import zlib
+from collections import defaultdict
+from collections.abc import Iterator
+
+from django.conf import settings
+
+from .models import Sentence, CurrentLabel
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def iter_dataset_rows(dataset_id: int, after: int = 0, chunk_size: int | None = None, using: str = 'default') \
+        -> Iterator[tuple[int, str, list[str]]]:
+    """
+    yields (id, body, current tag names) of every sentence in the dataset with an id greater than `after`,
+    ordered by id. sentences are read in keyset chunks from the `using` database so memory use does not grow with
+    the dataset.
+    """
+    chunk_size = chunk_size or settings.TAGGER_BULK_BATCH_SIZE
+    last_id = after
+    while True:
+        sentences = list(Sentence.objects.using(using).filter(dataset_id=dataset_id, pk__gt=last_id)
+                         .order_by('pk').values_list('pk', 'body')[:chunk_size])
+        if not sentences:
+            return
+        tags = defaultdict(dict)
+        labels = (CurrentLabel.objects.using(using).filter(sentence_id__in=[pk for pk, _ in sentences])
+                  .select_related('tag').only('sentence_id', 'tag__name').order_by('label_id'))
+        for label in labels.iterator(chunk_size=chunk_size):
+            tags[label.sentence_id][label.tag.name] = None
+        for pk, body in sentences:
+            yield pk, body, list(tags[pk])
+        last_id = sentences[-1][0]
+
+
+def encode_ndjson(rows) -> Iterator[str]:
+    for pk, body, tags in rows:
+        yield json.dumps({'id': pk, 'body': body, 'tags': tags}, ensure_ascii=False) + '\n'
+
+
+def encode_csv(rows) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(('id', 'body', 'tags'))
+    for pk, body, tags in rows:
+        writer.writerow((pk, body, '|'.join(tags)))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def buffered(chunks, size: int = 64 * 1024) -> Iterator[bytes]:
+    """
+    joins small text chunks into utf-8 blocks of about `size` bytes.
+    """
+    parts = []
+    length = 0
+    for chunk in chunks:
+        data = chunk.encode('utf-8')
+        parts.append(data)
+        length += len(data)
+        if length >= size:
+            yield b''.join(parts)
+            parts = []
+            length = 0
+    if parts:
+        yield b''.join(parts)
+
+
+def gzip_stream(blocks) -> Iterator[bytes]:
+    compressor = zlib.compressobj(wbits=31)  # 31 writes a gzip header and trailer
+    for block in blocks:
+        compressed = compressor.compress(block)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_dataset(dataset_id: int, output: str = 'ndjson', compress: bool = False, after: int = 0,
+                   using: str = 'default') -> Iterator[bytes]:
+    """
+    streams a dataset's sentences with their tags as ndjson or csv bytes, gzip compressed if asked.
+    pass the last exported id as `after` to resume an interrupted export.
+    """
+    encode = encode_csv if output == 'csv' else encode_ndjson
+    blocks = buffered(encode(iter_dataset_rows(dataset_id, after, using=using)))
+    return gzip_stream(blocks) if compress else blocks
@@ -0,0 +1,38 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from tagger.agreement import dataset_agreement
+from tagger.models import Dataset
+
+
+class Command(BaseCommand):
+    help = "Reports inter-annotator agreement of a dataset: fleiss' kappa per tag and cohen's kappa per operator pair"
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset_id', type=int)
+        parser.add_argument('--json', action='store_true', help='print the metrics as json')
+
+    def handle(self, *args, **options):
+        if not Dataset.objects.filter(pk=options['dataset_id']).exists():
+            raise CommandError(f"dataset {options['dataset_id']} does not exist")
+
+        data = dataset_agreement(options['dataset_id'])
+        if options['json']:
+            self.stdout.write(json.dumps(data, indent=2))
+            return
+
+        def kappa(value):
+            return 'n/a' if value is None else f'{value:.3f}'
+
+        self.stdout.write(f"{data['sentences']} sentences rated by two or more of {data['operators']} operators")
+        self.stdout.write(f"fleiss' kappa: {kappa(data['fleiss_kappa'])}\n")
+        self.stdout.write(f"{'tag':<30} {'kappa':>8} {'yes/yes':>9} {'yes/no':>9} {'no/no':>9}")
+        for tag in data['tags']:
+            (no_no, _), (yes_no, yes_yes) = tag['confusion']
+            self.stdout.write(f"{str(tag['name'])[:30]:<30} {kappa(tag['fleiss_kappa']):>8} "
+                              f"{yes_yes:>9} {yes_no:>9} {no_no:>9}")
+        self.stdout.write(f"\n{'operators':<30} {'kappa':>8} {'sentences':>9}")
+        for pair in data['pairs']:
+            operators = ' - '.join(map(str, pair['operators']))
+            self.stdout.write(f"{operators:<30} {kappa(pair['cohen_kappa']):>8} {pair['sentences']:>9}")
@@ -0,0 +1,54 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from rest_framework.renderers import JSONRenderer
+
+from tagger.models import Dataset, Sentence
+from tagger.renderers import ORJSONRenderer
+from tagger.serializers import SentenceSerializer, RowEncoder
+
+
+class Command(BaseCommand):
+    help = 'Compares rows per second of SentenceSerializer against the RowEncoder fast path on a throwaway database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            self.run(options['rows'], options['repeat'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def run(self, rows, repeat):
+        dataset = Dataset.objects.create(name='benchmark', description='benchmark')
+        Sentence.objects.bulk_create(
+            (Sentence(dataset=dataset, body=f'benchmark sentence number {i}') for i in range(rows)), batch_size=1000)
+        sentences = Sentence.objects.filter(dataset=dataset).order_by('id')
+        encoder = RowEncoder.for_serializer(SentenceSerializer)
+
+        def serializer():
+            return JSONRenderer().render(SentenceSerializer(sentences, many=True).data)
+
+        def fast():
+            return ORJSONRenderer().render(encoder.encode(encoder.values_list(sentences)))
+
+        if serializer() != fast():
+            self.stderr.write(self.style.WARNING('outputs differ'))
+
+        results = {}
+        for name, build in (('serializer', serializer), ('fast', fast)):
+            best = min(self.measure(build) for _ in range(repeat))
+            results[name] = rows / best
+            self.stdout.write(f'{name:>10}: {results[name]:12,.0f} rows/s ({best * 1000:.1f} ms for {rows} rows)')
+        self.stdout.write(self.style.SUCCESS(f"fast path is {results['fast'] / results['serializer']:.1f}x faster"))
+
+    @staticmethod
+    def measure(build):
+        start = time.perf_counter()
+        build()
+        return time.perf_counter() - start
@@ -0,0 +1,28 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from tagger import clusters
+from tagger.models import Dataset
+
+
+class Command(BaseCommand):
+    help = 'Adds the sentences of datasets missing from the near-duplicate index and clusters them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dataset', type=int, action='append', help='only this dataset, can be repeated')
+        parser.add_argument('--rebuild', action='store_true', help='drop the index and the clusters first')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='processes computing the minhash sketches')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        datasets = Dataset.objects.order_by('pk')
+        if options['dataset']:
+            datasets = datasets.filter(pk__in=options['dataset'])
+        for dataset_id in datasets.values_list('pk', flat=True):
+            if options['rebuild']:
+                clusters.reset([dataset_id])
+            indexed, clustered = clusters.update_clusters(dataset_id, options['workers'], options['batch_size'])
+            self.stdout.write(f'dataset {dataset_id}: {indexed} sentences indexed, {clustered} joined a cluster')
+        self.stdout.write(self.style.SUCCESS('Updated sentence clusters'))
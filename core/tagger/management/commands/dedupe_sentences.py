@@ -0,0 +1,74 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from tagger import suggestions
+from tagger.models import Sentence, LabeledSentence, CurrentLabel
+from tagger.utils import mark_sentences_labeled, unmark_unlabeled_sentences, rebuild_current_labels
+
+
+class Command(BaseCommand):
+    help = 'Fills missing sentence hashes and merges duplicate sentences inside each dataset'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = 0
+        hashed = merged = 0
+        while True:
+            batch = list(Sentence.objects.filter(pk__gt=last_id, body_hash__isnull=True, dataset__isnull=False)
+                         .order_by('pk').values_list('pk', 'dataset_id', 'body')[:batch_size])
+            if not batch:
+                break
+            last_id = batch[-1][0]
+            with transaction.atomic():
+                batch_hashed, batch_merged = self.process_batch(batch)
+            hashed += batch_hashed
+            merged += batch_merged
+            self.stdout.write(f'processed sentences up to id {last_id}')
+
+        self.stdout.write(self.style.SUCCESS(f'Hashed {hashed} sentences, merged {merged} duplicates'))
+
+    def process_batch(self, batch):
+        """
+        the oldest sentence of a (dataset, hash) pair is kept, hashed or not yet, duplicates hand their labels
+        over to it.
+        """
+        keys = {pk: (dataset_id, Sentence.hash_body(body)) for pk, dataset_id, body in batch}
+        hashed = {
+            pk: (dataset_id, body_hash) for pk, dataset_id, body_hash in Sentence.objects.filter(
+                dataset_id__in={dataset_id for dataset_id, _ in keys.values()},
+                body_hash__in={body_hash for _, body_hash in keys.values()},
+            ).values_list('pk', 'dataset_id', 'body_hash')
+        }
+        keepers = {}
+        for pk, key in (*hashed.items(), *keys.items()):
+            keepers[key] = min(keepers.get(key, pk), pk)
+
+        to_hash = []
+        duplicates = defaultdict(list)
+        for pk, key in (*hashed.items(), *keys.items()):
+            if keepers[key] != pk:
+                duplicates[keepers[key]].append(pk)
+            elif pk in keys:
+                to_hash.append(Sentence(pk=pk, body_hash=key[1]))
+
+        duplicate_ids = [pk for pks in duplicates.values() for pk in pks]
+        # current labels follow the moved history once it is replayed on the keeper
+        CurrentLabel.objects.filter(sentence_id__in=duplicate_ids).delete()
+        for keeper, pks in duplicates.items():
+            LabeledSentence.objects.filter(sentence_id__in=pks).update(sentence_id=keeper)
+        rebuild_current_labels(LabeledSentence.objects.filter(sentence_id__in=list(duplicates))
+                               .values_list('sentence_id', 'tag_id').distinct())
+        mark_sentences_labeled(CurrentLabel.objects.filter(sentence_id__in=list(duplicates))
+                               .values('sentence_id'))
+        unmark_unlabeled_sentences(duplicate_ids)
+        Sentence.objects.filter(pk__in=duplicate_ids).delete()
+        # moved history no longer matches what the suggestion centroids were trained on
+        if duplicates:
+            suggestions.reset({dataset_id for dataset_id, _ in keys.values()})
+        Sentence.objects.bulk_update(to_hash, ['body_hash'])
+        return len(to_hash), len(duplicate_ids)
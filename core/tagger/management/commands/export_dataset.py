@@ -0,0 +1,37 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from tagger.export import EXPORT_FORMATS, export_dataset
+from tagger.models import Dataset
+
+
+class Command(BaseCommand):
+    help = 'Exports sentences of a dataset with their tags as ndjson or csv'
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset_id', type=int)
+        parser.add_argument('--output-format', choices=list(EXPORT_FORMATS), default='ndjson')
+        parser.add_argument('--gzip', action='store_true', help='gzip compress the output')
+        parser.add_argument('--after', type=int, default=0, help='resume after this sentence id')
+        parser.add_argument('--file', help='write to this file instead of stdout')
+        parser.add_argument('--database', default='default', help='database alias to read from, e.g. replica')
+
+    def handle(self, *args, **options):
+        if options['database'] not in connections:
+            raise CommandError(f"database {options['database']} is not configured")
+        if not Dataset.objects.using(options['database']).filter(pk=options['dataset_id']).exists():
+            raise CommandError(f"dataset {options['dataset_id']} does not exist")
+
+        blocks = export_dataset(options['dataset_id'], options['output_format'], options['gzip'], options['after'],
+                                using=options['database'])
+        if options['file']:
+            with open(options['file'], 'wb') as output:
+                for block in blocks:
+                    output.write(block)
+            self.stderr.write(self.style.SUCCESS(f"Exported to {options['file']}"))
+        else:
+            for block in blocks:
+                sys.stdout.buffer.write(block)
+            sys.stdout.flush()
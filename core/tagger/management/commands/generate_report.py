@@ -1,31 +1,45 @@
 from pathlib import Path
 
 from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum
 from django.utils import timezone
-from datetime import datetime
-from tagger.models import LabeledSentence
+from datetime import datetime, date
+from tagger.models import LabeledSentence, OperatorDailyStats
 
 
 class Command(BaseCommand):
     help = 'Generates report of what operators have done'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--date', type=date.fromisoformat, help='day to report on, defaults to today')
+        parser.add_argument('--rebuild', action='store_true',
+                            help='recompute the daily stats of that day from labeled sentences first')
+
     def handle(self, *args, **options):
-        today = timezone.now().date()
-        start_of_day = timezone.make_aware(datetime.combine(today, datetime.min.time()))
-        end_of_day = timezone.make_aware(datetime.combine(today, datetime.max.time()))
-        daily_activity = LabeledSentence.objects.filter(created_at__range=(start_of_day, end_of_day))
+        today = options['date'] or timezone.now().date()
+        if options['rebuild']:
+            self.rebuild_stats(today)
+        daily_stats = OperatorDailyStats.objects.filter(date=today)
 
         # Generate a report based on operator activity
-        report = {}
-        for entry in daily_activity:
-            operator_id = entry.operator.id
-            if operator_id not in report:
-                report[operator_id] = {'name': entry.operator.user, 'count': 0}
-            report[operator_id]['count'] += 1
+        per_operator = (daily_stats.values('operator_id', 'operator__user__username')
+                        .annotate(count=Sum('count')).order_by('operator__user__username'))
+        per_dataset = daily_stats.values('dataset__name').annotate(count=Sum('count')).order_by('dataset__name')
+        per_tag = (daily_stats.values('dataset__name', 'tag__name')
+                   .annotate(count=Sum('count')).order_by('dataset__name', 'tag__name'))
+
+        when = 'today' if today == timezone.now().date() else f'on {today}'
         report_content = f"Daily Activity Report for {today}\n"
         report_content += "=" * 40 + "\n"
-        for operator_id, data in report.items():
-            report_content += f"Operator {data['name']} performed {data['count']} actions today.\n"
+        for data in per_operator:
+            report_content += f"Operator {data['operator__user__username']} performed {data['count']} actions {when}.\n"
+        report_content += "\nLabels per dataset\n" + "-" * 40 + "\n"
+        for data in per_dataset:
+            report_content += f"{data['dataset__name']}: {data['count']}\n"
+        report_content += "\nLabels per tag\n" + "-" * 40 + "\n"
+        for data in per_tag:
+            report_content += f"{data['dataset__name']} / {data['tag__name']}: {data['count']}\n"
 
         # Define the path to save the report
         reports_dir = Path('reports')  # Directory for storing reports
@@ -38,4 +52,18 @@ class Command(BaseCommand):
 
         self.stdout.write(self.style.SUCCESS(f'Report saved as {report_filename}'))
 
-
+    @staticmethod
+    def rebuild_stats(day):
+        start_of_day = timezone.make_aware(datetime.combine(day, datetime.min.time()))
+        end_of_day = timezone.make_aware(datetime.combine(day, datetime.max.time()))
+        daily_activity = (LabeledSentence.objects.filter(created_at__range=(start_of_day, end_of_day),
+                                                         action=LabeledSentence.Action.ADD,
+                                                         sentence__dataset__isnull=False)
+                          .values('operator_id', 'sentence__dataset_id', 'tag_id').annotate(count=Count('id')))
+        with transaction.atomic():
+            OperatorDailyStats.objects.filter(date=day).delete()
+            OperatorDailyStats.objects.bulk_create(
+                OperatorDailyStats(date=day, operator_id=row['operator_id'], dataset_id=row['sentence__dataset_id'],
+                                   tag_id=row['tag_id'], count=row['count'])
+                for row in daily_activity
+            )
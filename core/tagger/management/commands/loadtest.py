@@ -0,0 +1,87 @@
+import json
+import os
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from tagger import benchmark
+
+
+class Command(BaseCommand):
+    help = ('Seeds a throwaway database with synthetic data, drives every tagger endpoint with concurrent operators '
+            'and reports latency percentiles, queries per request and throughput. async- endpoints go through the '
+            'ASGI handler for comparison with their sync counterparts')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--datasets', type=int, default=2)
+        parser.add_argument('--tags', type=int, default=5)
+        parser.add_argument('--sentences', type=int, default=1000, help='sentences per dataset')
+        parser.add_argument('--operators', type=int, default=4)
+        parser.add_argument('--labels', type=int, default=500, help='labeled sentences per dataset')
+        parser.add_argument('--requests', type=int, default=100, help='requests per endpoint')
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument('--endpoint', action='append', help='only run this endpoint, can be repeated')
+        parser.add_argument('--warmup', type=int, default=1, help='unmeasured requests per operator and endpoint')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--save-baseline', metavar='FILE')
+        parser.add_argument('--compare', metavar='FILE', help='fail when results regress against this baseline')
+        parser.add_argument('--tolerance', type=float, default=0.2, help='allowed p95 slowdown, 0.2 is 20%%')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+
+        # csv imports run inline instead of needing a broker, uploads go to a temporary media root,
+        # reads stay on the throwaway database instead of a configured replica
+        with tempfile.TemporaryDirectory() as directory, \
+                override_settings(CELERY_TASK_ALWAYS_EAGER=True, MEDIA_ROOT=directory, TAGGER_REPLICA_DATABASE=None):
+            results = self.run(directory, options)
+
+        self.report(results)
+        if options['save_baseline']:
+            with open(options['save_baseline'], 'w') as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+            self.stdout.write(f"baseline saved to {options['save_baseline']}")
+        if baseline is not None:
+            regressions = benchmark.compare(results, baseline, options['tolerance'])
+            if regressions:
+                raise CommandError('regressions against baseline:\n' + '\n'.join(regressions))
+            self.stdout.write(self.style.SUCCESS('no regressions against baseline'))
+
+    def run(self, directory, options):
+        old_name = connection.settings_dict['NAME']
+        test_settings = connection.settings_dict.setdefault('TEST', {})
+        old_test_name = test_settings.get('NAME')
+        old_options = dict(connection.settings_dict['OPTIONS'])
+        if connection.vendor == 'sqlite' and not old_test_name:
+            # in memory databases can't be shared by the operator threads
+            test_settings['NAME'] = os.path.join(directory, 'loadtest.sqlite3')
+            # take the write lock up front and wait for it, deferred transactions fail with "database is locked"
+            # when two operators upgrade their read locks at the same time
+            connection.settings_dict['OPTIONS'].update(transaction_mode='IMMEDIATE', timeout=30)
+        setup_test_environment()
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            data = benchmark.seed(options['datasets'], options['tags'], options['sentences'], options['operators'],
+                                  options['labels'], options['seed'])
+            return benchmark.run(data, options['requests'], options['concurrency'], options['endpoint'],
+                                 options['seed'], options['warmup'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            test_settings['NAME'] = old_test_name
+            connection.settings_dict['OPTIONS'] = old_options
+
+    def report(self, results):
+        self.stdout.write(f"{'endpoint':<22}{'requests':>9}{'errors':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+                          f"{'queries':>9}{'req/s':>9}")
+        for name, summary in results.items():
+            line = (f"{name:<22}{summary['requests']:>9}{summary['errors']:>8}{summary['p50_ms']:>9.1f}"
+                    f"{summary['p95_ms']:>9.1f}{summary['p99_ms']:>9.1f}{summary['queries']:>9.1f}"
+                    f"{summary['throughput']:>9.1f}")
+            self.stdout.write(self.style.ERROR(line) if summary['errors'] else line)
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from tagger.models import Dataset
+from tagger.utils import reconcile_counters
+
+
+class Command(BaseCommand):
+    help = 'Recomputes sentence and label counters of datasets and tags'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='datasets recomputed per transaction')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = 0
+        reconciled = 0
+        while True:
+            dataset_ids = list(Dataset.objects.filter(pk__gt=last_id).order_by('pk')
+                               .values_list('pk', flat=True)[:batch_size])
+            if not dataset_ids:
+                break
+            reconcile_counters(dataset_ids)
+            reconciled += len(dataset_ids)
+            last_id = dataset_ids[-1]
+
+        self.stdout.write(self.style.SUCCESS(f'Reconciled counters of {reconciled} datasets'))
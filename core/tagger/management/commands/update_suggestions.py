@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from tagger import suggestions
+from tagger.models import Dataset
+
+
+class Command(BaseCommand):
+    help = 'Trains the tag suggestions of datasets on their new labels and rescores their unlabeled sentences'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dataset', type=int, action='append', help='only this dataset, can be repeated')
+        parser.add_argument('--rebuild', action='store_true', help='train from scratch on the whole label history')
+
+    def handle(self, *args, **options):
+        datasets = Dataset.objects.order_by('pk')
+        if options['dataset']:
+            datasets = datasets.filter(pk__in=options['dataset'])
+        for dataset_id in datasets.values_list('pk', flat=True):
+            if options['rebuild']:
+                suggestions.reset([dataset_id])
+            trained, scored = suggestions.update_suggestions(dataset_id)
+            self.stdout.write(f'dataset {dataset_id}: {trained} label changes trained, {scored} sentences scored')
+        self.stdout.write(self.style.SUCCESS('Updated tag suggestions'))
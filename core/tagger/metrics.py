@@ -0,0 +1,97 @@
+"""
+in process aggregates of request latency and database usage per view, rendered in the prometheus text format.
+
+every web process keeps its own registry, scrape each process or sum them on the prometheus side.
+"""
+import bisect
+import threading
+from collections import defaultdict
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def lines(self, name, labels):
+        total = 0
+        for bound, count in zip((*self.buckets, '+Inf'), self.counts):
+            total += count
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {total}'
+        yield f'{name}_sum{{{labels}}} {self.sum}'
+        yield f'{name}_count{{{labels}}} {total}'
+
+
+class ViewMetrics:
+    def __init__(self):
+        self.requests = defaultdict(int)  # (method, status) -> count
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.db_seconds = 0.0
+        self.over_budget = 0
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = defaultdict(ViewMetrics)
+
+    def record(self, view, method, status, seconds, queries, db_seconds, over_budget):
+        with self._lock:
+            metrics = self._views[view]
+            metrics.requests[method, status] += 1
+            metrics.latency.observe(seconds)
+            metrics.queries.observe(queries)
+            metrics.db_seconds += db_seconds
+            metrics.over_budget += over_budget
+
+    def clear(self):
+        with self._lock:
+            self._views.clear()
+
+    def render(self) -> str:
+        with self._lock:
+            views = sorted(self._views.items())
+            lines = [
+                '# HELP tagger_requests_total requests handled per view',
+                '# TYPE tagger_requests_total counter',
+            ]
+            for view, metrics in views:
+                for (method, status), count in sorted(metrics.requests.items()):
+                    lines.append(f'tagger_requests_total{{view="{view}",method="{method}",status="{status}"}} {count}')
+            lines += [
+                '# HELP tagger_request_duration_seconds time from the first middleware to the response',
+                '# TYPE tagger_request_duration_seconds histogram',
+            ]
+            for view, metrics in views:
+                lines += metrics.latency.lines('tagger_request_duration_seconds', f'view="{view}"')
+            lines += [
+                '# HELP tagger_request_queries database queries per request',
+                '# TYPE tagger_request_queries histogram',
+            ]
+            for view, metrics in views:
+                lines += metrics.queries.lines('tagger_request_queries', f'view="{view}"')
+            lines += [
+                '# HELP tagger_db_duration_seconds_total time spent executing database queries',
+                '# TYPE tagger_db_duration_seconds_total counter',
+            ]
+            for view, metrics in views:
+                lines.append(f'tagger_db_duration_seconds_total{{view="{view}"}} {metrics.db_seconds}')
+            lines += [
+                '# HELP tagger_query_budget_exceeded_total requests that ran more queries than the budget',
+                '# TYPE tagger_query_budget_exceeded_total counter',
+            ]
+            for view, metrics in views:
+                lines.append(f'tagger_query_budget_exceeded_total{{view="{view}"}} {metrics.over_budget}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
@@ -0,0 +1,154 @@
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from rest_framework.permissions import SAFE_METHODS
+
+from .metrics import registry
+from .routers import pin_to_primary
+
+logger = logging.getLogger(__name__)
+
+# the recorder of the request being handled, sync_to_async copies it into the thread running the ORM
+# so queries of async views are counted as well
+_recorder = ContextVar('tagger_query_recorder', default=None)
+
+
+class QueryRecorder:
+    """
+    counts the queries of a request and the time spent in them, nested recorders count into their parent too.
+    """
+
+    def __init__(self, parent=None):
+        self.parent = parent
+        self.queries = 0
+        self.seconds = 0.0
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    execute wrapper adding the query to the recorder of the current request, if any.
+    """
+    recorder = _recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        seconds = time.perf_counter() - start
+        while recorder is not None:
+            recorder.seconds += seconds
+            recorder.queries += 1
+            recorder = recorder.parent
+
+
+def install_query_recorder(sender=None, connection=connection, **kwargs):
+    """
+    adds record_query to the connection, connected to `connection_created` when metrics are enabled.
+    """
+    if record_query not in connection.execute_wrappers:
+        # outermost, so execute_wrapper() blocks opened later still pop their own wrapper
+        connection.execute_wrappers.insert(0, record_query)
+
+
+@contextmanager
+def recording():
+    """
+    collects the queries run in the current context into a QueryRecorder.
+    """
+    recorder = QueryRecorder(_recorder.get())
+    token = _recorder.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _recorder.reset(token)
+
+
+class QueryInstrumentationMiddleware:
+    """
+    records latency, query count and database time of every request per view into the metrics registry,
+    and logs requests running more than TAGGER_QUERY_BUDGET queries.
+    streaming responses are measured until their first byte, queries made while streaming aren't counted.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.TAGGER_METRICS_ENABLED:
+            # django drops the middleware from the chain, disabled metrics cost nothing per request
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.budget = settings.TAGGER_QUERY_BUDGET
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        install_query_recorder()
+        start = time.perf_counter()
+        with recording() as recorder:
+            response = self.get_response(request)
+        self.record(request, response, time.perf_counter() - start, recorder)
+        return response
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        with recording() as recorder:
+            response = await self.get_response(request)
+        self.record(request, response, time.perf_counter() - start, recorder)
+        return response
+
+    def record(self, request, response, seconds, recorder):
+        match = request.resolver_match
+        view = match.view_name if match else 'unmatched'
+        over_budget = recorder.queries > self.budget
+        if over_budget:
+            logger.warning('%s %s ran %d queries, budget is %d', request.method, request.path, recorder.queries,
+                           self.budget)
+        registry.record(view, request.method, response.status_code, seconds, recorder.queries, recorder.seconds,
+                        over_budget)
+
+
+class PrimaryPinMiddleware:
+    """
+    pins the reads of a user to the primary database after an unsafe request, so a lagging replica never hides
+    their own writes. not used without a replica.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.TAGGER_REPLICA_DATABASE:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.get_response(request)
+        if request.method not in SAFE_METHODS:
+            self.pin(request)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if request.method not in SAFE_METHODS:
+            # the user may still be the lazy session user, loading it queries the database
+            await sync_to_async(self.pin)(request)
+        return response
+
+    @staticmethod
+    def pin(request):
+        # rest framework sets the user it authenticated, api key and basic auth included, on the django request
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            pin_to_primary(user.pk)
@@ -0,0 +1,40 @@
+# Generated by Django 5.1.2 on 2026-10-18 12:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_is_labeled(apps, schema_editor):
+    Sentence = apps.get_model('tagger', 'Sentence')
+    LabeledSentence = apps.get_model('tagger', 'LabeledSentence')
+    Sentence.objects.filter(pk__in=LabeledSentence.objects.values('sentence_id')).update(is_labeled=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tagger', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sentence',
+            name='is_labeled',
+            field=models.BooleanField(default=False, verbose_name='is_labeled'),
+        ),
+        migrations.AlterField(
+            model_name='labeledsentence',
+            name='sentence',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='labeled', to='tagger.sentence'),
+        ),
+        migrations.AlterField(
+            model_name='sentence',
+            name='dataset',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='sentences', to='tagger.dataset'),
+        ),
+        migrations.AddIndex(
+            model_name='sentence',
+            index=models.Index(fields=['dataset', 'is_labeled', 'id'], name='sentence_work_queue_idx'),
+        ),
+        migrations.RunPython(backfill_is_labeled, migrations.RunPython.noop),
+    ]
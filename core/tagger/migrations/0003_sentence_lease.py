@@ -0,0 +1,24 @@
+# Generated by Django 5.1.2 on 2026-10-18 12:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tagger', '0002_sentence_is_labeled'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sentence',
+            name='lease_expires_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='lease_expires_at'),
+        ),
+        migrations.AddField(
+            model_name='sentence',
+            name='leased_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='leases', to='tagger.operator'),
+        ),
+    ]
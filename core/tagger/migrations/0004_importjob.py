@@ -0,0 +1,27 @@
+# Generated by Django 5.1.2 on 2026-10-18 12:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tagger', '0003_sentence_lease'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file', models.FileField(upload_to='imports/', verbose_name='file')),
+                ('status', models.CharField(choices=[('pending', 'pending'), ('running', 'running'), ('done', 'done'), ('failed', 'failed')], default='pending', max_length=16, verbose_name='status')),
+                ('rows_processed', models.PositiveBigIntegerField(default=0, verbose_name='rows_processed')),
+                ('error', models.TextField(blank=True, verbose_name='error')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='created_at')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='updated_at')),
+                ('dataset', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='imports', to='tagger.dataset')),
+            ],
+        ),
+    ]
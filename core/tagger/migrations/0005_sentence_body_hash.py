@@ -0,0 +1,22 @@
+# Generated by Django 5.1.2 on 2026-10-18 12:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tagger', '0004_importjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sentence',
+            name='body_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True, verbose_name='body_hash'),
+        ),
+        migrations.AddConstraint(
+            model_name='sentence',
+            constraint=models.UniqueConstraint(fields=('dataset', 'body_hash'), name='unique_sentence_body_per_dataset'),
+        ),
+    ]
@@ -0,0 +1,58 @@
+from django.db import migrations
+
+POSTGRES_FORWARD = [
+    "ALTER TABLE tagger_sentence ADD COLUMN search_vector tsvector "
+    "GENERATED ALWAYS AS (to_tsvector('simple', body)) STORED",
+    "CREATE INDEX tagger_sentence_search_idx ON tagger_sentence USING gin (search_vector)",
+]
+POSTGRES_BACKWARD = [
+    "DROP INDEX IF EXISTS tagger_sentence_search_idx",
+    "ALTER TABLE tagger_sentence DROP COLUMN IF EXISTS search_vector",
+]
+
+# sqlite drops these triggers whenever django rebuilds tagger_sentence,
+# a migration that does so has to run SQLITE_TRIGGERS again.
+SQLITE_TRIGGERS = [
+    """CREATE TRIGGER IF NOT EXISTS tagger_sentence_fts_insert AFTER INSERT ON tagger_sentence BEGIN
+        INSERT INTO tagger_sentence_fts(rowid, body) VALUES (new.id, new.body);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS tagger_sentence_fts_delete AFTER DELETE ON tagger_sentence BEGIN
+        INSERT INTO tagger_sentence_fts(tagger_sentence_fts, rowid, body) VALUES ('delete', old.id, old.body);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS tagger_sentence_fts_update AFTER UPDATE OF body ON tagger_sentence BEGIN
+        INSERT INTO tagger_sentence_fts(tagger_sentence_fts, rowid, body) VALUES ('delete', old.id, old.body);
+        INSERT INTO tagger_sentence_fts(rowid, body) VALUES (new.id, new.body);
+    END""",
+]
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE tagger_sentence_fts USING fts5(body, content='tagger_sentence', content_rowid='id')",
+    *SQLITE_TRIGGERS,
+    "INSERT INTO tagger_sentence_fts(tagger_sentence_fts) VALUES ('rebuild')",
+]
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS tagger_sentence_fts_insert",
+    "DROP TRIGGER IF EXISTS tagger_sentence_fts_delete",
+    "DROP TRIGGER IF EXISTS tagger_sentence_fts_update",
+    "DROP TABLE IF EXISTS tagger_sentence_fts",
+]
+
+
+def run(statements_by_vendor):
+    def operation(apps, schema_editor):
+        for statement in statements_by_vendor.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tagger', '0005_sentence_body_hash'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({'postgresql': POSTGRES_FORWARD, 'sqlite': SQLITE_FORWARD}),
+            run({'postgresql': POSTGRES_BACKWARD, 'sqlite': SQLITE_BACKWARD}),
+        ),
+    ]
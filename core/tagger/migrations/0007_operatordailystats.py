@@ -0,0 +1,46 @@
+# Generated by Django 5.1.2 on 2026-10-18 12:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+
+
+def backfill_daily_stats(apps, schema_editor):
+    LabeledSentence = apps.get_model('tagger', 'LabeledSentence')
+    OperatorDailyStats = apps.get_model('tagger', 'OperatorDailyStats')
+    # labels of sentences without a dataset have no row to go to
+    rows = (LabeledSentence.objects.filter(sentence__dataset__isnull=False).annotate(date=TruncDate('created_at'))
+            .values('date', 'operator_id', 'sentence__dataset_id', 'tag_id').annotate(count=Count('id')))
+    OperatorDailyStats.objects.bulk_create(
+        (OperatorDailyStats(date=row['date'], operator_id=row['operator_id'], dataset_id=row['sentence__dataset_id'],
+                            tag_id=row['tag_id'], count=row['count']) for row in rows),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tagger', '0006_sentence_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OperatorDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='date')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='count')),
+                ('dataset', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='tagger.dataset')),
+                ('operator', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='tagger.operator')),
+                ('tag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='tagger.tag')),
+            ],
+            options={
+                'verbose_name': 'operator daily stats',
+                'verbose_name_plural': 'operator daily stats',
+                'constraints': [models.UniqueConstraint(fields=('date', 'operator', 'dataset', 'tag'), name='unique_operator_daily_stats')],
+            },
+        ),
+        migrations.RunPython(backfill_daily_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.1.2 on 2026-10-18 12:33
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    Dataset = apps.get_model('tagger', 'Dataset')
+    Tag = apps.get_model('tagger', 'Tag')
+    Sentence = apps.get_model('tagger', 'Sentence')
+    LabeledSentence = apps.get_model('tagger', 'LabeledSentence')
+
+    def count(queryset, field):
+        subquery = queryset.filter(**{field: OuterRef('pk')}).order_by().values(field).annotate(n=Count('pk'))
+        return Coalesce(Subquery(subquery.values('n')), Value(0))
+
+    Dataset.objects.update(
+        sentence_count=count(Sentence.objects.all(), 'dataset'),
+        labeled_count=count(Sentence.objects.filter(is_labeled=True), 'dataset'),
+    )
+    Tag.objects.update(label_count=count(LabeledSentence.objects.all(), 'tag'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tagger', '0007_operatordailystats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataset',
+            name='labeled_count',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='labeled_count'),
+        ),
+        migrations.AddField(
+            model_name='dataset',
+            name='sentence_count',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='sentence_count'),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='label_count',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='label_count'),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
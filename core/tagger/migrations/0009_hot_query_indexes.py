@@ -0,0 +1,51 @@
+# Generated by Django 5.1.2 on 2026-10-18 12:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicate_permissions(apps, schema_editor):
+    HasPermission = apps.get_model('tagger', 'HasPermission')
+    duplicates = (HasPermission.objects.values('operator_id', 'dataset_id')
+                  .annotate(keep=Min('pk'), n=Count('pk')).filter(n__gt=1))
+    for duplicate in duplicates:
+        HasPermission.objects.filter(operator_id=duplicate['operator_id'], dataset_id=duplicate['dataset_id']) \
+            .exclude(pk=duplicate['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tagger', '0008_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_permissions, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='labeledsentence',
+            name='tag',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='tagger.tag'),
+        ),
+        migrations.AlterField(
+            model_name='tag',
+            name='dataset',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='tagger.dataset'),
+        ),
+        migrations.AddIndex(
+            model_name='labeledsentence',
+            index=models.Index(fields=['tag', 'sentence'], name='label_tag_sentence_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='labeledsentence',
+            index=models.Index(fields=['created_at'], name='label_created_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['dataset', 'is_active'], name='tag_dataset_active_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='haspermission',
+            constraint=models.UniqueConstraint(fields=('operator', 'dataset'), name='unique_operator_dataset_permission'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.1.2 on 2026-10-18 12:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tagger', '0009_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ApiKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, verbose_name='name')),
+                ('prefix', models.CharField(editable=False, max_length=8, verbose_name='prefix')),
+                ('key_hash', models.CharField(editable=False, max_length=64, unique=True, verbose_name='key_hash')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='created_at')),
+                ('revoked_at', models.DateTimeField(blank=True, null=True, verbose_name='revoked_at')),
+                ('operator', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='api_keys', to='tagger.operator')),
+            ],
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.1.2 on 2026-10-18 12:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Max, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_current_labels(apps, schema_editor):
+    """
+    every existing label is an addition, the newest one per (sentence, tag) becomes current.
+    """
+    Tag = apps.get_model('tagger', 'Tag')
+    LabeledSentence = apps.get_model('tagger', 'LabeledSentence')
+    CurrentLabel = apps.get_model('tagger', 'CurrentLabel')
+
+    latest = (LabeledSentence.objects.filter(sentence__dataset__isnull=False).order_by().values('sentence_id', 'tag_id', 'sentence__dataset_id')
+              .annotate(label_id=Max('id')))
+    batch = []
+    for row in latest.iterator(chunk_size=1000):
+        batch.append(CurrentLabel(sentence_id=row['sentence_id'], tag_id=row['tag_id'],
+                                  dataset_id=row['sentence__dataset_id'], label_id=row['label_id']))
+        if len(batch) == 1000:
+            CurrentLabel.objects.bulk_create(batch)
+            batch = []
+    CurrentLabel.objects.bulk_create(batch)
+
+    # label_count now counts sentences currently tagged instead of history rows
+    counts = CurrentLabel.objects.filter(tag=OuterRef('pk')).order_by().values('tag').annotate(n=Count('pk'))
+    Tag.objects.update(label_count=Coalesce(Subquery(counts.values('n')), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tagger', '0010_apikey'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='labeledsentence',
+            name='action',
+            field=models.CharField(choices=[('add', 'add'), ('remove', 'remove')], default='add', max_length=8, verbose_name='action'),
+        ),
+        migrations.CreateModel(
+            name='CurrentLabel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dataset', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='tagger.dataset')),
+                ('label', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='current', to='tagger.labeledsentence')),
+                ('sentence', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='current_labels', to='tagger.sentence')),
+                ('tag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='current_labels', to='tagger.tag')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['dataset', 'tag', 'label'], name='current_label_listing_idx')],
+                'constraints': [models.UniqueConstraint(fields=('sentence', 'tag'), name='unique_current_label')],
+            },
+        ),
+        migrations.RunPython(backfill_current_labels, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.2 on 2026-10-18 12:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tagger', '0011_current_labels'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataset',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='deleted_at'),
+        ),
+        migrations.CreateModel(
+            name='PurgeJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dataset_name', models.CharField(max_length=255, verbose_name='dataset_name')),
+                ('status', models.CharField(choices=[('pending', 'pending'), ('running', 'running'), ('done', 'done'), ('failed', 'failed')], default='pending', max_length=16, verbose_name='status')),
+                ('rows_deleted', models.PositiveBigIntegerField(default=0, verbose_name='rows_deleted')),
+                ('error', models.TextField(blank=True, verbose_name='error')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='created_at')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='updated_at')),
+                ('dataset', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='purges', to='tagger.dataset')),
+            ],
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.1.2 on 2026-10-18 13:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tagger', '0012_dataset_soft_delete'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SuggestionState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_label', models.BigIntegerField(default=0, verbose_name='last_label')),
+                ('examples', models.PositiveIntegerField(default=0, verbose_name='examples')),
+                ('document_frequency', models.BinaryField(verbose_name='document_frequency')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='updated_at')),
+                ('dataset', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='suggestion_state', to='tagger.dataset')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TagCentroid',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('vector', models.BinaryField(verbose_name='vector')),
+                ('examples', models.IntegerField(default=0, verbose_name='examples')),
+                ('tag', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='centroid', to='tagger.tag')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TagSuggestion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField(verbose_name='score')),
+                ('sentence', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='suggestions', to='tagger.sentence')),
+                ('tag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='suggestions', to='tagger.tag')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('sentence', 'tag'), name='unique_tag_suggestion')],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.2 on 2026-10-18 13:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tagger', '0013_tag_suggestions'),
+    ]
+
+    operations = [
+        # nullable without a default, sqlite adds the column in place and keeps the search index triggers
+        migrations.AddField(
+            model_name='sentence',
+            name='cluster',
+            field=models.BigIntegerField(blank=True, editable=False, null=True, verbose_name='cluster'),
+        ),
+        migrations.AddIndex(
+            model_name='sentence',
+            index=models.Index(fields=['dataset', 'cluster'], name='sentence_cluster_idx'),
+        ),
+        migrations.CreateModel(
+            name='SentenceBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.BigIntegerField(verbose_name='key')),
+                ('dataset', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='tagger.dataset')),
+                ('sentence', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='buckets', to='tagger.sentence')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['dataset', 'key'], name='sentence_bucket_key_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,68 @@
+"""
+minhash sketches of sentences for near-duplicate detection, numpy only. the module doesn't import django so process
+pool workers can load it on their own.
+
+a sentence is the set of character shingles of its body with case, punctuation and repeated whitespace removed.
+the minhash signature estimates the jaccard similarity of two such sets, and the locality-sensitive hashing keys
+hash bands of the signature: near duplicates share a key with high probability, different sentences rarely do.
+"""
+import re
+import zlib
+from functools import cache
+
+import numpy as np
+
+SHINGLE_SIZE = 5
+
+_TOKEN = re.compile(r'\w+')
+# the products of two values below this prime fit in 64 bits
+_PRIME = 2 ** 31 - 1
+# signatures must agree across processes and over time, the hash functions come from a fixed seed
+_SEED = 1117
+_MIX = np.uint64(0x100000001B3)
+# sentences hashed at once, bounds the (hash functions x shingles) matrix
+_CHUNK = 256
+
+
+def shingles(body: str) -> set[str]:
+    text = ' '.join(_TOKEN.findall(body.casefold()))
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)} or {text}
+
+
+def jaccard(a: set, b: set) -> float:
+    return len(a & b) / len(a | b)
+
+
+@cache
+def _hash_functions(count: int) -> tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(_SEED)
+    return (rng.integers(1, _PRIME, count, dtype=np.uint64)[:, None],
+            rng.integers(0, _PRIME, count, dtype=np.uint64)[:, None])
+
+
+def signatures(bodies: list[str], count: int) -> np.ndarray:
+    """
+    minhash signatures of the bodies, the minimum of `count` universal hash functions over their shingles.
+    """
+    a, b = _hash_functions(count)
+    signature = np.empty((len(bodies), count), dtype=np.uint64)
+    for start in range(0, len(bodies), _CHUNK):
+        hashed = [[zlib.crc32(shingle.encode()) for shingle in shingles(body)]
+                  for body in bodies[start:start + _CHUNK]]
+        values = np.fromiter((value for values in hashed for value in values), dtype=np.uint64) % _PRIME
+        offsets = np.cumsum([0] + [len(values) for values in hashed[:-1]])
+        signature[start:start + len(hashed)] = np.minimum.reduceat((a * values + b) % _PRIME, offsets, axis=1).T
+    return signature
+
+
+def sketch(bodies: list[str], bands: int, rows: int) -> np.ndarray:
+    """
+    lsh keys of the bodies as an int64 array of shape (bodies, bands), each a hash of `rows` signature values.
+    two sentences with jaccard similarity j share at least one key with probability 1 - (1 - j ** rows) ** bands.
+    """
+    signature = signatures(bodies, bands * rows).reshape(len(bodies), bands, rows)
+    # the band number is hashed in, equal values in different bands are different keys
+    keys = np.tile(np.arange(bands, dtype=np.uint64), (len(bodies), 1))
+    for row in range(rows):
+        keys = keys * _MIX + signature[:, :, row]
+    return keys.view(np.int64)
@@ -1,3 +1,6 @@
+import hashlib
+import secrets
+
 from django.utils.translation import gettext_lazy as _
 from django.db import models
 from django.contrib.auth import get_user_model
@@ -7,9 +10,23 @@ from django.contrib.auth import get_user_model
 User = get_user_model()
 
 
+class DatasetManager(models.Manager):
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
 class Dataset(models.Model):
     name = models.CharField(_("name"), max_length=255)
     description = models.TextField(_("description"))
+    # counters maintained with F() updates as sentences and labels are written, see reconcile_counters
+    sentence_count = models.BigIntegerField(_("sentence_count"), default=0, editable=False)
+    labeled_count = models.BigIntegerField(_("labeled_count"), default=0, editable=False)
+    # set when the dataset is deleted, its rows are purged in the background by tagger.tasks.purge_dataset
+    deleted_at = models.DateTimeField(_("deleted_at"), blank=True, null=True, editable=False)
+
+    # deleted datasets are hidden from the default manager, and so from every view and form
+    objects = DatasetManager()
+    all_objects = models.Manager()
 
     def __str__(self):
         return self.name
@@ -29,15 +46,25 @@ class HasPermission(models.Model):
     class Meta:
         verbose_name = "permission"
         verbose_name_plural = "permissions"
+        constraints = [
+            models.UniqueConstraint(fields=['operator', 'dataset'], name='unique_operator_dataset_permission'),
+        ]
 
     def __str__(self):
         return f"{self.dataset.name} - {self.operator.user.username}"
 
 
 class Tag(models.Model):
-    dataset = models.ForeignKey(Dataset, on_delete=models.CASCADE)
+    # indexed by tag_dataset_active_idx
+    dataset = models.ForeignKey(Dataset, on_delete=models.CASCADE, db_index=False)
     name = models.CharField(_("name"), max_length=255)
     is_active = models.BooleanField(_("is_active"), default=False)
+    label_count = models.BigIntegerField(_("label_count"), default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['dataset', 'is_active'], name='tag_dataset_active_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -46,16 +73,248 @@ class Tag(models.Model):
 class Sentence(models.Model):
     dataset = models.ForeignKey(Dataset, on_delete=models.CASCADE, related_name='sentences', blank=True, null=True)
     body = models.TextField(_("body"))
+    # denormalized flag kept in sync by tagger.signals so the unlabeled work queue never scans LabeledSentence
+    is_labeled = models.BooleanField(_("is_labeled"), default=False)
+    # operator currently holding the sentence for labeling, see tagger.utils.claim_sentences
+    leased_by = models.ForeignKey(Operator, on_delete=models.SET_NULL, related_name='leases', blank=True, null=True)
+    lease_expires_at = models.DateTimeField(_("lease_expires_at"), blank=True, null=True, db_index=True)
+    # digest of the normalized body, see hash_body
+    body_hash = models.CharField(_("body_hash"), max_length=64, blank=True, null=True, editable=False)
+    # id of the first sentence of its near-duplicate cluster, None without near duplicates, see tagger.clusters
+    cluster = models.BigIntegerField(_("cluster"), blank=True, null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['dataset', 'is_labeled', 'id'], name='sentence_work_queue_idx'),
+            models.Index(fields=['dataset', 'cluster'], name='sentence_cluster_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['dataset', 'body_hash'], name='unique_sentence_body_per_dataset'),
+        ]
 
     def __str__(self):
         return f"{self.body[:50]}..."
 
+    @staticmethod
+    def hash_body(body: str) -> str:
+        """
+        sha256 of the body with case and whitespace differences removed.
+        """
+        return hashlib.sha256(' '.join(body.split()).casefold().encode('utf-8')).hexdigest()
+
+    def save(self, *args, **kwargs):
+        self.body_hash = self.hash_body(self.body)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'body' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'body_hash'}
+        super().save(*args, **kwargs)
+
+
+class SentenceBucket(models.Model):
+    """
+    locality-sensitive hashing index of near-duplicate sentences, one row per band of a sentence's minhash sketch.
+    """
+    # indexed by sentence_bucket_key_idx
+    dataset = models.ForeignKey(Dataset, on_delete=models.CASCADE, db_index=False)
+    sentence = models.ForeignKey(Sentence, on_delete=models.CASCADE, related_name='buckets')
+    key = models.BigIntegerField(_("key"))
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['dataset', 'key'], name='sentence_bucket_key_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.sentence_id} - {self.key}'
+
 
 class LabeledSentence(models.Model):
+    """
+    append-only label history, every row adds or removes a tag of a sentence. CurrentLabel holds the outcome.
+    """
+    class Action(models.TextChoices):
+        ADD = 'add', _('add')
+        REMOVE = 'remove', _('remove')
+
     sentence = models.ForeignKey(Sentence, on_delete=models.CASCADE, related_name='labeled')
-    tag = models.ForeignKey(Tag, on_delete=models.CASCADE)
+    # indexed by label_tag_sentence_idx
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE, db_index=False)
     operator = models.ForeignKey(Operator, on_delete=models.CASCADE)
+    action = models.CharField(_("action"), max_length=8, choices=Action.choices, default=Action.ADD)
     created_at = models.DateTimeField(_("created_at"), auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['tag', 'sentence'], name='label_tag_sentence_idx'),
+            models.Index(fields=['created_at'], name='label_created_at_idx'),
+        ]
+
     def __str__(self) -> str:
         return f'{self.pk}'
+
+
+class CurrentLabel(models.Model):
+    """
+    tags a sentence has right now, one row per (sentence, tag) pointing at the history row that added it.
+    written in the same transaction as the history, see tagger.utils.labels_created.
+    """
+    # indexed by unique_current_label
+    sentence = models.ForeignKey(Sentence, on_delete=models.CASCADE, related_name='current_labels', db_index=False)
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE, related_name='current_labels')
+    # copied from the sentence so a tag listing is one index range, indexed by current_label_listing_idx
+    dataset = models.ForeignKey(Dataset, on_delete=models.CASCADE, db_index=False)
+    label = models.OneToOneField(LabeledSentence, on_delete=models.CASCADE, related_name='current')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['dataset', 'tag', 'label'], name='current_label_listing_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['sentence', 'tag'], name='unique_current_label'),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.sentence_id} - {self.tag_id}'
+
+
+class SuggestionState(models.Model):
+    """
+    training state of a dataset's tag suggestions, see tagger.suggestions.
+    every (sentence, tag) currently labeled is one training example.
+    """
+    dataset = models.OneToOneField(Dataset, on_delete=models.CASCADE, related_name='suggestion_state')
+    # history rows up to this id are folded into the centroids
+    last_label = models.BigIntegerField(_("last_label"), default=0)
+    examples = models.PositiveIntegerField(_("examples"), default=0)
+    # zlib compressed float32 array, number of examples containing each hashed term
+    document_frequency = models.BinaryField(_("document_frequency"))
+    updated_at = models.DateTimeField(_("updated_at"), auto_now=True)
+
+    def __str__(self) -> str:
+        return f'{self.dataset_id} - {self.last_label}'
+
+
+class TagCentroid(models.Model):
+    """
+    sum of the normalized term frequency vectors of the sentences currently labeled with the tag.
+    """
+    tag = models.OneToOneField(Tag, on_delete=models.CASCADE, related_name='centroid')
+    # zlib compressed float32 array of TAGGER_SUGGESTION_FEATURES hashed terms
+    vector = models.BinaryField(_("vector"))
+    examples = models.IntegerField(_("examples"), default=0)
+
+    def __str__(self) -> str:
+        return f'{self.tag_id} - {self.examples}'
+
+
+class TagSuggestion(models.Model):
+    """
+    the best scoring tags of an unlabeled sentence, replaced every time the dataset is rescored.
+    """
+    # indexed by unique_tag_suggestion
+    sentence = models.ForeignKey(Sentence, on_delete=models.CASCADE, related_name='suggestions', db_index=False)
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE, related_name='suggestions')
+    score = models.FloatField(_("score"))
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['sentence', 'tag'], name='unique_tag_suggestion'),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.sentence_id} - {self.tag_id} ({self.score:.3f})'
+
+
+class OperatorDailyStats(models.Model):
+    """
+    number of labels an operator gave per dataset and tag each day, incremented as labels are written.
+    """
+    date = models.DateField(_("date"))
+    operator = models.ForeignKey(Operator, on_delete=models.CASCADE)
+    dataset = models.ForeignKey(Dataset, on_delete=models.CASCADE)
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE)
+    count = models.PositiveIntegerField(_("count"), default=0)
+
+    class Meta:
+        verbose_name = "operator daily stats"
+        verbose_name_plural = "operator daily stats"
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'operator', 'dataset', 'tag'], name='unique_operator_daily_stats'),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.date} - {self.operator_id} - {self.count}'
+
+
+class ImportJob(models.Model):
+    class Status(models.TextChoices):
+        PENDING = 'pending', _('pending')
+        RUNNING = 'running', _('running')
+        DONE = 'done', _('done')
+        FAILED = 'failed', _('failed')
+
+    dataset = models.ForeignKey(Dataset, on_delete=models.CASCADE, related_name='imports')
+    file = models.FileField(_("file"), upload_to='imports/')
+    status = models.CharField(_("status"), max_length=16, choices=Status.choices, default=Status.PENDING)
+    rows_processed = models.PositiveBigIntegerField(_("rows_processed"), default=0)
+    error = models.TextField(_("error"), blank=True)
+    created_at = models.DateTimeField(_("created_at"), auto_now_add=True)
+    updated_at = models.DateTimeField(_("updated_at"), auto_now=True)
+
+    def __str__(self) -> str:
+        return f'{self.dataset.name} - {self.status}'
+
+
+class PurgeJob(models.Model):
+    """
+    background deletion of a soft deleted dataset, kept after the dataset is gone as a record of it.
+    """
+    class Status(models.TextChoices):
+        PENDING = 'pending', _('pending')
+        RUNNING = 'running', _('running')
+        DONE = 'done', _('done')
+        FAILED = 'failed', _('failed')
+
+    # cleared right before the dataset row itself is deleted
+    dataset = models.ForeignKey(Dataset, on_delete=models.SET_NULL, related_name='purges', blank=True, null=True)
+    dataset_name = models.CharField(_("dataset_name"), max_length=255)
+    status = models.CharField(_("status"), max_length=16, choices=Status.choices, default=Status.PENDING)
+    rows_deleted = models.PositiveBigIntegerField(_("rows_deleted"), default=0)
+    error = models.TextField(_("error"), blank=True)
+    created_at = models.DateTimeField(_("created_at"), auto_now_add=True)
+    updated_at = models.DateTimeField(_("updated_at"), auto_now=True)
+
+    def __str__(self) -> str:
+        return f'{self.dataset_name} - {self.status}'
+
+
+class ApiKey(models.Model):
+    """
+    bearer token of an operator, only a sha256 digest of the key is stored.
+    """
+    operator = models.ForeignKey(Operator, on_delete=models.CASCADE, related_name='api_keys')
+    name = models.CharField(_("name"), max_length=255)
+    # start of the key, lets operators tell their keys apart
+    prefix = models.CharField(_("prefix"), max_length=8, editable=False)
+    key_hash = models.CharField(_("key_hash"), max_length=64, unique=True, editable=False)
+    created_at = models.DateTimeField(_("created_at"), auto_now_add=True)
+    revoked_at = models.DateTimeField(_("revoked_at"), blank=True, null=True)
+
+    def __str__(self) -> str:
+        return f'{self.name} ({self.prefix}...)'
+
+    @staticmethod
+    def hash_key(key: str) -> str:
+        """
+        keys are random so a plain digest is enough, no slow password hashing per request.
+        """
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def generate(cls, operator: Operator, name: str) -> tuple['ApiKey', str]:
+        """
+        creates a key for the operator and returns it with the raw key, which can't be recovered later.
+        """
+        key = secrets.token_urlsafe(32)
+        api_key = cls.objects.create(operator=operator, name=name, prefix=key[:8], key_hash=cls.hash_key(key))
+        return api_key, key
@@ -0,0 +1,31 @@
+from rest_framework.pagination import CursorPagination
+
+
+class SentencePagination(CursorPagination):
+    """
+    keyset pagination over sentence ids, every page is a `WHERE id > cursor ORDER BY id LIMIT n` query.
+    """
+    ordering = 'id'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+class LabeledSentencePagination(CursorPagination):
+    """
+    keyset pagination over label ids.
+    """
+    ordering = 'id'
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+
+class ClusterPagination(CursorPagination):
+    """
+    keyset pagination over cluster ids.
+    """
+    ordering = 'cluster'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
@@ -0,0 +1,61 @@
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.permissions import BasePermission
+
+from .cache import get_version, aget_version
+from .models import Operator, HasPermission
+
+PERMISSIONS_VERSION = 'permissions'
+
+
+def get_operator_permissions(user) -> tuple[int | None, frozenset[int]]:
+    """
+    operator id and permitted dataset ids of the user, cached until any operator, permission or dataset deletion
+    changes.
+    """
+    key = f'tagger:permissions:{user.pk}:{get_version(PERMISSIONS_VERSION)}'
+    permissions = cache.get(key)
+    if permissions is None:
+        operator_id = Operator.objects.filter(user=user).order_by('pk').values_list('pk', flat=True).first()
+        dataset_ids = HasPermission.objects.filter(operator__user=user, dataset__deleted_at__isnull=True).values_list(
+            'dataset_id', flat=True)
+        permissions = (operator_id, frozenset(dataset_ids))
+        cache.set(key, permissions, settings.TAGGER_PERMISSION_CACHE_TIMEOUT)
+    return permissions
+
+
+async def aget_operator_permissions(user) -> tuple[int | None, frozenset[int]]:
+    """
+    async get_operator_permissions, shares its cache entries.
+    """
+    key = f'tagger:permissions:{user.pk}:{await aget_version(PERMISSIONS_VERSION)}'
+    permissions = await cache.aget(key)
+    if permissions is None:
+        operator_id = await Operator.objects.filter(user=user).order_by('pk').values_list('pk', flat=True).afirst()
+        dataset_ids = HasPermission.objects.filter(operator__user=user, dataset__deleted_at__isnull=True).values_list(
+            'dataset_id', flat=True)
+        permissions = (operator_id, frozenset([dataset_id async for dataset_id in dataset_ids]))
+        await cache.aset(key, permissions, settings.TAGGER_PERMISSION_CACHE_TIMEOUT)
+    return permissions
+
+
+def operator_permissions(request) -> tuple[int | None, frozenset[int]]:
+    """
+    same as get_operator_permissions, looked up once per request.
+    """
+    permissions = getattr(request, '_operator_permissions', None)
+    if permissions is None:
+        permissions = get_operator_permissions(request.user)
+        request._operator_permissions = permissions
+    return permissions
+
+
+class HasDatasetPermission(BasePermission):
+    """
+    allows access if the operator has permission on the `dataset_id` of the url.
+    """
+    message = "you don't have permission"
+
+    def has_permission(self, request, view):
+        _, dataset_ids = operator_permissions(request)
+        return view.kwargs.get('dataset_id') in dataset_ids
@@ -0,0 +1,19 @@
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils import encoders
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    renders the same compact utf-8 json as JSONRenderer using orjson, falls back to it when orjson is missing.
+    """
+    _default = encoders.JSONEncoder().default
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        return orjson.dumps(data, default=self._default)
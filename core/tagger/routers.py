@@ -0,0 +1,91 @@
+"""
+read replica routing.
+
+writes and most reads use the primary (default) database. views opting in with ReplicaReadMixin or
+async_api_view(replica=True) read from TAGGER_REPLICA_DATABASE instead, unless the user sent an unsafe request
+in the last TAGGER_REPLICA_PIN_SECONDS: their reads stay on the primary so they always see their own writes.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+# alias reads of the current request go to, None for the primary
+_read_alias = ContextVar('tagger_read_alias', default=None)
+
+
+def _pin_key(user_id: int) -> str:
+    return f'tagger:primary-pin:{user_id}'
+
+
+def pin_to_primary(user_id: int) -> None:
+    """
+    sends the reads of the user to the primary until the replica has caught up with their last write.
+    """
+    cache.set(_pin_key(user_id), True, settings.TAGGER_REPLICA_PIN_SECONDS)
+
+
+def replica_for(user) -> str | None:
+    """
+    alias the reads of the user may go to, None when there is no replica or the user is pinned to the primary.
+    """
+    if not settings.TAGGER_REPLICA_DATABASE or (user.is_authenticated and cache.get(_pin_key(user.pk))):
+        return None
+    return settings.TAGGER_REPLICA_DATABASE
+
+
+async def areplica_for(user) -> str | None:
+    """
+    async replica_for.
+    """
+    if not settings.TAGGER_REPLICA_DATABASE or (user.is_authenticated and await cache.aget(_pin_key(user.pk))):
+        return None
+    return settings.TAGGER_REPLICA_DATABASE
+
+
+def read_alias() -> str:
+    """
+    alias reads of the current request go to, pass it on to work that outlives the request like streamed responses.
+    """
+    return _read_alias.get() or DEFAULT_DB_ALIAS
+
+
+def route_reads(alias: str | None) -> None:
+    _read_alias.set(alias)
+
+
+@contextmanager
+def reading_from(alias: str | None):
+    """
+    routes reads inside the block to the alias, None for the primary.
+    """
+    token = _read_alias.set(alias)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+def fresh_reads(changed_at: int):
+    """
+    reads from the primary while a change made at `changed_at` (time.time_ns(), like the version stamps of
+    tagger.cache) may not have reached the replica yet.
+    """
+    if time.time_ns() - changed_at < settings.TAGGER_REPLICA_PIN_SECONDS * 10 ** 9:
+        return reading_from(None)
+    return reading_from(_read_alias.get())
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replica holds the same rows as the primary
+        return True
@@ -0,0 +1,60 @@
+"""
+full text search over sentence bodies.
+dataset name, description and tag names aren't indexed, searches are scoped to one dataset already
+and labels would have to be reindexed on every labeling write.
+
+the index lives next to tagger_sentence and is maintained by the database on every write
+(see migration 0006_sentence_search_index):
+postgres uses a generated tsvector column with a GIN index, sqlite an FTS5 table kept in sync by triggers.
+other databases fall back to a substring scan.
+"""
+from django.db import connections, router
+
+_POSTGRES_QUERY = """
+    SELECT s.id FROM tagger_sentence s, plainto_tsquery('simple', %s) q
+    WHERE s.dataset_id = %s AND s.is_labeled AND s.search_vector @@ q
+    ORDER BY ts_rank(s.search_vector, q) DESC, s.id
+    LIMIT %s OFFSET %s
+"""
+
+_SQLITE_QUERY = """
+    SELECT s.id FROM tagger_sentence_fts f JOIN tagger_sentence s ON s.id = f.rowid
+    WHERE tagger_sentence_fts MATCH %s AND s.dataset_id = %s AND s.is_labeled
+    ORDER BY f.rank, s.id
+    LIMIT %s OFFSET %s
+"""
+
+_sqlite_index_available = {}
+
+
+def _has_sqlite_index(connection) -> bool:
+    if connection.alias not in _sqlite_index_available:
+        _sqlite_index_available[connection.alias] = 'tagger_sentence_fts' in connection.introspection.table_names()
+    return _sqlite_index_available[connection.alias]
+
+
+def _fts_phrase(text: str) -> str:
+    # quoting makes fts5 treat the input as a phrase instead of query syntax
+    return '"' + text.replace('"', '""') + '"'
+
+
+def search_sentences(dataset_id: int, text: str, limit: int, offset: int = 0) -> list[int]:
+    """
+    ids of labeled sentences in the dataset matching the text, best match first.
+    runs on the database sentence reads are routed to.
+    """
+    from .models import Sentence
+    connection = connections[router.db_for_read(Sentence)]
+    if connection.vendor == 'postgresql':
+        params = [text, dataset_id, limit, offset]
+        query = _POSTGRES_QUERY
+    elif connection.vendor == 'sqlite' and _has_sqlite_index(connection):
+        params = [_fts_phrase(text), dataset_id, limit, offset]
+        query = _SQLITE_QUERY
+    else:
+        sentences = Sentence.objects.filter(dataset_id=dataset_id, is_labeled=True, body__icontains=text)
+        return list(sentences.order_by('id').values_list('id', flat=True)[offset:offset + limit])
+
+    with connection.cursor() as cursor:
+        cursor.execute(query, params)
+        return [row[0] for row in cursor.fetchall()]
@@ -1,7 +1,11 @@
+from functools import cache
+from operator import itemgetter
+
+from django.conf import settings
 from django.template.context_processors import request
 from rest_framework import serializers
 
-from .models import Dataset, Tag, Operator, HasPermission, Sentence, LabeledSentence
+from .models import Dataset, Tag, Operator, HasPermission, Sentence, LabeledSentence, ImportJob, ApiKey, PurgeJob
 
 
 class DatasetSerializer(serializers.ModelSerializer):
@@ -32,6 +36,17 @@ class SentenceSerializer(serializers.ModelSerializer):
     class Meta:
         model = Sentence
         fields = '__all__'
+        read_only_fields = ('is_labeled', 'leased_by', 'lease_expires_at')
+
+    def validate(self, attrs):
+        body = attrs.get('body', getattr(self.instance, 'body', None))
+        dataset = attrs.get('dataset', getattr(self.instance, 'dataset', None))
+        duplicates = Sentence.objects.filter(dataset=dataset, body_hash=Sentence.hash_body(body))
+        if self.instance is not None:
+            duplicates = duplicates.exclude(pk=self.instance.pk)
+        if dataset is not None and duplicates.exists():
+            raise serializers.ValidationError("this sentence already exists in the dataset")
+        return attrs
 
 
 class LabeledSentenceSerializer(serializers.ModelSerializer):
@@ -40,6 +55,103 @@ class LabeledSentenceSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+class LabelingOptionsSerializer(serializers.Serializer):
+    cluster = serializers.BooleanField(default=False)
+
+
+class ClaimSentencesSerializer(serializers.Serializer):
+    size = serializers.IntegerField(min_value=1, max_value=500, default=50)
+    dataset = serializers.IntegerField(required=False)
+
+
+class LabelPairSerializer(serializers.Serializer):
+    sentence = serializers.IntegerField()
+    tag = serializers.IntegerField()
+    action = serializers.ChoiceField(choices=LabeledSentence.Action.choices, default=LabeledSentence.Action.ADD)
+
+
+class BulkLabelSerializer(serializers.Serializer):
+    labels = LabelPairSerializer(many=True, allow_empty=False, max_length=settings.TAGGER_BULK_LABEL_MAX)
+
+
 class SentenceCSVSerializer(serializers.Serializer):
     file = serializers.FileField()
 
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ImportJob
+        fields = ('id', 'dataset', 'status', 'rows_processed', 'error', 'created_at', 'updated_at')
+
+
+class PurgeJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = PurgeJob
+        fields = ('id', 'dataset', 'dataset_name', 'status', 'rows_deleted', 'error', 'created_at', 'updated_at')
+
+
+class ApiKeySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ApiKey
+        fields = ('id', 'operator', 'name', 'prefix', 'created_at', 'revoked_at')
+        read_only_fields = ('operator', 'revoked_at')
+
+
+class RowEncoder:
+    """
+    builds the same dicts as a ModelSerializer straight from database rows, skipping the per row field graph.
+    supports serializers made of plain model fields and primary key relations.
+    """
+
+    def __init__(self, serializer_class):
+        model = serializer_class.Meta.model
+        fields = serializer_class().fields
+        self.names = tuple(fields)
+        self.columns = tuple(model._meta.get_field(field.source).attname for field in fields.values())
+        # only fields whose representation differs from the database value need a call per row
+        self.converters = tuple(
+            (name, field.to_representation) for name, field in fields.items()
+            if isinstance(field, (serializers.DateTimeField, serializers.DateField, serializers.TimeField,
+                                  serializers.DecimalField, serializers.UUIDField))
+        )
+        self._get_columns = itemgetter(*self.columns)
+
+    @classmethod
+    @cache
+    def for_serializer(cls, serializer_class):
+        return cls(serializer_class)
+
+    def values_list(self, queryset):
+        return queryset.values_list(*self.columns)
+
+    def values(self, queryset):
+        return queryset.values(*self.columns)
+
+    def encode(self, rows) -> list[dict]:
+        """
+        encodes values_list() tuples.
+        """
+        names = self.names
+        data = [dict(zip(names, row)) for row in rows]
+        self._convert(data)
+        return data
+
+    def encode_dicts(self, rows) -> list[dict]:
+        """
+        encodes values() dicts, as returned by a paginator.
+        """
+        names = self.names
+        get_columns = self._get_columns
+        if len(names) == 1:
+            data = [{names[0]: get_columns(row)} for row in rows]
+        else:
+            data = [dict(zip(names, get_columns(row))) for row in rows]
+        self._convert(data)
+        return data
+
+    def _convert(self, data: list[dict]) -> None:
+        for name, to_representation in self.converters:
+            for item in data:
+                value = item[name]
+                if value is not None:
+                    item[name] = to_representation(value)
@@ -0,0 +1,106 @@
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from . import clusters, events, suggestions
+from .cache import bump_version, bump_dataset_versions
+from .authentication import API_KEYS_VERSION
+from .models import LabeledSentence, HasPermission, Operator, Tag, Sentence, Dataset, ApiKey, User, CurrentLabel
+from .permissions import PERMISSIONS_VERSION
+from .utils import labels_created, rebuild_current_labels
+
+
+@receiver(post_save, sender=LabeledSentence)
+def label_saved(sender, instance, created, **kwargs):
+    """
+    updates the current labels of the sentence, so it leaves or returns to the work queue.
+    """
+    if created:
+        labels_created([instance])
+
+
+@receiver(post_delete, sender=LabeledSentence)
+def label_deleted(sender, instance, **kwargs):
+    """
+    history rows are only deleted by hand or with their sentence or tag, the current label falls back
+    to the newest remaining row.
+    """
+    rebuild_current_labels([(instance.sentence_id, instance.tag_id)])
+    dataset_ids = list(Sentence.objects.filter(pk=instance.sentence_id).values_list('dataset_id', flat=True))
+    bump_dataset_versions(dataset_ids)
+    suggestions.reset(dataset_ids)
+
+
+@receiver(post_save, sender=CurrentLabel)
+def current_label_saved(sender, instance, created, **kwargs):
+    # bulk writes in labels_created adjust the count themselves
+    if created:
+        Tag.objects.filter(pk=instance.tag_id).update(label_count=F('label_count') + 1)
+
+
+@receiver(post_delete, sender=CurrentLabel)
+def current_label_deleted(sender, instance, **kwargs):
+    Tag.objects.filter(pk=instance.tag_id).update(label_count=F('label_count') - 1)
+
+
+@receiver(post_save, sender=Sentence)
+def sentence_saved(sender, instance, created, update_fields=None, **kwargs):
+    """
+    counts new sentences and keeps the near-duplicate index up to date.
+    """
+    if instance.dataset_id is None:
+        return
+    if created:
+        Dataset.objects.filter(pk=instance.dataset_id).update(sentence_count=F('sentence_count') + 1)
+        events.publish(events.SENTENCES_ADDED, instance.dataset_id, count=1)
+        clusters.index_sentences(instance.dataset_id, [instance.pk])
+    elif update_fields is None or 'body' in update_fields:
+        clusters.reindex_sentence(instance)
+
+
+@receiver(post_delete, sender=Sentence)
+def sentence_deleted(sender, instance, **kwargs):
+    """
+    labeled_count is already adjusted by the deletion of the sentence's labels.
+    """
+    if instance.dataset_id is not None:
+        Dataset.objects.filter(pk=instance.dataset_id).update(sentence_count=F('sentence_count') - 1)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tag_changed(sender, instance, signal, **kwargs):
+    """
+    drops cached listings of the tag's dataset and tells its operators.
+    """
+    bump_dataset_versions([instance.dataset_id])
+    if instance.dataset_id is not None:
+        events.publish(events.TAG_CHANGED, instance.dataset_id, tag=instance.pk, deleted=signal is post_delete)
+
+
+@receiver(post_save, sender=HasPermission)
+@receiver(post_delete, sender=HasPermission)
+@receiver(post_save, sender=Operator)
+@receiver(post_delete, sender=Operator)
+def permissions_changed(sender, **kwargs):
+    """
+    drops every cached operator permission set.
+    """
+    bump_version(PERMISSIONS_VERSION)
+
+
+@receiver(post_save, sender=ApiKey)
+@receiver(post_delete, sender=ApiKey)
+@receiver(post_delete, sender=User)
+def api_keys_changed(sender, **kwargs):
+    """
+    drops the cached api key principals of every process.
+    """
+    bump_version(API_KEYS_VERSION)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, update_fields=None, **kwargs):
+    # logins only touch last_login, keep the principals cached then
+    if update_fields is None or set(update_fields) != {'last_login'}:
+        bump_version(API_KEYS_VERSION)
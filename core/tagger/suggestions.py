@@ -0,0 +1,258 @@
+"""
+tag suggestions for unlabeled sentences from a tf-idf nearest centroid model per dataset, numpy only.
+
+sentences are hashed bags of words: every token goes to one of TAGGER_SUGGESTION_FEATURES dimensions, so there is
+no vocabulary to maintain. a tag's centroid is the sum of the normalized term frequency vectors of the sentences
+labeled with it, and the document frequencies count the same examples. both are sums, so new label history is
+folded in by adding the sentences whose label was added and subtracting those whose label was removed.
+scoring weights sentences and centroids by idf and ranks tags by cosine similarity.
+"""
+import logging
+import re
+import zlib
+from collections import defaultdict
+from datetime import timedelta
+from itertools import takewhile
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .models import LabeledSentence, Sentence, SuggestionState, TagCentroid, TagSuggestion
+
+logger = logging.getLogger(__name__)
+
+_TOKEN = re.compile(r'\w+')
+
+
+def _pack(array: np.ndarray) -> bytes:
+    return zlib.compress(array.astype(np.float32).tobytes())
+
+
+def _unpack(data, features: int) -> np.ndarray:
+    if not data:
+        return np.zeros(features, dtype=np.float32)
+    return np.frombuffer(zlib.decompress(data), dtype=np.float32).copy()
+
+
+def vectorize(bodies, features: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    sublinear term frequencies of hashed tokens as a csr matrix (indptr, indices, data), rows have unit length.
+    """
+    rows, tokens = [], []
+    for row, body in enumerate(bodies):
+        words = _TOKEN.findall(body.casefold())
+        tokens += [zlib.crc32(word.encode()) for word in words]
+        rows += [row] * len(words)
+    cells, counts = np.unique(np.array(rows, dtype=np.int64) * features
+                              + np.array(tokens, dtype=np.int64) % features, return_counts=True)
+    row, indices = cells // features, cells % features
+    data = 1 + np.log(counts)
+    data /= np.sqrt(np.bincount(row, data ** 2, len(bodies)))[row]
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(row, minlength=len(bodies)))])
+    return indptr, indices, data
+
+
+def _expand(indptr: np.ndarray, rows: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    for each of the given csr rows, its repeat index and the positions of its entries.
+    """
+    counts = indptr[rows + 1] - indptr[rows]
+    ends = np.cumsum(counts)
+    positions = np.repeat(indptr[rows], counts) + np.arange(ends[-1] if len(ends) else 0) \
+        - np.repeat(ends - counts, counts)
+    return np.repeat(np.arange(len(rows)), counts), positions
+
+
+def _label_changes(dataset_id: int, after: int, batch_size: int, settled) -> tuple[int | None, dict]:
+    """
+    +1/-1 per (sentence, tag) whose current label appeared/disappeared in the next batch of history rows created
+    before `settled`, with the id of the last row of the batch.
+    """
+    rows = list(LabeledSentence.objects.filter(sentence__dataset_id=dataset_id, pk__gt=after).order_by('pk')
+                .values_list('pk', 'sentence_id', 'tag_id', 'created_at')[:batch_size])
+    # the batch stops at the first recent row, an older id of a transaction still running may not be visible yet
+    rows = list(takewhile(lambda row: row[3] < settled, rows))
+    if not rows:
+        return None, {}
+    last = rows[-1][0]
+    pairs = {(sentence_id, tag_id) for _, sentence_id, tag_id, _ in rows}
+    before, now = {}, {}
+    history = (LabeledSentence.objects.filter(sentence_id__in={sentence_id for sentence_id, _ in pairs}, pk__lte=last)
+               .order_by('pk').values_list('pk', 'sentence_id', 'tag_id', 'action'))
+    for pk, sentence_id, tag_id, action in history:
+        if (sentence_id, tag_id) in pairs:
+            now[sentence_id, tag_id] = action == LabeledSentence.Action.ADD
+            if pk <= after:
+                before[sentence_id, tag_id] = now[sentence_id, tag_id]
+    changes = {pair: int(now[pair]) - int(before.get(pair, False)) for pair in pairs}
+    return last, {pair: change for pair, change in changes.items() if change}
+
+
+def train(dataset_id: int, batch_size: int | None = None) -> int:
+    """
+    folds label history written since the last run into the centroids, one transaction per batch of rows.
+    rows younger than TAGGER_SUGGESTION_SETTLE_SECONDS wait for the next run. returns the number of examples added
+    or removed.
+    """
+    batch_size = batch_size or settings.TAGGER_BULK_BATCH_SIZE
+    features = settings.TAGGER_SUGGESTION_FEATURES
+    changed = 0
+    settled = timezone.now() - timedelta(seconds=settings.TAGGER_SUGGESTION_SETTLE_SECONDS)
+    while True:
+        with transaction.atomic():
+            state, _ = SuggestionState.objects.select_for_update().get_or_create(dataset_id=dataset_id)
+            last, changes = _label_changes(dataset_id, state.last_label, batch_size, settled)
+            if last is None:
+                return changed
+            if changes:
+                sentence_ids = sorted({sentence_id for sentence_id, _ in changes})
+                bodies = dict(Sentence.objects.filter(pk__in=sentence_ids).values_list('pk', 'body'))
+                indptr, indices, data = vectorize([bodies[pk] for pk in sentence_ids], features)
+                tag_ids = sorted({tag_id for _, tag_id in changes})
+                centroids = {centroid.tag_id: centroid for centroid in TagCentroid.objects.filter(tag_id__in=tag_ids)}
+                vectors = np.stack([_unpack(centroids[tag_id].vector if tag_id in centroids else None, features)
+                                    for tag_id in tag_ids])
+                document_frequency = _unpack(state.document_frequency, features)
+
+                row = np.searchsorted(sentence_ids, [sentence_id for sentence_id, _ in changes])
+                tag = np.searchsorted(tag_ids, [tag_id for _, tag_id in changes])
+                sign = np.fromiter(changes.values(), dtype=np.float32)
+                example, positions = _expand(indptr, row)
+                np.add.at(vectors, (tag[example], indices[positions]), sign[example] * data[positions])
+                np.add.at(document_frequency, indices[positions], sign[example])
+
+                examples = np.bincount(tag, sign, len(tag_ids))
+                for k, tag_id in enumerate(tag_ids):
+                    centroid = centroids.get(tag_id) or TagCentroid(tag_id=tag_id)
+                    centroid.vector = _pack(vectors[k])
+                    centroid.examples += int(examples[k])
+                    centroid.save()
+                state.document_frequency = _pack(document_frequency)
+                state.examples += int(sign.sum())
+                changed += len(changes)
+            state.last_label = last
+            state.save()
+
+
+def score(dataset_id: int, batch_size: int | None = None) -> int:
+    """
+    replaces the suggestions of every unlabeled sentence of the dataset with its top scoring active tags,
+    batch by batch. returns the number of sentences scored.
+    """
+    batch_size = batch_size or settings.TAGGER_BULK_BATCH_SIZE
+    features = settings.TAGGER_SUGGESTION_FEATURES
+    TagSuggestion.objects.filter(sentence__dataset_id=dataset_id, sentence__is_labeled=True).delete()
+    state = SuggestionState.objects.filter(dataset_id=dataset_id).first()
+    centroids = list(TagCentroid.objects.filter(tag__dataset_id=dataset_id, tag__is_active=True, examples__gt=0)
+                     .order_by('tag_id'))
+    if state is None or not centroids:
+        TagSuggestion.objects.filter(sentence__dataset_id=dataset_id).delete()
+        return 0
+
+    idf = np.log((1 + state.examples) / (1 + _unpack(state.document_frequency, features))) + 1
+    weights = np.stack([_unpack(centroid.vector, features) for centroid in centroids]) * idf
+    norms = np.linalg.norm(weights, axis=1, keepdims=True)
+    weights /= np.where(norms > 0, norms, 1)
+    tag_ids = np.array([centroid.tag_id for centroid in centroids])
+    top_k = min(settings.TAGGER_SUGGESTION_TOP_K, len(centroids))
+
+    scored = 0
+    last_id = 0
+    while True:
+        batch = list(Sentence.objects.filter(dataset_id=dataset_id, is_labeled=False, pk__gt=last_id)
+                     .order_by('pk').values_list('pk', 'body')[:batch_size])
+        if not batch:
+            return scored
+        last_id = batch[-1][0]
+        indptr, indices, data = vectorize([body for _, body in batch], features)
+        row = np.repeat(np.arange(len(batch)), np.diff(indptr))
+        data = data * idf[indices]
+        data /= np.sqrt(np.bincount(row, data ** 2, len(batch)))[row]
+        # cosine similarity of every sentence with every centroid, sentences without tokens score zero
+        scores = np.zeros((len(batch), len(centroids)))
+        filled = np.flatnonzero(np.diff(indptr))
+        if len(filled):
+            scores[filled] = np.add.reduceat(weights[:, indices] * data, indptr[filled], axis=1).T
+        best = np.argsort(-scores, axis=1)[:, :top_k]
+
+        suggestions = [
+            TagSuggestion(sentence_id=pk, tag_id=int(tag_ids[k]), score=float(scores[i, k]))
+            for i, (pk, _) in enumerate(batch) for k in best[i] if scores[i, k] > 0
+        ]
+        with transaction.atomic():
+            TagSuggestion.objects.filter(sentence_id__in=[pk for pk, _ in batch]).delete()
+            TagSuggestion.objects.bulk_create(suggestions, ignore_conflicts=True)
+        scored += len(batch)
+
+
+def update_suggestions(dataset_id: int) -> tuple[int, int]:
+    """
+    trains on the new labels of the dataset and rescores its unlabeled sentences.
+    """
+    return train(dataset_id), score(dataset_id)
+
+
+def reset(dataset_ids) -> None:
+    """
+    drops the training state of the datasets, the next update trains from scratch.
+    needed when label history is deleted or moved instead of appended to.
+    """
+    SuggestionState.objects.filter(dataset_id__in=dataset_ids).delete()
+    TagCentroid.objects.filter(tag__dataset_id__in=dataset_ids).delete()
+
+
+def _pending_key(dataset_id: int) -> str:
+    return f'tagger:suggestions:pending:{dataset_id}'
+
+
+def _enqueue(dataset_id: int) -> None:
+    from .tasks import update_tag_suggestions
+    try:
+        update_tag_suggestions.delay(dataset_id)
+    except Exception:
+        # suggestions catch up on the next trigger, the labels that triggered them are already saved
+        logger.exception('could not schedule tag suggestions of dataset %s', dataset_id)
+
+
+def labels_added(counts: dict[int, int]) -> None:
+    """
+    counts new labels per dataset and schedules an update of the suggestions of datasets that gathered
+    TAGGER_SUGGESTION_RETRAIN_EVERY of them, once the current transaction commits.
+    """
+    for dataset_id, count in counts.items():
+        key = _pending_key(dataset_id)
+        cache.add(key, 0, timeout=None)
+        if cache.incr(key, count) >= settings.TAGGER_SUGGESTION_RETRAIN_EVERY:
+            cache.set(key, 0, timeout=None)
+            transaction.on_commit(lambda dataset_id=dataset_id: _enqueue(dataset_id))
+
+
+def attach_suggestions(items: list[dict]) -> list[dict]:
+    """
+    adds the suggested tags, best first, to serialized sentences.
+    """
+    suggestions = defaultdict(list)
+    rows = (TagSuggestion.objects.filter(sentence_id__in=[item['id'] for item in items], tag__is_active=True)
+            .order_by('sentence_id', '-score').values_list('sentence_id', 'tag_id', 'score'))
+    for sentence_id, tag_id, value in rows:
+        suggestions[sentence_id].append({'tag': tag_id, 'score': round(value, 4)})
+    for item in items:
+        item['suggestions'] = suggestions[item['id']]
+    return items
+
+
+async def aattach_suggestions(items: list[dict]) -> list[dict]:
+    """
+    async attach_suggestions.
+    """
+    suggestions = defaultdict(list)
+    rows = (TagSuggestion.objects.filter(sentence_id__in=[item['id'] for item in items], tag__is_active=True)
+            .order_by('sentence_id', '-score').values_list('sentence_id', 'tag_id', 'score'))
+    async for sentence_id, tag_id, value in rows:
+        suggestions[sentence_id].append({'tag': tag_id, 'score': round(value, 4)})
+    for item in items:
+        item['suggestions'] = suggestions[item['id']]
+    return items
@@ -1,6 +1,89 @@
 from celery import shared_task
+from django.conf import settings
 from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .clusters import index_sentences
+from .models import ImportJob, PurgeJob, Dataset, Sentence
+from .suggestions import update_suggestions
+from .utils import release_expired_leases as release_leases, read_sentences, decode_lines, batched, \
+    bulk_create_sentences, purge_dataset_rows
+
 
 @shared_task
 def generate_daily_report():
-    call_command('generate_report')
\ No newline at end of file
+    call_command('generate_report')
+
+
+@shared_task
+def release_expired_leases():
+    return release_leases()
+
+
+@shared_task
+def update_tag_suggestions(dataset_id):
+    """
+    folds new labels of the dataset into its tag centroids and rescores its unlabeled sentences.
+    """
+    if Dataset.objects.filter(pk=dataset_id).exists():
+        update_suggestions(dataset_id)
+
+
+@shared_task
+def import_sentences(job_id):
+    """
+    inserts the sentences of an uploaded csv batch by batch, committing and reporting progress after each batch.
+    the sentences are added to the near-duplicate index of the dataset as they are inserted.
+    """
+    job = ImportJob.objects.select_related('dataset').get(pk=job_id)
+    jobs = ImportJob.objects.filter(pk=job_id)
+    jobs.update(status=ImportJob.Status.RUNNING, updated_at=timezone.now())
+    try:
+        with job.file.open('rb') as file:
+            sentences = read_sentences(job.dataset, decode_lines(file))
+            for batch in batched(sentences, settings.TAGGER_BULK_BATCH_SIZE):
+                if not Dataset.objects.filter(pk=job.dataset_id).exists():
+                    raise ValueError('the dataset was deleted')
+                bulk_create_sentences(batch)
+                # new sentences join the clusters of their near duplicates batch by batch
+                index_sentences(job.dataset_id, Sentence.objects.filter(
+                    dataset_id=job.dataset_id, body_hash__in=[sentence.body_hash for sentence in batch]).values('pk'))
+                jobs.update(rows_processed=F('rows_processed') + len(batch), updated_at=timezone.now())
+    except Exception as e:
+        jobs.update(status=ImportJob.Status.FAILED, error=str(e), updated_at=timezone.now())
+        raise
+    jobs.update(status=ImportJob.Status.DONE, updated_at=timezone.now())
+    job.file.delete(save=False)
+
+
+@shared_task
+def purge_dataset(job_id):
+    """
+    deletes a soft deleted dataset batch by batch, reporting progress after each batch.
+    running it again after a failure picks up the remaining rows.
+    """
+    job = PurgeJob.objects.get(pk=job_id)
+    if job.dataset_id is None:
+        return
+    jobs = PurgeJob.objects.filter(pk=job_id)
+    jobs.update(status=PurgeJob.Status.RUNNING, error='', updated_at=timezone.now())
+    try:
+        while True:
+            # another pass catches rows written by requests that started before the dataset was hidden
+            deleted = 0
+            for count in purge_dataset_rows(job.dataset_id):
+                jobs.update(rows_deleted=F('rows_deleted') + count, updated_at=timezone.now())
+                deleted += count
+            if not deleted:
+                break
+        with transaction.atomic():
+            jobs.update(dataset=None, status=PurgeJob.Status.DONE, updated_at=timezone.now())
+            # the dataset has no rows left, a plain delete doesn't collect cascades nor send signals for it
+            with connection.cursor() as cursor:
+                cursor.execute('DELETE FROM %s WHERE id = %%s' % connection.ops.quote_name(Dataset._meta.db_table),
+                               [job.dataset_id])
+    except Exception as e:
+        jobs.update(status=PurgeJob.Status.FAILED, error=str(e), updated_at=timezone.now())
+        raise
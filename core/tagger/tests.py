@@ -1,3 +1,993 @@
-from django.test import TestCase
+import asyncio
+import csv
+import gzip
+import io
+import json
+import tempfile
+import time
+import zlib
+from contextlib import chdir
+from datetime import timedelta
+from importlib import import_module
+from pathlib import Path
+from unittest import skipUnless
+from unittest.mock import patch
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import async_to_sync, sync_to_async
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, connections, IntegrityError, router
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from . import benchmark, events, utils
+from .async_views import stream_events
+from .cache import get_version
+from .clusters import update_clusters, reset as reset_clusters
+from .metrics import registry
+from .models import Dataset, Tag, Operator, HasPermission, Sentence, LabeledSentence, ApiKey, CurrentLabel, PurgeJob, \
+    ImportJob, OperatorDailyStats, SuggestionState, TagCentroid
+from .permissions import PERMISSIONS_VERSION
+from .renderers import ORJSONRenderer
+from .routers import fresh_reads, reading_from, replica_for
+from .search import search_sentences
+from .serializers import LabeledSentenceSerializer, RowEncoder, SentenceSerializer, TagSerializer
+from .suggestions import train, update_suggestions, reset as reset_suggestions
+from .tasks import import_sentences
+from .utils import bulk_create_sentences, create_labels, release_expired_leases
+from .views import LabelingSentenceAPIView
+
+User = get_user_model()
+
+# with SQL_REPLICA_DATABASE set the replica mirrors the test database, listing, search and stats views read from it
+DATABASES = {'default', 'replica'} if settings.TAGGER_REPLICA_DATABASE else {'default'}
+
+
+class RoutedTestCase(TestCase):
+    databases = DATABASES
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # a mirror has a connection of its own that can't see the rows of the test transaction, routed reads
+        # share the primary's one here. ReplicaReadTests reads through the replica connection itself
+        if 'replica' in cls.databases:
+            cls.replica_connection = connections['replica']
+            connections['replica'] = connections['default']
+
+    @classmethod
+    def tearDownClass(cls):
+        if 'replica' in cls.databases:
+            connections['replica'] = cls.replica_connection
+        super().tearDownClass()
+
+
+class TaggerTestCase(RoutedTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # superuser so admin only views can be checked with the same operator
+        cls.user = User.objects.create_superuser('operator', '', 'password')
+        cls.operator = Operator.objects.create(user=cls.user)
+        cls.dataset = Dataset.objects.create(name='dataset', description='dataset')
+        cls.tag = Tag.objects.create(dataset=cls.dataset, name='tag', is_active=True)
+        HasPermission.objects.create(operator=cls.operator, dataset=cls.dataset)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def add_sentences(self, count, labeled=0):
+        """
+        adds `count` sentences to the dataset and labels `labeled` of them.
+        """
+        start = Sentence.objects.count()
+        bodies = (f'sentence number {i}' for i in range(start, start + count))
+        bulk_create_sentences(Sentence(dataset=self.dataset, body=body, body_hash=Sentence.hash_body(body))
+                              for body in bodies)
+        sentences = Sentence.objects.filter(dataset=self.dataset, is_labeled=False).order_by('pk')[:labeled]
+        create_labels([LabeledSentence(sentence=sentence, tag=self.tag, operator=self.operator)
+                       for sentence in sentences])
+
+
+class QueryCountTests(TaggerTestCase):
+    """
+    hot views run the same number of queries whatever the size of the dataset.
+    the counts include the session and user lookups of the test client and a cold permission cache.
+    """
+
+    def assertConstantQueries(self, url, num):
+        for size in (10, 100):
+            self.add_sentences(size, labeled=size // 2)
+            cache.clear()
+            with self.assertNumQueries(num):
+                response = self.client.get(url)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+            self.assertEqual(response.status_code, 200)
+
+    def test_tag_list(self):
+        self.assertConstantQueries(reverse('tag-list', args=[self.dataset.pk]), 5)
+
+    def test_category(self):
+        self.assertConstantQueries(reverse('category', args=[self.dataset.pk, self.tag.pk]), 5)
+
+    def test_search(self):
+        self.client.get(reverse('search', args=[self.dataset.pk, 'sentence']))
+        self.assertConstantQueries(reverse('search', args=[self.dataset.pk, 'sentence']), 6)
+
+    def test_unlabeled_queue(self):
+        # the page and its tag suggestions
+        self.assertConstantQueries(reverse('labeling'), 6)
+
+    def test_stats(self):
+        self.assertConstantQueries(reverse('dataset-stats', args=[self.dataset.pk]), 5)
+
+    def test_permission_cache(self):
+        url = reverse('tag-list', args=[self.dataset.pk])
+        self.client.get(url)
+        # session and user only, permissions and the response come from the cache
+        with self.assertNumQueries(2):
+            self.client.get(url)
+
+    def test_bulk_labeling(self):
+        self.add_sentences(101, labeled=1)
+        tags = [self.tag] + [Tag.objects.create(dataset=self.dataset, name=f'tag {i}', is_active=True)
+                             for i in range(9)]
+        sentence_ids = Sentence.objects.filter(is_labeled=False).values_list('pk', flat=True)
+        # the same number of queries for more labels and more tags
+        for ids, tag_count in ((sentence_ids[:10], 1), (sentence_ids[10:100], 10)):
+            cache.clear()
+            labels = [{'sentence': pk, 'tag': tags[i % tag_count].pk} for i, pk in enumerate(ids)]
+            with self.assertNumQueries(18):
+                response = self.client.post(reverse('labeling-bulk'), {'labels': labels},
+                                            content_type='application/json')
+            self.assertEqual(response.json()['created'], len(ids))
+        # one label before, 10 then 8 of the 80 on the first tag
+        self.assertEqual(OperatorDailyStats.objects.get(tag=self.tag).count, 19)
+        self.assertEqual(sorted(Tag.objects.values_list('label_count', flat=True)), [8] * 9 + [19])
+
+
+@skipUnless(connection.vendor == 'sqlite', 'query plans are checked on sqlite')
+class QueryPlanTests(TaggerTestCase):
+    """
+    the main query of every hot view searches an index instead of scanning its table.
+    """
+
+    def assertUsesIndex(self, queryset, table):
+        plan = queryset.explain()
+        self.assertIn(f'SEARCH {table} USING', plan)
+        self.assertNotIn(f'SCAN {table}', plan)
+
+    def test_unlabeled_queue(self):
+        queryset = Sentence.objects.filter(dataset__id__in=[self.dataset.pk], is_labeled=False).order_by('id')
+        self.assertUsesIndex(queryset, 'tagger_sentence')
+
+    def test_category(self):
+        queryset = LabeledSentence.objects.filter(current__dataset=self.dataset.pk, current__tag=self.tag.pk)
+        self.assertUsesIndex(queryset.order_by('id'), 'tagger_currentlabel')
+
+    def test_tag_list(self):
+        self.assertUsesIndex(Tag.objects.filter(dataset__pk=self.dataset.pk, is_active=True), 'tagger_tag')
+
+    def test_permissions(self):
+        queryset = HasPermission.objects.filter(operator__user=self.user).values_list('dataset_id', flat=True)
+        self.assertUsesIndex(queryset, 'tagger_haspermission')
+
+    def test_report(self):
+        now = timezone.now()
+        self.assertUsesIndex(LabeledSentence.objects.filter(created_at__range=(now, now)), 'tagger_labeledsentence')
+
+
+class QueueTests(TaggerTestCase):
+    def test_pages_follow_the_cursor(self):
+        self.add_sentences(30, labeled=10)
+        other = Dataset.objects.create(name='other', description='other')
+        Sentence.objects.create(dataset=other, body='not permitted')
+        unlabeled = list(Sentence.objects.filter(dataset=self.dataset, is_labeled=False)
+                         .order_by('pk').values_list('pk', flat=True))
+        page = self.client.get(reverse('labeling'), {'page_size': 8}).json()
+        seen = [sentence['id'] for sentence in page['results']]
+        # sentences labeled between pages neither shift nor repeat the next ones
+        create_labels([LabeledSentence(sentence_id=pk, tag=self.tag, operator=self.operator) for pk in seen[:4]])
+        while page['next']:
+            page = self.client.get(page['next']).json()
+            seen += [sentence['id'] for sentence in page['results']]
+        self.assertEqual(seen, unlabeled)
+
+    def test_labeled_sentences_left_out(self):
+        self.add_sentences(5, labeled=5)
+        self.assertEqual(self.client.get(reverse('labeling')).json()['results'], [])
+
+
+class CurrentLabelTests(TaggerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.add_sentences(1)
+        self.sentence = Sentence.objects.get()
+        self.other_tag = Tag.objects.create(dataset=self.dataset, name='other', is_active=True)
+
+    def label(self, tag, action=LabeledSentence.Action.ADD):
+        return LabeledSentence.objects.create(sentence=self.sentence, tag=tag, operator=self.operator, action=action)
+
+    def assertCurrent(self, *labels):
+        self.assertEqual(set(CurrentLabel.objects.values_list('tag_id', 'label_id')),
+                         {(label.tag_id, label.pk) for label in labels})
+        self.sentence.refresh_from_db()
+        self.assertEqual(self.sentence.is_labeled, bool(labels))
+        for tag in (self.tag, self.other_tag):
+            tag.refresh_from_db()
+            self.assertEqual(tag.label_count, sum(label.tag_id == tag.pk for label in labels))
+
+    def test_relabel(self):
+        self.label(self.tag)
+        latest = self.label(self.tag)
+        other = self.label(self.other_tag)
+        self.assertCurrent(latest, other)
+
+    def test_remove(self):
+        self.label(self.tag)
+        self.label(self.tag, LabeledSentence.Action.REMOVE)
+        self.assertCurrent()
+        self.assertEqual(LabeledSentence.objects.count(), 2)
+
+    def test_bulk(self):
+        create_labels([LabeledSentence(sentence=self.sentence, tag=tag, operator=self.operator, action=action)
+                       for tag, action in ((self.tag, 'add'), (self.other_tag, 'add'), (self.tag, 'remove'))])
+        self.assertCurrent(LabeledSentence.objects.get(tag=self.other_tag))
+
+    def test_history_deleted(self):
+        first = self.label(self.tag)
+        self.label(self.tag).delete()
+        self.assertCurrent(first)
+        first.delete()
+        self.assertCurrent()
+
+
+class ImportTests(TaggerTestCase):
+    def test_streamed_import(self):
+        lines = utils.decode_lines(io.BytesIO('café au lait\nsecond,ignored\n\nCAFE  au lait\n'.encode()))
+        sentences = list(utils.read_sentences(self.dataset, lines))
+        self.assertEqual([sentence.body for sentence in sentences], ['café au lait', 'second', 'CAFE  au lait'])
+        self.add_sentences(1)
+        bodies = ['café au lait', 'second', 'third', 'café  au lait', 'sentence number 0']
+        created = bulk_create_sentences((Sentence(dataset=self.dataset, body=body, body_hash=Sentence.hash_body(body))
+                                         for body in bodies), batch_size=2)
+        # duplicates within a batch, across batches and of existing sentences are skipped
+        self.assertEqual(created, 3)
+        self.dataset.refresh_from_db()
+        self.assertEqual(self.dataset.sentence_count, 4)
+
+    @override_settings(CELERY_TASK_ALWAYS_EAGER=True, TAGGER_BULK_BATCH_SIZE=2)
+    def test_import_job(self):
+        upload = SimpleUploadedFile('sentences.csv', b'first\nsecond\nthird\nfirst\nfourth\n')
+        with tempfile.TemporaryDirectory() as directory, override_settings(MEDIA_ROOT=directory):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(reverse('sentence-csv', args=[self.dataset.pk]), {'file': upload})
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(response.json()['status'], ImportJob.Status.PENDING)
+            job = self.client.get(reverse('sentence-csv-job', args=[response.json()['id']])).json()
+            self.assertEqual((job['status'], job['rows_processed'], job['error']), (ImportJob.Status.DONE, 5, ''))
+            # the upload is removed once imported
+            file = ImportJob.objects.get().file
+            self.assertFalse(file.storage.exists(file.name))
+        self.assertEqual(Sentence.objects.filter(dataset=self.dataset).count(), 4)
+
+    def test_import_failure(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(MEDIA_ROOT=directory):
+            job = ImportJob.objects.create(dataset=self.dataset, file=SimpleUploadedFile('sentences.csv', b'\xff\n'))
+            with self.assertRaises(UnicodeDecodeError):
+                import_sentences(job.pk)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.rows_processed), (ImportJob.Status.FAILED, 0))
+        self.assertIn("can't decode", job.error)
+
+    def test_import_into_deleted_dataset(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(MEDIA_ROOT=directory):
+            job = ImportJob.objects.create(dataset=self.dataset, file=SimpleUploadedFile('sentences.csv', b'first\n'))
+            Dataset.all_objects.filter(pk=self.dataset.pk).update(deleted_at=timezone.now())
+            with self.assertRaises(ValueError):
+                import_sentences(job.pk)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.error), (ImportJob.Status.FAILED, 'the dataset was deleted'))
+
+
+@skipUnless(connection.vendor in ('sqlite', 'postgresql'), 'the search index exists on sqlite and postgres')
+class SearchTests(TaggerTestCase):
+    def add_labeled(self, *bodies, dataset=None):
+        sentences = [Sentence.objects.create(dataset=dataset or self.dataset, body=body) for body in bodies]
+        create_labels([LabeledSentence(sentence=sentence, tag=self.tag, operator=self.operator)
+                       for sentence in sentences])
+        return sentences
+
+    def test_ranking(self):
+        weak, strong = self.add_labeled('an apple and a long sentence about many other things',
+                                        'apple apple apple')
+        Sentence.objects.create(dataset=self.dataset, body='an unlabeled apple')
+        other = Dataset.objects.create(name='other', description='other')
+        self.add_labeled('apple of another dataset', dataset=other)
+        self.assertEqual(search_sentences(self.dataset.pk, 'apple', 10), [strong.pk, weak.pk])
+        self.assertEqual(search_sentences(self.dataset.pk, 'apple', 1, offset=1), [weak.pk])
+        # query syntax is searched for as text
+        self.assertEqual(search_sentences(self.dataset.pk, 'apple" OR "banana', 10), [])
+
+    def test_index_follows_writes(self):
+        sentence, = self.add_labeled('a ripe banana')
+        sentence.refresh_from_db()
+        sentence.body = 'a ripe cherry'
+        sentence.save()
+        self.assertEqual(search_sentences(self.dataset.pk, 'banana', 10), [])
+        self.assertEqual(search_sentences(self.dataset.pk, 'cherry', 10), [sentence.pk])
+        sentence.delete()
+        self.assertEqual(search_sentences(self.dataset.pk, 'cherry', 10), [])
+
+    def test_body_only(self):
+        Dataset.objects.filter(pk=self.dataset.pk).update(name='fruits', description='fruits and berries')
+        Tag.objects.filter(pk=self.tag.pk).update(name='berry')
+        sentence, = self.add_labeled('a ripe banana')
+        for word in ('fruits', 'berries', 'berry'):
+            self.assertEqual(search_sentences(self.dataset.pk, word, 10), [])
+        response = self.client.get(reverse('search', args=[self.dataset.pk, 'berry']))
+        self.assertEqual(response.json()['results'], [])
+        self.assertEqual(search_sentences(self.dataset.pk, 'banana', 10), [sentence.pk])
+
+
+class DailyStatsTests(TaggerTestCase):
+    def test_sentences_without_dataset(self):
+        loose = Sentence.objects.create(body='no dataset')
+        self.add_sentences(1, labeled=1)
+        create_labels([LabeledSentence(sentence=loose, tag=self.tag, operator=self.operator)])
+        OperatorDailyStats.objects.all().delete()
+        import_module('tagger.migrations.0007_operatordailystats').backfill_daily_stats(apps, None)
+        self.assertEqual(list(OperatorDailyStats.objects.values_list('dataset_id', 'count')), [(self.dataset.pk, 1)])
+        with tempfile.TemporaryDirectory() as directory, chdir(directory):
+            call_command('generate_report', rebuild=True, stdout=io.StringIO())
+        self.assertEqual(list(OperatorDailyStats.objects.values_list('dataset_id', 'count')), [(self.dataset.pk, 1)])
+
+    def test_report(self):
+        second = Operator.objects.create(user=User.objects.create_user('second', '', 'password'))
+        other_tag = Tag.objects.create(dataset=self.dataset, name='other', is_active=True)
+        self.add_sentences(3, labeled=2)
+        sentence = Sentence.objects.order_by('pk').last()
+        create_labels([LabeledSentence(sentence=sentence, tag=other_tag, operator=second),
+                       LabeledSentence(sentence=sentence, tag=self.tag, operator=second,
+                                       action=LabeledSentence.Action.REMOVE)])
+        # the report reads the rollup only
+        LabeledSentence.objects.all().delete()
+        today = timezone.localdate()
+        with tempfile.TemporaryDirectory() as directory, chdir(directory):
+            call_command('generate_report', stdout=io.StringIO())
+            report = (Path(directory) / 'reports' / f'daily_activity_report_{today}.txt').read_text()
+        self.assertIn('Operator operator performed 2 actions today.\n', report)
+        self.assertIn('Operator second performed 1 actions today.\n', report)
+        self.assertIn('Labels per dataset\n' + '-' * 40 + '\ndataset: 3\n', report)
+        self.assertIn('dataset / other: 1\ndataset / tag: 2\n', report)
+
+
+@override_settings(TAGGER_BULK_BATCH_SIZE=2)
+class ExportTests(TaggerTestCase):
+    def setUp(self):
+        super().setUp()
+        other_tag = Tag.objects.create(dataset=self.dataset, name='other', is_active=True)
+        self.sentences = [Sentence.objects.create(dataset=self.dataset, body=body)
+                          for body in ('plain', 'with "quotes", and a comma', 'unlabeled', 'ünïcode')]
+        plain, quoted, _, unicode = self.sentences
+        create_labels([LabeledSentence(sentence=plain, tag=self.tag, operator=self.operator),
+                       LabeledSentence(sentence=plain, tag=other_tag, operator=self.operator),
+                       LabeledSentence(sentence=quoted, tag=other_tag, operator=self.operator),
+                       LabeledSentence(sentence=unicode, tag=self.tag, operator=self.operator)])
+        self.expected = [(plain.pk, 'plain', ['tag', 'other']), (quoted.pk, 'with "quotes", and a comma', ['other']),
+                         (self.sentences[2].pk, 'unlabeled', []), (unicode.pk, 'ünïcode', ['tag'])]
+
+    def export(self, **params):
+        response = self.client.get(reverse('dataset-export', args=[self.dataset.pk]), params)
+        return response, b''.join(response.streaming_content)
+
+    def test_ndjson(self):
+        response, content = self.export()
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in content.decode().splitlines()]
+        self.assertEqual([(row['id'], row['body'], row['tags']) for row in rows], self.expected)
+
+    def test_csv(self):
+        response, content = self.export(output='csv')
+        self.assertEqual(response['Content-Disposition'], f'attachment; filename="dataset_{self.dataset.pk}.csv"')
+        rows = list(csv.reader(io.StringIO(content.decode())))
+        self.assertEqual(rows, [['id', 'body', 'tags']] + [[str(pk), body, '|'.join(tags)]
+                                                             for pk, body, tags in self.expected])
+
+    def test_gzip_and_resume(self):
+        response, content = self.export(output='csv', compress='gzip', after=self.sentences[1].pk)
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertEqual(gzip.decompress(content), self.export(output='csv', after=self.sentences[1].pk)[1])
+        rows = list(csv.reader(io.StringIO(gzip.decompress(content).decode())))
+        self.assertEqual([int(row[0]) for row in rows[1:]], [pk for pk, _, _ in self.expected[2:]])
+
+    def test_invalid_parameters(self):
+        url = reverse('dataset-export', args=[self.dataset.pk])
+        self.assertEqual(self.client.get(url, {'output': 'xml'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'after': 'x'}).status_code, 400)
+
+
+class FastSerializationTests(TaggerTestCase):
+    def test_same_output_as_serializers(self):
+        self.add_sentences(3, labeled=2)
+        Sentence.objects.filter(is_labeled=False).update(leased_by=self.operator, lease_expires_at=timezone.now())
+        for serializer_class, queryset in ((SentenceSerializer, Sentence.objects.order_by('pk')),
+                                           (LabeledSentenceSerializer, LabeledSentence.objects.order_by('pk')),
+                                           (TagSerializer, Tag.objects.order_by('pk'))):
+            encoder = RowEncoder.for_serializer(serializer_class)
+            self.assertEqual(ORJSONRenderer().render(encoder.encode(encoder.values_list(queryset))),
+                             JSONRenderer().render(serializer_class(queryset, many=True).data))
+
+    def test_setting_read_per_request(self):
+        self.add_sentences(3, labeled=1)
+        responses = {}
+        for fast in (True, False):
+            with override_settings(TAGGER_FAST_SERIALIZATION=fast):
+                response = self.client.get(reverse('labeling'))
+            self.assertIs(type(response.accepted_renderer), ORJSONRenderer if fast else JSONRenderer)
+            responses[fast] = response.content
+        self.assertEqual(responses[True], responses[False])
+
+    @override_settings(TAGGER_FAST_SERIALIZATION=False)
+    def test_view_switch(self):
+        self.add_sentences(3, labeled=1)
+        self.assertIs(type(self.client.get(reverse('labeling')).accepted_renderer), JSONRenderer)
+        with patch.object(LabelingSentenceAPIView, 'fast_serialization', True):
+            response = self.client.get(reverse('labeling'))
+        self.assertIs(type(response.accepted_renderer), ORJSONRenderer)
+        with override_settings(TAGGER_FAST_SERIALIZATION=True), \
+                patch.object(LabelingSentenceAPIView, 'fast_serialization', False):
+            response = self.client.get(reverse('labeling'))
+        self.assertIs(type(response.accepted_renderer), JSONRenderer)
+
+
+class DedupeTests(TaggerTestCase):
+    def test_merge_into_oldest(self):
+        other_tag = Tag.objects.create(dataset=self.dataset, name='other', is_active=True)
+        oldest, legacy, hashed = (Sentence.objects.create(dataset=self.dataset, body=body)
+                                  for body in ('first', 'second', 'HELLO WORLD'))
+        # sentences from before hashing, the unique constraint doesn't cover them yet
+        Sentence.objects.filter(pk=oldest.pk).update(body='Hello world', body_hash=None)
+        Sentence.objects.filter(pk=legacy.pk).update(body='hello  world', body_hash=None)
+        create_labels([LabeledSentence(sentence=legacy, tag=self.tag, operator=self.operator),
+                       LabeledSentence(sentence=hashed, tag=other_tag, operator=self.operator)])
+        call_command('dedupe_sentences', batch_size=1, stdout=io.StringIO())
+        # the hashed sentence is newer than the ones without a hash, it is merged into the oldest too
+        self.assertEqual(list(Sentence.objects.values_list('pk', 'body_hash', 'is_labeled')),
+                         [(oldest.pk, Sentence.hash_body('Hello world'), True)])
+        self.assertEqual(set(CurrentLabel.objects.values_list('sentence_id', 'tag_id')),
+                         {(oldest.pk, self.tag.pk), (oldest.pk, other_tag.pk)})
+        self.assertEqual(set(LabeledSentence.objects.values_list('sentence_id', flat=True)), {oldest.pk})
+
+
+class BulkLabelingTests(TaggerTestCase):
+    def test_results_per_item(self):
+        self.add_sentences(2)
+        first, second = Sentence.objects.order_by('pk')
+        other = Dataset.objects.create(name='other', description='other')
+        other_tag = Tag.objects.create(dataset=other, name='other', is_active=True)
+        hidden = Sentence.objects.create(dataset=other, body='not permitted')
+        labels = [{'sentence': first.pk, 'tag': self.tag.pk}, {'sentence': 0, 'tag': self.tag.pk},
+                  {'sentence': first.pk, 'tag': 0}, {'sentence': second.pk, 'tag': other_tag.pk},
+                  {'sentence': hidden.pk, 'tag': other_tag.pk}, {'sentence': second.pk, 'tag': self.tag.pk}]
+        response = self.client.post(reverse('labeling-bulk'), {'labels': labels}, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['created'], 2)
+        self.assertEqual([(item['index'], item['accepted'], item['detail']) for item in response.json()['results']], [
+            (0, True, None), (1, False, 'sentence does not exist'), (2, False, 'tag does not exist'),
+            (3, False, "you can't give that tag to this sentence, it is not defined!"),
+            (4, False, "you don't have permission"), (5, True, None),
+        ])
+        self.assertEqual(set(CurrentLabel.objects.values_list('sentence_id', flat=True)), {first.pk, second.pk})
+
+    def test_every_item_rejected(self):
+        labels = [{'sentence': 0, 'tag': self.tag.pk}]
+        response = self.client.post(reverse('labeling-bulk'), {'labels': labels}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'created': 0, 'results': [
+            {'index': 0, 'accepted': False, 'detail': 'sentence does not exist'}]})
+        self.assertFalse(LabeledSentence.objects.exists())
+
+
+class LeaseTests(TaggerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.add_sentences(5)
+        other = User.objects.create_user('other', '', 'password')
+        self.other_operator = Operator.objects.create(user=other)
+        HasPermission.objects.create(operator=self.other_operator, dataset=self.dataset)
+        self.other = self.client_class()
+        self.other.force_login(other)
+
+    def claim(self, client, size):
+        return [item['id'] for item in client.post(reverse('labeling-claim'), {'size': size}).json()]
+
+    def test_claims_are_exclusive(self):
+        mine = self.claim(self.client, 3)
+        theirs = self.claim(self.other, 5)
+        self.assertEqual(len(mine), 3)
+        self.assertEqual(len(theirs), 2)
+        self.assertFalse(set(mine) & set(theirs))
+        # a lease is renewed by claiming again
+        self.assertEqual(self.claim(self.client, 3), mine)
+
+    def test_expired_leases(self):
+        mine = self.claim(self.client, 3)
+        Sentence.objects.filter(pk__in=mine).update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(len(self.claim(self.other, 5)), 5)
+        Sentence.objects.update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(release_expired_leases(), 5)
+        self.assertFalse(Sentence.objects.filter(leased_by__isnull=False).exists())
+
+    def test_leased_sentences_left_out(self):
+        mine = self.claim(self.client, 2)
+        queue = [item['id'] for item in self.other.get(reverse('labeling')).json()['results']]
+        self.assertEqual(len(queue), 3)
+        self.assertFalse(set(mine) & set(queue))
+        label = {'sentence': mine[0], 'tag': self.tag.pk}
+        response = self.other.post(reverse('labeling'), {**label, 'operator': self.other_operator.pk})
+        self.assertEqual(response.status_code, 409)
+        response = self.other.post(reverse('labeling-bulk'), {'labels': [label]}, content_type='application/json')
+        self.assertEqual((response.status_code, response.json()['created']), (400, 0))
+        response = self.client.post(reverse('labeling'), {**label, 'operator': self.operator.pk})
+        self.assertEqual(response.status_code, 201)
+
+
+class CounterTests(TaggerTestCase):
+    def assertCounters(self, sentences, labeled, labels):
+        self.dataset.refresh_from_db()
+        self.tag.refresh_from_db()
+        self.assertEqual((self.dataset.sentence_count, self.dataset.labeled_count, self.tag.label_count),
+                         (sentences, labeled, labels))
+
+    def test_counters(self):
+        self.add_sentences(4, labeled=3)
+        self.assertCounters(4, 3, 3)
+        first, second, *_ = Sentence.objects.order_by('pk')
+        create_labels([LabeledSentence(sentence=first, tag=self.tag, operator=self.operator,
+                                       action=LabeledSentence.Action.REMOVE)])
+        self.assertCounters(4, 2, 2)
+        second.delete()
+        self.assertCounters(3, 1, 1)
+
+    def test_reconcile_counters(self):
+        self.add_sentences(4, labeled=3)
+        Dataset.objects.update(sentence_count=100, labeled_count=-5)
+        Tag.objects.update(label_count=7)
+        call_command('reconcile_counters', batch_size=1, stdout=io.StringIO())
+        self.assertCounters(4, 3, 3)
+
+    def test_sentences_inserted_concurrently(self):
+        self.add_sentences(1)
+        lookup, calls = utils._existing_sentences, []
+
+        def missing_first(keys):
+            # the first lookup runs before another import inserts the sentence
+            calls.append(keys)
+            return set() if len(calls) == 1 else lookup(keys)
+
+        bodies = [Sentence.objects.get().body, 'a new sentence']
+        sentences = [Sentence(dataset=self.dataset, body=body, body_hash=Sentence.hash_body(body)) for body in bodies]
+        with patch.object(utils, '_existing_sentences', missing_first):
+            created = bulk_create_sentences(sentences)
+        self.assertEqual(created, 1)
+        self.dataset.refresh_from_db()
+        self.assertEqual(self.dataset.sentence_count, 2)
+
+
+class HasPermissionConstraintTests(TaggerTestCase):
+    def test_duplicate_permission(self):
+        with self.assertRaises(IntegrityError):
+            HasPermission.objects.create(operator=self.operator, dataset=self.dataset)
+
+
+class ResponseCacheTests(TaggerTestCase):
+    def test_not_modified(self):
+        url = reverse('tag-list', args=[self.dataset.pk])
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_invalidated_after_commit(self):
+        url = reverse('tag-list', args=[self.dataset.pk])
+        response = self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.create(dataset=self.dataset, name='new', is_active=True)
+            # the stamp only moves on commit, until then the cached listing is served
+            self.assertEqual(self.client.get(url).json(), response.json())
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 2)
+
+    def test_labels_invalidate_category(self):
+        self.add_sentences(2)
+        url = reverse('category', args=[self.dataset.pk, self.tag.pk])
+        self.assertEqual(self.client.get(url).json()['results'], [])
+        with self.captureOnCommitCallbacks(execute=True):
+            create_labels([LabeledSentence(sentence=Sentence.objects.first(), tag=self.tag, operator=self.operator)])
+        self.assertEqual(len(self.client.get(url).json()['results']), 1)
+
+
+class PermissionCacheTests(TaggerTestCase):
+    def test_revoked_after_commit(self):
+        url = reverse('tag-list', args=[self.dataset.pk])
+        self.assertEqual(self.client.get(url).status_code, 200)
+        before = get_version(PERMISSIONS_VERSION)
+        with self.captureOnCommitCallbacks(execute=True):
+            HasPermission.objects.filter(operator=self.operator).delete()
+            # a request caching permissions before the commit would store them under the old stamp
+            self.assertEqual(get_version(PERMISSIONS_VERSION), before)
+        self.assertNotEqual(get_version(PERMISSIONS_VERSION), before)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+
+class AsyncViewTests(TaggerTestCase):
+    """
+    async read paths return the same rows as the sync views.
+    """
+
+    def setUp(self):
+        super().setUp()
+        async_to_sync(self.async_client.aforce_login)(self.user)
+        self.add_sentences(30, labeled=10)
+
+    def get(self, name, *args):
+        response = async_to_sync(self.async_client.get)(reverse(name, args=args))
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_tag_list(self):
+        self.assertEqual(self.get('async-tag-list', self.dataset.pk), self.get('tag-list', self.dataset.pk))
+
+    def test_category(self):
+        self.assertEqual(self.get('async-category', self.dataset.pk, self.tag.pk)['results'],
+                         self.get('category', self.dataset.pk, self.tag.pk)['results'])
+
+    def test_search(self):
+        self.assertEqual(self.get('async-search', self.dataset.pk, 'sentence'),
+                         self.get('search', self.dataset.pk, 'sentence'))
+
+    def test_unlabeled_queue(self):
+        page = self.get('async-labeling')
+        self.assertEqual(page['results'], self.get('labeling')['results'])
+        page = async_to_sync(self.async_client.get)(reverse('async-labeling'), {'page_size': 15}).json()
+        self.assertEqual(len(page['results']), 15)
+        page = async_to_sync(self.async_client.get)(page['next']).json()
+        self.assertEqual((len(page['results']), page['next']), (5, None))
+
+    def test_permission(self):
+        async_to_sync(self.async_client.aforce_login)(User.objects.create_user('plain', password='password'))
+        response = async_to_sync(self.async_client.get)(reverse('async-search', args=[self.dataset.pk, 'word']))
+        self.assertEqual(response.status_code, 403)
+
+
+class EventStreamTests(TaggerTestCase):
+    def write(self):
+        other = Dataset.objects.create(name='other', description='other')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.add_sentences(2, labeled=1)
+            Tag.objects.create(dataset=other, name='hidden', is_active=True)
+            Tag.objects.create(dataset=self.dataset, name='new', is_active=True)
+
+    async def receive(self, count):
+        stream = stream_events(self.user, {self.dataset.pk}, None, heartbeat=5)
+        try:
+            self.assertTrue((await anext(stream)).startswith(b'retry:'))
+            await sync_to_async(self.write)()
+            return [json.loads((await anext(stream)).decode().split('data: ')[1]) for _ in range(count)]
+        finally:
+            await stream.aclose()
+
+    def test_events_of_permitted_datasets(self):
+        received = async_to_sync(self.receive)(3)
+        self.assertEqual([event['type'] for event in received],
+                         ['sentences_added', 'sentences_labeled', 'tag_changed'])
+        self.assertEqual({event['dataset'] for event in received}, {self.dataset.pk})
+        self.assertEqual(received[0]['count'], 2)
+
+    async def receive_after_revoke(self):
+        stream = stream_events(self.user, {self.dataset.pk}, None, heartbeat=0.2)
+        try:
+            await anext(stream)
+            await sync_to_async(self.revoke)()
+            # a busy stream doesn't wait for an idle timeout to check permissions again
+            await asyncio.sleep(0.3)
+            events.get_broker().publish({'type': events.TAG_CHANGED, 'dataset': self.dataset.pk})
+            return await anext(stream)
+        finally:
+            await stream.aclose()
+
+    def revoke(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            HasPermission.objects.filter(operator=self.operator).delete()
+
+    def test_permissions_checked_on_elapsed_time(self):
+        self.assertEqual(async_to_sync(self.receive_after_revoke)(), b': keep-alive\n\n')
+
+    def test_sentences_without_dataset(self):
+        loose = Sentence.objects.create(body='no dataset')
+        sentence = Sentence.objects.create(dataset=self.dataset, body='labeled')
+        with patch.object(events, 'publish') as publish:
+            create_labels([LabeledSentence(sentence=sentence, tag=self.tag, operator=self.operator),
+                           LabeledSentence(sentence=loose, tag=self.tag, operator=self.operator)])
+        publish.assert_called_once_with(events.SENTENCES_LABELED, self.dataset.pk, sentences=[sentence.pk])
+
+    def test_dataset_filter(self):
+        async_to_sync(self.async_client.aforce_login)(self.user)
+        response = async_to_sync(self.async_client.get)(reverse('events'), {'dataset': 'x'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ApiKeyTests(TaggerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.key = self.client.post(reverse('api-key'), {'name': 'script'}).json()['key']
+        self.client.logout()
+        self.url = reverse('tag-list', args=[self.dataset.pk])
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {self.key}'}
+
+    def test_authenticate(self):
+        self.assertEqual(self.client.get(self.url, **self.auth).status_code, 200)
+        # principal, permissions and response all come from caches
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(self.url, **self.auth).status_code, 200)
+
+    def test_invalid_key(self):
+        response = self.client.get(self.url, HTTP_AUTHORIZATION='Bearer wrong')
+        self.assertEqual(response.status_code, 401)
+
+    def test_revoke(self):
+        self.assertEqual(self.client.get(self.url, **self.auth).status_code, 200)
+        api_key_id = ApiKey.objects.get().pk
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(reverse('api-key-detail', args=[api_key_id]), **self.auth)
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.client.get(self.url, **self.auth).status_code, 401)
+
+    def test_deactivated_user(self):
+        self.assertEqual(self.client.get(self.url, **self.auth).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+            # cached principals are dropped once the change commits
+            self.assertEqual(self.client.get(self.url, **self.auth).status_code, 200)
+        self.assertEqual(self.client.get(self.url, **self.auth).status_code, 401)
+
+
+class MetricsTests(TaggerTestCase):
+    def test_metrics(self):
+        registry.clear()
+        self.client.get(reverse('tag-list', args=[self.dataset.pk]))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        content = response.content.decode()
+        self.assertIn('tagger_requests_total{view="tag-list",method="GET",status="200"} 1', content)
+        self.assertIn('tagger_request_queries_count{view="tag-list"} 1', content)
+
+    def test_admin_only(self):
+        user = User.objects.create_user('plain', password='password')
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+
+
+@override_settings(TAGGER_SUGGESTION_SETTLE_SECONDS=0)
+class SuggestionTests(TaggerTestCase):
+    def test_suggestions(self):
+        fruit = Tag.objects.create(dataset=self.dataset, name='fruit', is_active=True)
+        bodies = ['the red car drives fast', 'a fast blue car', 'sweet apple and banana', 'banana apple smoothie',
+                  'my car is fast', 'an apple a day', 'cloudy weather today']
+        bulk_create_sentences(Sentence(dataset=self.dataset, body=body, body_hash=Sentence.hash_body(body))
+                              for body in bodies)
+        cars, blue, apple, smoothie, *_ = Sentence.objects.order_by('pk')
+        create_labels([LabeledSentence(sentence=cars, tag=self.tag, operator=self.operator),
+                       LabeledSentence(sentence=blue, tag=self.tag, operator=self.operator),
+                       LabeledSentence(sentence=apple, tag=fruit, operator=self.operator),
+                       LabeledSentence(sentence=apple, tag=self.tag, operator=self.operator)])
+        update_suggestions(self.dataset.pk)
+        # incremental training, the wrong label is subtracted again
+        create_labels([LabeledSentence(sentence=smoothie, tag=fruit, operator=self.operator),
+                       LabeledSentence(sentence=apple, tag=self.tag, operator=self.operator,
+                                       action=LabeledSentence.Action.REMOVE)])
+        self.assertEqual(update_suggestions(self.dataset.pk), (2, 3))
+
+        results = self.client.get(reverse('labeling')).json()['results']
+        suggested = {item['body']: [suggestion['tag'] for suggestion in item['suggestions']] for item in results}
+        self.assertEqual(suggested['my car is fast'][0], self.tag.pk)
+        self.assertEqual(suggested['an apple a day'][0], fruit.pk)
+        self.assertEqual(suggested['cloudy weather today'], [])
+
+        incremental = {centroid.tag_id: bytes(centroid.vector) for centroid in TagCentroid.objects.all()}
+        reset_suggestions([self.dataset.pk])
+        update_suggestions(self.dataset.pk)
+        rebuilt = {centroid.tag_id: bytes(centroid.vector) for centroid in TagCentroid.objects.all()}
+        for tag_id, vector in rebuilt.items():
+            self.assertTrue(np.allclose(np.frombuffer(zlib.decompress(vector), dtype=np.float32),
+                                        np.frombuffer(zlib.decompress(incremental[tag_id]), dtype=np.float32),
+                                        atol=1e-6))
+
+    @override_settings(TAGGER_SUGGESTION_SETTLE_SECONDS=60)
+    def test_recent_labels_wait(self):
+        self.add_sentences(3, labeled=3)
+        first, second, third = LabeledSentence.objects.order_by('pk')
+        LabeledSentence.objects.filter(pk__in=[first.pk, third.pk]).update(
+            created_at=timezone.now() - timedelta(minutes=5))
+        # the second row may belong to a transaction that committed after the third one was written
+        self.assertEqual(train(self.dataset.pk), 1)
+        self.assertEqual(SuggestionState.objects.get(dataset=self.dataset).last_label, first.pk)
+        LabeledSentence.objects.filter(pk=second.pk).update(created_at=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(train(self.dataset.pk), 2)
+
+
+class ClusterTests(TaggerTestCase):
+    def test_clusters(self):
+        fox = Sentence.objects.create(dataset=self.dataset, body='The quick brown fox jumps over the lazy dog!')
+        other = Sentence.objects.create(dataset=self.dataset, body='A completely different sentence about the weather')
+        bodies = ['the quick  brown fox jumps over the lazy dog', 'The quick brown fox jumped over the lazy dog.',
+                  'Stocks fell sharply on Monday morning', 'stocks fell sharply on monday morning!!']
+        bulk_create_sentences(Sentence(dataset=self.dataset, body=body, body_hash=Sentence.hash_body(body))
+                              for body in bodies)
+        self.assertEqual(update_clusters(self.dataset.pk), (4, 5))
+        copy, jumped, stocks, _ = Sentence.objects.filter(body__in=bodies).order_by('pk')
+        clusters = dict(Sentence.objects.values_list('pk', 'cluster'))
+        self.assertEqual(sorted(clusters.values(), key=str), [fox.pk] * 3 + [stocks.pk] * 2 + [None])
+        self.assertIsNone(clusters[other.pk])
+
+        # rebuilt with sketches from a process pool
+        reset_clusters([self.dataset.pk])
+        self.assertEqual(update_clusters(self.dataset.pk, workers=2, batch_size=2), (6, 5))
+        self.assertEqual(dict(Sentence.objects.values_list('pk', 'cluster')), clusters)
+
+        url = reverse('sentence-clusters', args=[self.dataset.pk])
+        self.assertEqual(self.client.get(url).json()['results'],
+                         [{'cluster': fox.pk, 'sentences': 3, 'unlabeled': 3},
+                          {'cluster': stocks.pk, 'sentences': 2, 'unlabeled': 2}])
+        response = self.client.post(reverse('labeling'), {'sentence': copy.pk, 'tag': self.tag.pk,
+                                                          'operator': self.operator.pk, 'cluster': True})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['created'], 3)
+        self.assertEqual(self.client.get(url, {'unlabeled': 1}).json()['results'],
+                         [{'cluster': stocks.pk, 'sentences': 2, 'unlabeled': 2}])
+
+        # an edited sentence joins its new near duplicates
+        other.body = 'the quick brown fox jumps over the lazy dog.'
+        other.save()
+        results = self.client.get(reverse('sentence-cluster', args=[self.dataset.pk, fox.pk])).json()['results']
+        self.assertEqual([item['id'] for item in results], [fox.pk, other.pk, copy.pk, jumped.pk])
+
+
+class AgreementTests(TaggerTestCase):
+    def test_agreement(self):
+        other = Operator.objects.create(user=User.objects.create_user('other', password='password'))
+        second_tag = Tag.objects.create(dataset=self.dataset, name='second', is_active=True)
+        self.add_sentences(4)
+        s1, s2, s3, s4 = Sentence.objects.order_by('pk')
+        remove = LabeledSentence.Action.REMOVE
+        create_labels([
+            LabeledSentence(sentence=s1, tag=self.tag, operator=self.operator),
+            LabeledSentence(sentence=s2, tag=self.tag, operator=self.operator),
+            LabeledSentence(sentence=s3, tag=second_tag, operator=self.operator),
+            LabeledSentence(sentence=s4, tag=second_tag, operator=self.operator),
+            LabeledSentence(sentence=s1, tag=self.tag, operator=other),
+            LabeledSentence(sentence=s3, tag=self.tag, operator=other),
+            LabeledSentence(sentence=s3, tag=self.tag, operator=other, action=remove),
+            LabeledSentence(sentence=s2, tag=second_tag, operator=other),
+            LabeledSentence(sentence=s4, tag=second_tag, operator=other),
+        ])
+        data = self.client.get(reverse('dataset-agreement', args=[self.dataset.pk])).json()
+        self.assertEqual(data['sentences'], 4)
+        self.assertAlmostEqual(data['fleiss_kappa'], 5 / 21, places=5)
+        first, second = data['tags']
+        self.assertEqual(first['name'], 'tag')
+        self.assertAlmostEqual(first['fleiss_kappa'], 7 / 15, places=5)
+        self.assertEqual(first['confusion'], [[4, 1], [1, 2]])
+        self.assertAlmostEqual(second['fleiss_kappa'], 0)
+        self.assertEqual(data['pairs'], [{'operators': [self.operator.pk, other.pk], 'sentences': 4,
+                                          'cohen_kappa': 0.25}])
+
+
+@override_settings(CELERY_TASK_ALWAYS_EAGER=True)
+class DatasetDeletionTests(TaggerTestCase):
+    def test_hidden_before_purge(self):
+        with self.captureOnCommitCallbacks(execute=False):
+            response = self.client.delete(reverse('dataset-detail', args=[self.dataset.pk]))
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['status'], PurgeJob.Status.PENDING)
+        self.assertEqual(self.client.get(reverse('dataset-list')).json(), [])
+        self.assertEqual(self.client.get(reverse('dataset-stats', args=[self.dataset.pk])).status_code, 403)
+        self.assertTrue(Dataset.all_objects.filter(pk=self.dataset.pk).exists())
+
+    def test_permissions_dropped_on_commit(self):
+        url = reverse('dataset-stats', args=[self.dataset.pk])
+        self.assertEqual(self.client.get(url).status_code, 200)
+        before = get_version(PERMISSIONS_VERSION)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.client.delete(reverse('dataset-detail', args=[self.dataset.pk]))
+        # nothing is bumped before the commit, a racing request can't cache the dataset as permitted again
+        self.assertEqual(get_version(PERMISSIONS_VERSION), before)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(get_version(PERMISSIONS_VERSION), before)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+    def test_purge(self):
+        self.add_sentences(30, labeled=10)
+        with self.captureOnCommitCallbacks(execute=True):
+            job_id = self.client.delete(reverse('dataset-detail', args=[self.dataset.pk])).json()['id']
+        job = self.client.get(reverse('dataset-purge', args=[job_id])).json()
+        self.assertEqual(job['status'], PurgeJob.Status.DONE)
+        self.assertIsNone(job['dataset'])
+        # sentences, history and current labels, daily stats, tag, permission
+        self.assertEqual(job['rows_deleted'], 30 + 10 + 10 + 1 + 1 + 1)
+        self.assertFalse(Dataset.all_objects.exists())
+        self.assertFalse(Sentence.objects.exists())
+        self.assertFalse(LabeledSentence.objects.exists())
+        self.assertFalse(CurrentLabel.objects.exists())
+        self.assertFalse(Tag.objects.exists())
+
+
+@override_settings(TAGGER_REPLICA_DATABASE='replica')
+class ReplicaRoutingTests(TaggerTestCase):
+    def test_routing(self):
+        with reading_from(replica_for(self.user)):
+            self.assertEqual(router.db_for_read(Sentence), 'replica')
+            self.assertEqual(router.db_for_write(Sentence), 'default')
+        self.assertEqual(router.db_for_read(Sentence), 'default')
+        with override_settings(TAGGER_REPLICA_DATABASE=None):
+            self.assertIsNone(replica_for(self.user))
+
+    def test_unsafe_request_pins_user_to_primary(self):
+        url = reverse('tag-list', args=[self.dataset.pk])
+        self.client.post(url, {'dataset': self.dataset.pk, 'name': 'new', 'is_active': True})
+        self.assertIsNone(replica_for(self.user))
+        # there is no replica in tests, the listing works because it reads from the primary
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_recent_changes_read_from_primary(self):
+        with reading_from('replica'):
+            with fresh_reads(time.time_ns()):
+                self.assertEqual(router.db_for_read(Sentence), 'default')
+            with fresh_reads(time.time_ns() - 60 * 10 ** 9):
+                self.assertEqual(router.db_for_read(Sentence), 'replica')
+
+
+@skipUnless(settings.TAGGER_REPLICA_DATABASE, 'SQL_REPLICA_DATABASE or SQL_REPLICA_HOST is not set')
+class ReplicaReadTests(TransactionTestCase):
+    databases = DATABASES
+
+    def test_stats_read_from_replica(self):
+        user = User.objects.create_user('operator', '', 'password')
+        dataset = Dataset.objects.create(name='dataset', description='dataset')
+        HasPermission.objects.create(operator=Operator.objects.create(user=user), dataset=dataset)
+        bulk_create_sentences(Sentence(dataset=dataset, body=body, body_hash=Sentence.hash_body(body))
+                              for body in ('first sentence', 'second sentence'))
+        self.client.force_login(user)
+        with CaptureQueriesContext(connections['replica']) as queries:
+            response = self.client.get(reverse('dataset-stats', args=[dataset.pk]))
+        self.assertEqual(response.json()['sentences'], 2)
+        self.assertTrue(any('tagger_dataset' in query['sql'] for query in queries))
+
+
+class BenchmarkTests(RoutedTestCase):
+    def test_every_endpoint(self):
+        data = benchmark.seed(datasets=1, tags=2, sentences=60, operators=2, labels=20)
+        with tempfile.TemporaryDirectory() as directory, override_settings(MEDIA_ROOT=directory):
+            results = benchmark.run(data, requests=3, concurrency=1)
+        self.assertEqual(set(results), set(benchmark.scenarios(data)))
+        for name, summary in results.items():
+            self.assertEqual(summary['errors'], 0, name)
+            self.assertEqual(summary['requests'], 3, name)
+
+    def test_compare(self):
+        baseline = {'search': {'p95_ms': 10.0, 'queries': 4}}
+        self.assertEqual(benchmark.compare({'search': {'p95_ms': 11.0, 'queries': 4}}, baseline), [])
+        self.assertEqual(len(benchmark.compare({'search': {'p95_ms': 13.0, 'queries': 5}}, baseline)), 2)
@@ -1,6 +1,6 @@
 from django.urls import path
 from rest_framework import routers
-from . import views
+from . import views, async_views
 
 router = routers.DefaultRouter()
 router.register(r'dataset', views.DatasetViewSet)
@@ -18,9 +18,40 @@ urlpatterns = [
     path('search/<int:dataset_id>/<str:word>/', views.SearchLabeledSentenceAPIView.as_view(), name='search'),
     # labeling sentence
     path('label/', views.LabelingSentenceAPIView.as_view(), name='labeling'),
+    # label many sentences in one request
+    path('label/bulk/', views.BulkLabelingAPIView.as_view(), name='labeling-bulk'),
+    # claim and release a batch of sentences for labeling
+    path('label/claim/', views.ClaimSentencesAPIView.as_view(), name='labeling-claim'),
     # list and create Sentences
     path('dataset/<int:dataset_id>/sentence/', views.ListCreateSentencesAPIView.as_view(), name='list-create-sentence'),
+    # near-duplicate clusters of a dataset and their sentences
+    path('dataset/<int:dataset_id>/clusters/', views.SentenceClusterListAPIView.as_view(), name='sentence-clusters'),
+    path('dataset/<int:dataset_id>/clusters/<int:cluster>/', views.SentenceClusterAPIView.as_view(),
+         name='sentence-cluster'),
+    # labeling progress of a dataset
+    path('dataset/<int:dataset_id>/stats/', views.DatasetStatsAPIView.as_view(), name='dataset-stats'),
+    # inter-annotator agreement of a dataset
+    path('dataset/<int:dataset_id>/agreement/', views.DatasetAgreementAPIView.as_view(), name='dataset-agreement'),
+    # stream sentences of a dataset with their tags
+    path('dataset/<int:dataset_id>/export/', views.DatasetExportAPIView.as_view(), name='dataset-export'),
     # upload csv file to create sentences
     path('sentence/csv/<int:dataset_id>/', views.SentenceCSVAPIView.as_view(), name='sentence-csv'),
+    # progress of a csv upload
+    path('sentence/csv/job/<int:pk>/', views.ImportJobAPIView.as_view(), name='sentence-csv-job'),
+    # progress of a dataset deletion
+    path('dataset/purge/<int:pk>/', views.PurgeJobAPIView.as_view(), name='dataset-purge'),
+    # async read paths, same data as the views above for ASGI deployments
+    path('async/dataset/<int:dataset_id>/tags/', async_views.tag_list, name='async-tag-list'),
+    path('async/dataset/<int:dataset_id>/<int:tag_id>/', async_views.category, name='async-category'),
+    path('async/search/<int:dataset_id>/<str:word>/', async_views.search, name='async-search'),
+    path('async/label/', async_views.unlabeled_queue, name='async-labeling'),
+    # server-sent events about new sentences, labels and tags of permitted datasets
+    path('async/events/', async_views.event_stream, name='events'),
+    # create and list api keys
+    path('api-key/', views.ApiKeyAPIView.as_view(), name='api-key'),
+    # revoke an api key
+    path('api-key/<int:pk>/', views.ApiKeyRevokeAPIView.as_view(), name='api-key-detail'),
+    # request and query metrics in prometheus format
+    path('metrics/', views.MetricsAPIView.as_view(), name='metrics'),
 ]
 urlpatterns += router.urls
@@ -1,16 +1,338 @@
+import codecs
 import csv
+from collections import Counter, defaultdict
+from collections.abc import Iterable, Iterator
+from datetime import timedelta
+from itertools import islice
 
-from tagger.models import Sentence, Dataset
+from django.conf import settings
+from django.db import connection, transaction, IntegrityError
+from django.db.models import Q, F, Case, Count, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 
+from tagger import events, suggestions
+from tagger.cache import bump_dataset_versions
+from tagger.models import Sentence, Dataset, LabeledSentence, OperatorDailyStats, Tag, CurrentLabel, HasPermission, \
+    ImportJob, SentenceBucket, SuggestionState, TagCentroid, TagSuggestion
 
-def read_sentences(dataset: Dataset, decoded_file) -> list[Sentence]:
+
+# concurrent requests labeling on the same day add to the same row, sqlite and postgres syntax
+_UPSERT_DAILY_STATS = (
+    'INSERT INTO tagger_operatordailystats (date, operator_id, dataset_id, tag_id, count) VALUES {} '
+    'ON CONFLICT (date, operator_id, dataset_id, tag_id) '
+    'DO UPDATE SET count = tagger_operatordailystats.count + excluded.count'
+)
+
+
+def decode_lines(file, encoding: str = 'utf-8') -> Iterator[str]:
     """
-    reads sentences from a csv file and returns a list of sentences.
+    decodes an uploaded file line by line while django reads it in chunks, the file is never loaded whole.
+    """
+    return codecs.iterdecode(file, encoding)
+
+
+def read_sentences(dataset: Dataset, decoded_file) -> Iterator[Sentence]:
+    """
+    reads sentences from a csv file and yields them one by one.
     """
     reader = csv.reader(decoded_file)
-    sentences = []
     for row in reader:
         if row:
             sentence_body = row[0]
-            sentences.append(Sentence(body=sentence_body, dataset=dataset))
-    return sentences
+            yield Sentence(body=sentence_body, dataset=dataset, body_hash=Sentence.hash_body(sentence_body))
+
+
+def batched(iterable: Iterable, size: int) -> Iterator[list]:
+    """
+    splits an iterable into lists of at most `size` items.
+    """
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def bulk_create_sentences(sentences: Iterable[Sentence], batch_size: int | None = None) -> int:
+    """
+    inserts sentences in fixed size batches inside one transaction and returns how many were created.
+    sentences already in their dataset are skipped, only one batch is held in memory at a time.
+    """
+    batch_size = batch_size or settings.TAGGER_BULK_BATCH_SIZE
+    created = 0
+    with transaction.atomic():
+        for batch in batched(sentences, batch_size):
+            created += _create_new_sentences(batch)
+    return created
+
+
+def _existing_sentences(keys) -> set[tuple[int, str]]:
+    return set(Sentence.objects.filter(
+        dataset_id__in={dataset_id for dataset_id, _ in keys},
+        body_hash__in={body_hash for _, body_hash in keys},
+    ).values_list('dataset_id', 'body_hash'))
+
+
+def _create_new_sentences(batch: list[Sentence]) -> int:
+    unique = {}
+    for sentence in batch:
+        unique.setdefault((sentence.dataset_id, sentence.body_hash), sentence)
+    existing = _existing_sentences(unique)
+    while True:
+        new_sentences = [sentence for key, sentence in unique.items() if key not in existing]
+        try:
+            with transaction.atomic():
+                Sentence.objects.bulk_create(new_sentences)
+            break
+        except IntegrityError:
+            # a concurrent import inserted some of the sentences after the lookup. the batch is inserted again
+            # without them rather than with ignore_conflicts, which can't tell how many rows were inserted
+            previous, existing = existing, _existing_sentences(unique)
+            if existing == previous:
+                raise
+    for dataset_id, count in Counter(sentence.dataset_id for sentence in new_sentences).items():
+        Dataset.objects.filter(pk=dataset_id).update(sentence_count=F('sentence_count') + count)
+        events.publish(events.SENTENCES_ADDED, dataset_id, count=count)
+    return len(new_sentences)
+
+
+def create_labels(labels: list[LabeledSentence]) -> list[LabeledSentence]:
+    """
+    inserts labels in batches, bypassing per row signals, and runs the same bookkeeping as a single save.
+    """
+    with transaction.atomic():
+        labels = LabeledSentence.objects.bulk_create(labels, batch_size=settings.TAGGER_BULK_BATCH_SIZE)
+        labels_created(labels)
+    return labels
+
+
+def labels_created(labels) -> None:
+    """
+    applies new history rows to the current labels and does the bookkeeping,
+    called by the post_save signal and by create_labels.
+    """
+    dataset_ids = dict(Sentence.objects.filter(pk__in={label.sentence_id for label in labels})
+                       .values_list('pk', 'dataset_id'))
+    with transaction.atomic(savepoint=False):
+        # the last action on a (sentence, tag) pair wins
+        latest = {(label.sentence_id, label.tag_id): label for label in sorted(labels, key=lambda label: label.pk)}
+        added = {pair: label for pair, label in latest.items()
+                 if label.action == LabeledSentence.Action.ADD and dataset_ids.get(pair[0]) is not None}
+        removed = {pair for pair, label in latest.items() if label.action == LabeledSentence.Action.REMOVE}
+        current = {(row.sentence_id, row.tag_id): row for row in
+                   CurrentLabel.objects.filter(sentence_id__in={sentence_id for sentence_id, _ in latest})}
+
+        CurrentLabel.objects.filter(pk__in=[current[pair].pk for pair in removed if pair in current]).delete()
+        relabeled = [current[pair] for pair in added if pair in current]
+        for row in relabeled:
+            row.label_id = added[row.sentence_id, row.tag_id].pk
+        CurrentLabel.objects.bulk_update(relabeled, ['label'], batch_size=settings.TAGGER_BULK_BATCH_SIZE)
+        # a concurrent request adding the same pair keeps its own row
+        new = [CurrentLabel(sentence_id=sentence_id, tag_id=tag_id, dataset_id=dataset_ids[sentence_id],
+                            label_id=label.pk) for (sentence_id, tag_id), label in added.items()
+               if (sentence_id, tag_id) not in current]
+        CurrentLabel.objects.bulk_create(new, batch_size=settings.TAGGER_BULK_BATCH_SIZE, ignore_conflicts=True)
+        # only rows pointing at these history rows were inserted here, the skipped ones aren't counted
+        inserted = Counter(CurrentLabel.objects.filter(label_id__in=[row.label_id for row in new])
+                           .values_list('tag_id', flat=True)) if new else Counter()
+        if inserted:
+            # one update whatever the number of tags
+            Tag.objects.filter(pk__in=inserted).update(label_count=F('label_count') + Case(
+                *(When(pk=tag_id, then=Value(count)) for tag_id, count in inserted.items()), default=Value(0)))
+
+        mark_sentences_labeled({sentence_id for sentence_id, _ in added})
+        unmark_unlabeled_sentences({sentence_id for sentence_id, _ in removed})
+        record_daily_stats([label for label in labels if label.action == LabeledSentence.Action.ADD], dataset_ids)
+    bump_dataset_versions(dataset_ids.values())
+    labeled = defaultdict(set)
+    for label in labels:
+        # sentences without a dataset have no subscribers
+        if dataset_ids[label.sentence_id] is not None:
+            labeled[dataset_ids[label.sentence_id]].add(label.sentence_id)
+    suggestions.labels_added(Counter(dataset_ids[label.sentence_id] for label in labels
+                                     if dataset_ids[label.sentence_id] is not None))
+    for dataset_id, sentence_ids in labeled.items():
+        events.publish(events.SENTENCES_LABELED, dataset_id, sentences=sorted(sentence_ids))
+
+
+def record_daily_stats(labels, dataset_ids: dict[int, int]) -> None:
+    """
+    adds labels to the operator daily stats rollup in one statement, labels of sentences without a dataset are left
+    out. `dataset_ids` maps sentence ids of the labels to their dataset.
+    """
+    counts = Counter(
+        (timezone.localdate(label.created_at), label.operator_id, dataset_ids[label.sentence_id], label.tag_id)
+        for label in labels if dataset_ids.get(label.sentence_id) is not None
+    )
+    if not counts:
+        return
+    # bulk_create(update_conflicts=True) can only overwrite the count with the new one, the upsert adds to it
+    with connection.cursor() as cursor:
+        cursor.execute(_UPSERT_DAILY_STATS.format(', '.join(['(%s, %s, %s, %s, %s)'] * len(counts))), [
+            value for (date, operator_id, dataset_id, tag_id), count in counts.items()
+            for value in (connection.ops.adapt_datefield_value(date), operator_id, dataset_id, tag_id, count)
+        ])
+
+
+def mark_sentences_labeled(sentence_ids) -> int:
+    """
+    flags given sentences as labeled, returns number of sentences that were unlabeled before.
+    """
+    sentences = Sentence.objects.filter(pk__in=sentence_ids, is_labeled=False)
+    return _update_labeled_flags(sentences, is_labeled=True, leased_by=None, lease_expires_at=None)
+
+
+def unmark_unlabeled_sentences(sentence_ids) -> int:
+    """
+    clears the labeled flag of given sentences that have no current label left.
+    """
+    sentences = Sentence.objects.filter(pk__in=sentence_ids, is_labeled=True).exclude(
+        pk__in=CurrentLabel.objects.filter(sentence_id__in=sentence_ids).values('sentence_id'))
+    return _update_labeled_flags(sentences, is_labeled=False)
+
+
+def rebuild_current_labels(pairs) -> None:
+    """
+    recomputes the current label of (sentence, tag) pairs from their history, after history rows are deleted.
+    """
+    with transaction.atomic():
+        for sentence_id, tag_id in set(pairs):
+            latest = (LabeledSentence.objects.filter(sentence_id=sentence_id, tag_id=tag_id)
+                      .select_related('sentence').order_by('-pk').first())
+            current = CurrentLabel.objects.filter(sentence_id=sentence_id, tag_id=tag_id)
+            if latest is None or latest.action == LabeledSentence.Action.REMOVE:
+                current.delete()
+            elif not current.update(label=latest):
+                CurrentLabel.objects.create(sentence_id=sentence_id, tag_id=tag_id,
+                                            dataset_id=latest.sentence.dataset_id, label=latest)
+        unmark_unlabeled_sentences({sentence_id for sentence_id, _ in pairs})
+
+
+def _update_labeled_flags(sentences, is_labeled: bool, **fields) -> int:
+    # updating per dataset keeps Dataset.labeled_count exact, the update re-checks the flag so racing
+    # writers never count the same sentence twice
+    by_dataset = defaultdict(list)
+    for pk, dataset_id in sentences.values_list('pk', 'dataset_id'):
+        by_dataset[dataset_id].append(pk)
+    changed = 0
+    for dataset_id, pks in by_dataset.items():
+        count = Sentence.objects.filter(pk__in=pks, is_labeled=not is_labeled).update(is_labeled=is_labeled, **fields)
+        if count and dataset_id is not None:
+            delta = count if is_labeled else -count
+            Dataset.objects.filter(pk=dataset_id).update(labeled_count=F('labeled_count') + delta)
+        changed += count
+    return changed
+
+
+def reconcile_counters(dataset_ids) -> None:
+    """
+    recomputes the sentence and label counters of the datasets and their tags from the tables.
+    """
+    def count(queryset, field):
+        subquery = queryset.filter(**{field: OuterRef('pk')}).order_by().values(field).annotate(n=Count('pk'))
+        return Coalesce(Subquery(subquery.values('n')), Value(0))
+
+    with transaction.atomic():
+        Dataset.objects.filter(pk__in=dataset_ids).update(
+            sentence_count=count(Sentence.objects.all(), 'dataset'),
+            labeled_count=count(Sentence.objects.filter(is_labeled=True), 'dataset'),
+        )
+        Tag.objects.filter(dataset_id__in=dataset_ids).update(label_count=count(CurrentLabel.objects.all(), 'tag'))
+
+
+def available_to(operator_id: int | None, now=None) -> Q:
+    """
+    sentences no other operator holds a running lease on.
+    """
+    now = now or timezone.now()
+    return Q(lease_expires_at__isnull=True) | Q(lease_expires_at__lte=now) | Q(leased_by_id=operator_id)
+
+
+def leased_to_other(sentence: Sentence, operator_id: int | None) -> bool:
+    return (sentence.lease_expires_at is not None and sentence.lease_expires_at > timezone.now()
+            and sentence.leased_by_id != operator_id)
+
+
+def claim_sentences(operator_id: int, dataset_ids, size: int) -> list[Sentence]:
+    """
+    leases up to `size` unlabeled sentences to the operator for TAGGER_LEASE_TTL seconds.
+    concurrent claims never hand out the same sentence twice.
+    """
+    now = timezone.now()
+    expires_at = now + timedelta(seconds=settings.TAGGER_LEASE_TTL)
+    claimable = Sentence.objects.filter(dataset__id__in=dataset_ids, is_labeled=False).filter(
+        available_to(operator_id, now))
+
+    with transaction.atomic():
+        candidates = claimable.order_by('id')
+        if connection.features.has_select_for_update_skip_locked:
+            # rows locked by another claimer are skipped instead of waited on
+            candidates = candidates.select_for_update(skip_locked=True)
+        ids = list(candidates.values_list('id', flat=True)[:size])
+        # the update re-checks the lease, so without SKIP LOCKED (sqlite) a racing claimer just gets fewer rows
+        claimable.filter(pk__in=ids).update(leased_by_id=operator_id, lease_expires_at=expires_at)
+
+    return list(Sentence.objects.filter(pk__in=ids, leased_by_id=operator_id, lease_expires_at=expires_at)
+                .order_by('id'))
+
+
+def release_sentences(operator_id: int) -> int:
+    """
+    returns every sentence leased by the operator to the pool.
+    """
+    return Sentence.objects.filter(leased_by_id=operator_id).update(leased_by=None, lease_expires_at=None)
+
+
+def release_expired_leases() -> int:
+    """
+    returns sentences with expired leases to the pool.
+    """
+    return Sentence.objects.filter(lease_expires_at__lte=timezone.now()).update(
+        leased_by=None, lease_expires_at=None)
+
+
+def _delete_rows(model, field: str, ids: list) -> int:
+    # a plain DELETE statement, QuerySet.delete() would load the rows to send delete signals and collect cascades
+    meta = model._meta
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM %s WHERE %s IN (%s)' % (
+            connection.ops.quote_name(meta.db_table), connection.ops.quote_name(meta.get_field(field).column),
+            ', '.join(['%s'] * len(ids))), ids)
+        return cursor.rowcount
+
+
+def delete_in_batches(queryset, batch_size: int, dependents=()) -> Iterator[int]:
+    """
+    deletes the rows of the queryset in id order, `batch_size` rows per transaction, after the rows referencing
+    them. `dependents` are (model, foreign key) pairs of the referencing rows.
+    deletes are raw, rows are never loaded and no delete signals run. yields the number of rows deleted per batch.
+    """
+    targets = (*dependents, (queryset.model, queryset.model._meta.pk.name))
+    last_id = 0
+    while True:
+        ids = list(queryset.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return
+        with transaction.atomic():
+            deleted = sum(_delete_rows(model, field, ids) for model, field in targets)
+        last_id = ids[-1]
+        yield deleted
+
+
+def purge_dataset_rows(dataset_id: int, batch_size: int | None = None) -> Iterator[int]:
+    """
+    deletes every row of the dataset except the dataset itself in short transactions, yields rows deleted per batch.
+    counters and caches aren't maintained, the dataset is already hidden.
+    """
+    batch_size = batch_size or settings.TAGGER_BULK_BATCH_SIZE
+    for job in ImportJob.objects.filter(dataset_id=dataset_id).exclude(file=''):
+        job.file.delete(save=False)
+    yield from delete_in_batches(Sentence.objects.filter(dataset_id=dataset_id), batch_size, (
+        (SentenceBucket, 'sentence'), (TagSuggestion, 'sentence'), (CurrentLabel, 'sentence'),
+        (LabeledSentence, 'sentence'),
+    ))
+    # labels of the dataset's tags on sentences of other datasets, if any
+    yield from delete_in_batches(Tag.objects.filter(dataset_id=dataset_id), batch_size, tuple(
+        (model, 'tag') for model in (TagSuggestion, TagCentroid, CurrentLabel, LabeledSentence, OperatorDailyStats)
+    ))
+    for model in (OperatorDailyStats, HasPermission, ImportJob, SuggestionState):
+        yield from delete_in_batches(model.objects.filter(dataset_id=dataset_id), batch_size)
@@ -1,21 +1,94 @@
-from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from rest_framework.permissions import IsAuthenticated, IsAdminUser, SAFE_METHODS
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet
 from rest_framework import status
 from rest_framework import generics
-
-from django.contrib.postgres.search import SearchVector
-
-from .models import Dataset, Operator, HasPermission, Tag, LabeledSentence, Sentence
+from rest_framework.utils.urls import replace_query_param
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q
+from django.http import HttpResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+
+from .models import Dataset, HasPermission, Tag, LabeledSentence, Sentence, ImportJob, ApiKey, Operator, PurgeJob
 from .serializers import LabeledSentenceSerializer, TagSerializer, DatasetSerializer, \
-    HasPermissionSerializer, SentenceSerializer, SentenceCSVSerializer
-from .utils import read_sentences
+    HasPermissionSerializer, SentenceSerializer, SentenceCSVSerializer, ClaimSentencesSerializer, \
+    BulkLabelSerializer, ImportJobSerializer, ApiKeySerializer, PurgeJobSerializer, LabelingOptionsSerializer, \
+    RowEncoder
+from .agreement import dataset_agreement
+from .cache import cached_response, bump_version, bump_dataset_versions
+from .clusters import cluster_labels
+from .export import EXPORT_FORMATS, export_dataset
+from .metrics import registry
+from .pagination import SentencePagination, LabeledSentencePagination, ClusterPagination
+from .permissions import HasDatasetPermission, operator_permissions, PERMISSIONS_VERSION
+from .renderers import ORJSONRenderer
+from .routers import reading_from, replica_for, route_reads, read_alias
+from .search import search_sentences
+from .suggestions import attach_suggestions
+from .tasks import import_sentences, purge_dataset
+from .utils import available_to, claim_sentences, leased_to_other, release_sentences, create_labels
 
 
 # Create your views here.
 
 
+class FastSerializationMixin:
+    """
+    serves lists through RowEncoder and ORJSONRenderer when `fast_serialization` is on, output stays the same.
+    """
+    # True or False switches it for this view only, None follows TAGGER_FAST_SERIALIZATION read on every request
+    fast_serialization = None
+
+    def use_fast_serialization(self) -> bool:
+        if self.fast_serialization is None:
+            return settings.TAGGER_FAST_SERIALIZATION
+        return self.fast_serialization
+
+    def get_renderers(self):
+        renderers = super().get_renderers()
+        if self.use_fast_serialization():
+            renderers = [ORJSONRenderer() if type(renderer) is JSONRenderer else renderer for renderer in renderers]
+        return renderers
+
+    def serialize_list(self, queryset, serializer_class):
+        if self.use_fast_serialization():
+            encoder = RowEncoder.for_serializer(serializer_class)
+            return encoder.encode(encoder.values_list(queryset))
+        return serializer_class(queryset, many=True).data
+
+    def paginate_list(self, queryset, serializer_class, paginator):
+        """
+        returns the data of a paginated response for one page of the queryset.
+        """
+        if self.use_fast_serialization():
+            encoder = RowEncoder.for_serializer(serializer_class)
+            page = paginator.paginate_queryset(encoder.values(queryset), self.request, view=self)
+            data = encoder.encode_dicts(page)
+        else:
+            page = paginator.paginate_queryset(queryset, self.request, view=self)
+            data = serializer_class(page, many=True).data
+        return paginator.get_paginated_response(data).data
+
+
+class ReplicaReadMixin:
+    """
+    safe requests read from the replica once authenticated and permitted, see tagger.routers.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        with reading_from(None):
+            return super().dispatch(request, *args, **kwargs)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method in SAFE_METHODS:
+            route_reads(replica_for(request.user))
+
+
 class DatasetViewSet(ModelViewSet):
     """
     dataset viewset for super user to manage dataset instances.
@@ -24,47 +97,58 @@ class DatasetViewSet(ModelViewSet):
     permission_classes = (IsAdminUser,)
     queryset = Dataset.objects.all()
 
-
-class SentenceCategoryAPIView(APIView):
+    def destroy(self, request, *args, **kwargs):
+        """
+        hides the dataset right away and deletes its sentences, labels and tags in the background.
+        poll the returned purge job for progress.
+        """
+        dataset = self.get_object()
+        with transaction.atomic():
+            dataset.deleted_at = timezone.now()
+            dataset.save(update_fields=['deleted_at'])
+            job = PurgeJob.objects.create(dataset=dataset, dataset_name=dataset.name)
+            # operators lose their permission on it, cached listings go stale
+            bump_version(PERMISSIONS_VERSION)
+            bump_dataset_versions([dataset.pk])
+            transaction.on_commit(lambda: purge_dataset.delay(job.pk))
+        return Response(PurgeJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+
+class SentenceCategoryAPIView(ReplicaReadMixin, FastSerializationMixin, APIView):
     serializer_class = LabeledSentenceSerializer
-    permission_classes = (IsAuthenticated,)
+    permission_classes = (IsAuthenticated, HasDatasetPermission)
 
     def get(self, request, dataset_id, tag_id):
         """
-            lists every labeled sentence inside a specific dataset with given tag.
+            lists the labels of sentences currently tagged with given tag inside a specific dataset, page by page.
+            responses are cached and carry an ETag until a label or tag of the dataset changes.
         """
-        user = request.user
-        operator = Operator.objects.get(user=user)
-        try:
-            is_allowed = HasPermission.objects.get(operator=operator, dataset__pk=dataset_id)
-        except HasPermission.DoesNotExist as _:
-            return Response({"detail": "you don't have permission"}, status=status.HTTP_400_BAD_REQUEST)
-        if is_allowed:
-            labelled_sentences = LabeledSentence.objects.filter(sentence__dataset=dataset_id, tag__pk=tag_id)
-            serializer = self.serializer_class(labelled_sentences, many=True)
-
-            return Response(serializer.data, status=status.HTTP_200_OK)
+        def build():
+            labelled_sentences = LabeledSentence.objects.filter(current__dataset=dataset_id, current__tag=tag_id)
+            return self.paginate_list(labelled_sentences, self.serializer_class, LabeledSentencePagination())
 
-        return Response(status=status.HTTP_403_FORBIDDEN)
+        return cached_response(request, dataset_id, f'category:{dataset_id}:{tag_id}', build)
 
 
-class TagAPIView(APIView):
+class TagAPIView(ReplicaReadMixin, APIView):
     serializer_class = TagSerializer
     permission_classes = (IsAdminUser,)
 
+    def get_permissions(self):
+        permissions = super().get_permissions()
+        if self.request.method == 'GET':
+            permissions.append(HasDatasetPermission())
+        return permissions
+
     def get(self, request, dataset_id):
         """
         list all tags in a dataset if you have permission.
         """
-        user = request.user
-        operator = Operator.objects.get(user=user)
-        try:
-            is_allowed = HasPermission.objects.get(operator=operator, dataset__pk=dataset_id)
-        except HasPermission.DoesNotExist as _:
-            return Response({"detail": "you don't have permission"}, status=status.HTTP_400_BAD_REQUEST)
-        tags = Tag.objects.filter(dataset__pk=dataset_id, is_active=True)
-        serializer = self.serializer_class(tags, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        def build():
+            tags = Tag.objects.filter(dataset__pk=dataset_id, is_active=True)
+            return self.serializer_class(tags, many=True).data
+
+        return cached_response(request, dataset_id, f'tags:{dataset_id}', build)
 
     def post(self, request, dataset_id):
         """
@@ -107,74 +191,271 @@ class PermissionUpdateDeleteView(generics.RetrieveUpdateDestroyAPIView):
     queryset = HasPermission.objects.all()
 
 
-class SearchLabeledSentenceAPIView(APIView):
-    permission_classes = (IsAuthenticated,)
+class SearchLabeledSentenceAPIView(ReplicaReadMixin, APIView):
+    permission_classes = (IsAuthenticated, HasDatasetPermission)
     serializer_class = LabeledSentenceSerializer
+    page_size = 50
+    max_page_size = 500
+
+    @staticmethod
+    def get_int_param(request, name, default, maximum=None):
+        value = request.query_params.get(name, '')
+        value = int(value) if value.isdigit() else default
+        return min(value, maximum) if maximum is not None else value
 
     def get(self, request, dataset_id, word, *args, **kwargs):
         """
-        give it the word you want to search in labeled text body, dataset and tag
+        give it the word you want to search in labeled text body of the dataset.
+        only the sentence body is searched, dataset name, description and tag names no longer match.
+        best matches come first, `page_size` sets how many sentences a page holds.
         """
-        user = request.user
-        word = word
-
-        operator = Operator.objects.get(user=user)
-        try:
-            is_allowed = HasPermission.objects.get(operator=operator, dataset__pk=dataset_id)
-        except HasPermission.DoesNotExist as _:
-            return Response({"detail": "you don't have permission"}, status=status.HTTP_400_BAD_REQUEST)
         if word is not None and word != '':
-            items = LabeledSentence.objects.annotate(
-                search=SearchVector('sentence__body', 'sentence__dataset__name', 'sentence__dataset__description',
-                                    'tag__name')).filter(search=word)
+            page_size = self.get_int_param(request, 'page_size', self.page_size, self.max_page_size)
+            offset = self.get_int_param(request, 'offset', 0)
+            sentence_ids = search_sentences(dataset_id, word, page_size + 1, offset)
+            has_next = len(sentence_ids) > page_size
+            sentence_ids = sentence_ids[:page_size]
+
+            rank = {sentence_id: position for position, sentence_id in enumerate(sentence_ids)}
+            items = sorted(LabeledSentence.objects.filter(sentence_id__in=sentence_ids),
+                           key=lambda item: (rank[item.sentence_id], item.pk))
             serializer = self.serializer_class(items, many=True)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            next_url = None
+            if has_next:
+                next_url = replace_query_param(request.build_absolute_uri(), 'offset', offset + page_size)
+            return Response({'next': next_url, 'results': serializer.data}, status=status.HTTP_200_OK)
         else:
             return Response(status=status.HTTP_400_BAD_REQUEST)
 
 
-class LabelingSentenceAPIView(APIView):
+class LabelingSentenceAPIView(FastSerializationMixin, APIView):
     serializer_class = LabeledSentenceSerializer
     permission_classes = (IsAuthenticated,)
 
     def post(self, request, *args, **kwargs):
         """
-        you can label sentences with available tags for that dataset
+        you can label sentences with available tags for that dataset,
+        send `"action": "remove"` to take a tag off a sentence again.
+        with `"cluster": true` the label also goes to the near duplicates of the sentence that it changes,
+        the response then lists every label `created`.
         """
 
         serializer = self.serializer_class(data=request.data)
         serializer.is_valid(raise_exception=True)
+        options = LabelingOptionsSerializer(data=request.data)
+        options.is_valid(raise_exception=True)
         t = serializer.validated_data['tag']  # Tag
         s = serializer.validated_data['sentence']  # sentence
-        same_dataset = t.dataset.pk == s.dataset.pk
+        same_dataset = t.dataset_id == s.dataset_id
 
         if same_dataset:
-            try:
-                _ = HasPermission.objects.get(operator=Operator.objects.get(user=request.user),
-                                              dataset__pk=s.dataset.pk)
-                serializer.save()
-                return Response(serializer.data, status.HTTP_201_CREATED)
-            except HasPermission.DoesNotExist as e:
+            operator_id, dataset_ids = operator_permissions(request)
+            if s.dataset_id not in dataset_ids:
                 return Response({"detail": "you don't have permission"}, status=status.HTTP_400_BAD_REQUEST)
+            if leased_to_other(s, operator_id):
+                return Response({"detail": "sentence is leased to another operator"}, status=status.HTTP_409_CONFLICT)
+            if options.validated_data['cluster']:
+                labels = create_labels(cluster_labels(LabeledSentence(**serializer.validated_data)))
+                return Response({'created': len(labels), 'results': self.serializer_class(labels, many=True).data},
+                                status.HTTP_201_CREATED)
+            serializer.save()
+            return Response(serializer.data, status.HTTP_201_CREATED)
         else:
             return Response({'detail': " you can't give that tag to this sentence, it is not defined!"},
                             status=status.HTTP_400_BAD_REQUEST)
 
     def get(self, request, *args, **kwargs):
         """
-        list of not labeled sentence that user has permission to access for labeling.
+        next page of not labeled sentences that user has permission to access for labeling, each with the
+        `suggestions` of the tag suggestion engine, best first. sentences leased to other operators are left out.
+        follow the `next` link to continue, `page_size` sets the batch size and `dataset` narrows it to one dataset.
         """
-        authorized_datasets = HasPermission.objects.filter(operator=Operator.objects.get(user=request.user))
-        dataset_ids = list(authorized_datasets.values_list('dataset__pk', flat=True))
-        labeled_sentences = LabeledSentence.objects.all()
-        sentences = Sentence.objects.filter(dataset__id__in=dataset_ids).exclude(
-            id__in=labeled_sentences.values_list('sentence__id', flat=True))
+        operator_id, dataset_ids = operator_permissions(request)
+        sentences = Sentence.objects.filter(available_to(operator_id), dataset__id__in=dataset_ids, is_labeled=False)
+        dataset_id = request.query_params.get('dataset')
+        if dataset_id is not None:
+            if not dataset_id.isdigit():
+                return Response({"detail": "dataset must be an id"}, status=status.HTTP_400_BAD_REQUEST)
+            sentences = sentences.filter(dataset__id=dataset_id)
 
-        serializer = SentenceSerializer(sentences, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        data = self.paginate_list(sentences, SentenceSerializer, SentencePagination())
+        attach_suggestions(data['results'])
+        return Response(data, status=status.HTTP_200_OK)
 
 
-class ListCreateSentencesAPIView(APIView):
+class BulkLabelingAPIView(APIView):
+    serializer_class = BulkLabelSerializer
+    permission_classes = (IsAuthenticated,)
+
+    def post(self, request, *args, **kwargs):
+        """
+        labels many sentences at once, send `labels` as a list of {"sentence": id, "tag": id}.
+        add `"action": "remove"` to an item to take the tag off the sentence instead.
+        every item is accepted or rejected on its own, the response reports the outcome per item.
+        responds 201 when labels were created and 400 when every item was rejected.
+        """
+        serializer = self.serializer_class(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        items = serializer.validated_data['labels']
+        operator_id, dataset_ids = operator_permissions(request)
+        if not dataset_ids:
+            return Response({"detail": "you don't have permission"}, status=status.HTTP_400_BAD_REQUEST)
+
+        sentences = Sentence.objects.only('id', 'dataset_id', 'leased_by_id', 'lease_expires_at').in_bulk(
+            {item['sentence'] for item in items})
+        tags = Tag.objects.only('id', 'dataset_id').in_bulk({item['tag'] for item in items})
+
+        labels = []
+        results = []
+        for index, item in enumerate(items):
+            sentence = sentences.get(item['sentence'])
+            tag = tags.get(item['tag'])
+            if sentence is None:
+                detail = "sentence does not exist"
+            elif tag is None:
+                detail = "tag does not exist"
+            elif tag.dataset_id != sentence.dataset_id:
+                detail = "you can't give that tag to this sentence, it is not defined!"
+            elif sentence.dataset_id not in dataset_ids:
+                detail = "you don't have permission"
+            elif leased_to_other(sentence, operator_id):
+                detail = "sentence is leased to another operator"
+            else:
+                detail = None
+                labels.append(LabeledSentence(sentence_id=sentence.pk, tag_id=tag.pk, operator_id=operator_id,
+                                              action=item['action']))
+            results.append({'index': index, 'accepted': detail is None, 'detail': detail})
+
+        if not labels:
+            return Response({'created': 0, 'results': results}, status=status.HTTP_400_BAD_REQUEST)
+        create_labels(labels)
+        return Response({'created': len(labels), 'results': results}, status=status.HTTP_201_CREATED)
+
+
+class ClaimSentencesAPIView(APIView):
+    serializer_class = ClaimSentencesSerializer
+    permission_classes = (IsAuthenticated,)
+
+    def post(self, request, *args, **kwargs):
+        """
+        leases a batch of not labeled sentences to you, no other operator gets them until the lease expires.
+        """
+        serializer = self.serializer_class(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        operator_id, dataset_ids = operator_permissions(request)
+        dataset_id = serializer.validated_data.get('dataset')
+        if dataset_id is not None:
+            dataset_ids = dataset_ids & {dataset_id}
+        if not dataset_ids:
+            return Response({"detail": "you don't have permission"}, status=status.HTTP_400_BAD_REQUEST)
+
+        sentences = claim_sentences(operator_id, dataset_ids, serializer.validated_data['size'])
+        return Response(SentenceSerializer(sentences, many=True).data, status=status.HTTP_200_OK)
+
+    def delete(self, request, *args, **kwargs):
+        """
+        gives back every sentence you have claimed.
+        """
+        operator_id, _ = operator_permissions(request)
+        if operator_id is not None:
+            release_sentences(operator_id)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class SentenceClusterListAPIView(ReplicaReadMixin, APIView):
+    permission_classes = (IsAuthenticated, HasDatasetPermission)
+
+    def get(self, request, dataset_id, *args, **kwargs):
+        """
+        near-duplicate clusters of the dataset with their number of sentences and of unlabeled ones, page by page.
+        `unlabeled=1` leaves out clusters that are fully labeled.
+        """
+        clusters = (Sentence.objects.filter(dataset_id=dataset_id, cluster__isnull=False).values('cluster')
+                    .annotate(sentences=Count('pk'), unlabeled=Count('pk', filter=Q(is_labeled=False)))
+                    .filter(sentences__gte=2))
+        if request.query_params.get('unlabeled') == '1':
+            clusters = clusters.filter(unlabeled__gt=0)
+        paginator = ClusterPagination()
+        page = paginator.paginate_queryset(clusters, request, view=self)
+        return paginator.get_paginated_response(page)
+
+
+class SentenceClusterAPIView(ReplicaReadMixin, FastSerializationMixin, APIView):
+    serializer_class = SentenceSerializer
+    permission_classes = (IsAuthenticated, HasDatasetPermission)
+
+    def get(self, request, dataset_id, cluster, *args, **kwargs):
+        """
+        sentences of a near-duplicate cluster of the dataset, page by page.
+        """
+        sentences = Sentence.objects.filter(dataset_id=dataset_id, cluster=cluster)
+        data = self.paginate_list(sentences, self.serializer_class, SentencePagination())
+        return Response(data, status=status.HTTP_200_OK)
+
+
+class DatasetStatsAPIView(ReplicaReadMixin, APIView):
+    permission_classes = (IsAuthenticated, HasDatasetPermission)
+
+    def get(self, request, dataset_id, *args, **kwargs):
+        """
+        labeling progress of the dataset: sentence totals and number of labels per tag.
+        """
+        rows = list(Dataset.objects.filter(pk=dataset_id).order_by('tag__pk').values(
+            'sentence_count', 'labeled_count', 'tag__pk', 'tag__name', 'tag__label_count'))
+        if not rows:
+            return Response({"detail": "dataset does not exist"}, status=status.HTTP_404_NOT_FOUND)
+
+        data = {
+            'sentences': rows[0]['sentence_count'],
+            'labeled': rows[0]['labeled_count'],
+            'unlabeled': rows[0]['sentence_count'] - rows[0]['labeled_count'],
+            'tags': [{'id': row['tag__pk'], 'name': row['tag__name'], 'labels': row['tag__label_count']}
+                     for row in rows if row['tag__pk'] is not None],
+        }
+        return Response(data, status=status.HTTP_200_OK)
+
+
+class DatasetAgreementAPIView(ReplicaReadMixin, APIView):
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request, dataset_id, *args, **kwargs):
+        """
+        inter-annotator agreement of the dataset: fleiss' kappa overall and per tag, a confusion matrix per tag and
+        cohen's kappa per operator pair, see tagger.agreement. cached until a label of the dataset changes.
+        """
+        if not Dataset.objects.filter(pk=dataset_id).exists():
+            return Response({"detail": "dataset does not exist"}, status=status.HTTP_404_NOT_FOUND)
+        return cached_response(request, dataset_id, f'agreement:{dataset_id}', lambda: dataset_agreement(dataset_id))
+
+
+class DatasetExportAPIView(ReplicaReadMixin, APIView):
+    permission_classes = (IsAuthenticated, HasDatasetPermission)
+
+    def get(self, request, dataset_id, *args, **kwargs):
+        """
+        streams every sentence of the dataset with its tags.
+        `output` is ndjson (default) or csv, `compress=gzip` compresses it and `after` resumes after a sentence id.
+        """
+        output = request.query_params.get('output', 'ndjson')
+        if output not in EXPORT_FORMATS:
+            return Response({"detail": f"output must be one of {', '.join(EXPORT_FORMATS)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        after = request.query_params.get('after', '0')
+        if not after.isdigit():
+            return Response({"detail": "after must be a sentence id"}, status=status.HTTP_400_BAD_REQUEST)
+        compress = request.query_params.get('compress') == 'gzip'
+
+        filename = f'dataset_{dataset_id}.{output}' + ('.gz' if compress else '')
+        response = StreamingHttpResponse(
+            # streamed after the view returns, outside of its read routing
+            export_dataset(dataset_id, output, compress, int(after), using=read_alias()),
+            content_type='application/gzip' if compress else EXPORT_FORMATS[output],
+        )
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+
+class ListCreateSentencesAPIView(ReplicaReadMixin, FastSerializationMixin, APIView):
     serializer_class = SentenceSerializer
     permission_classes = (IsAdminUser,)
 
@@ -182,9 +463,8 @@ class ListCreateSentencesAPIView(APIView):
         """
         list of sentences in given dataset
         """
-        sentences = Sentence.objects.filter(dataset__id=dataset_id)
-        serializer = self.serializer_class(sentences, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        sentences = Sentence.objects.filter(dataset__id=dataset_id, dataset__deleted_at__isnull=True)
+        return Response(self.serialize_list(sentences, self.serializer_class), status=status.HTTP_200_OK)
 
     def post(self, request, dataset_id, *args, **kwargs):
         """
@@ -206,15 +486,81 @@ class SentenceCSVAPIView(APIView):
     def post(self, request, dataset_id, *args, **kwargs):
         """
         api for creating sentences with uploading a csv file of sentences.
+        the file is imported in the background, poll the returned job for progress.
         only admin has access to it.
         """
         serializer = self.serializer_class(data=request.data)
         if serializer.is_valid():
-            file = serializer.validated_data['file']
-            dataset = Dataset.objects.get(pk=dataset_id)
-            decoded_file = file.read().decode('utf-8').splitlines()
-            sentences = read_sentences(dataset, decoded_file)
-
-            Sentence.objects.bulk_create(sentences)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+            dataset = get_object_or_404(Dataset, pk=dataset_id)
+            job = ImportJob.objects.create(dataset=dataset, file=serializer.validated_data['file'])
+            transaction.on_commit(lambda: import_sentences.delay(job.pk))
+            return Response(ImportJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class ImportJobAPIView(generics.RetrieveAPIView):
+    """
+    progress of a csv import job.
+    """
+    serializer_class = ImportJobSerializer
+    permission_classes = (IsAdminUser,)
+    queryset = ImportJob.objects.all()
+
+
+class PurgeJobAPIView(generics.RetrieveAPIView):
+    """
+    progress of the background deletion of a dataset.
+    """
+    serializer_class = PurgeJobSerializer
+    permission_classes = (IsAdminUser,)
+    queryset = PurgeJob.objects.all()
+
+
+class MetricsAPIView(APIView):
+    """
+    request and query metrics of this process in the prometheus text format.
+    """
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class ApiKeyAPIView(APIView):
+    serializer_class = ApiKeySerializer
+    permission_classes = (IsAuthenticated,)
+
+    def get(self, request):
+        """
+        api keys of your operator, the keys themselves are only shown once when created.
+        """
+        keys = ApiKey.objects.filter(operator__user=request.user).order_by('id')
+        return Response(self.serializer_class(keys, many=True).data, status=status.HTTP_200_OK)
+
+    def post(self, request):
+        """
+        creates an api key, send it as `Authorization: Bearer <key>` instead of your password.
+        """
+        serializer = self.serializer_class(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        operator = Operator.objects.filter(user=request.user).order_by('pk').first()
+        if operator is None:
+            return Response({"detail": "you are not an operator"}, status=status.HTTP_400_BAD_REQUEST)
+        api_key, key = ApiKey.generate(operator, serializer.validated_data['name'])
+        return Response({**self.serializer_class(api_key).data, 'key': key}, status=status.HTTP_201_CREATED)
+
+
+class ApiKeyRevokeAPIView(APIView):
+    permission_classes = (IsAuthenticated,)
+
+    def delete(self, request, pk):
+        """
+        revokes an api key of yours, admins can revoke any key. it stops working right away.
+        """
+        keys = ApiKey.objects.filter(pk=pk, revoked_at__isnull=True)
+        if not request.user.is_staff:
+            keys = keys.filter(operator__user=request.user)
+        api_key = get_object_or_404(keys)
+        api_key.revoked_at = timezone.now()
+        api_key.save(update_fields=['revoked_at'])
+        return Response(status=status.HTTP_204_NO_CONTENT)